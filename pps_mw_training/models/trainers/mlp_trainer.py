@@ -1,22 +1,26 @@
 from dataclasses import dataclass
 from pathlib import Path
-from typing import cast, Any, List, Dict, Union
+from typing import cast, Any, List, Dict, Optional, Union
 import json
 
+import numpy as np  # type: ignore
 import tensorflow as tf  # type: ignore
 from keras.callbacks import ModelCheckpoint  # type: ignore
 from xarray import Dataset  # type: ignore
 
 from pps_mw_training.models.mlp_model import MlpModel
 from pps_mw_training.models.predictors.mlp_predictor import MlpPredictor
+from pps_mw_training.models.trainers.resident_engine import ResidentEngine
+from pps_mw_training.models.trainers.utils import TrainingEngine
 
-from pps_mw_training.utils.augmentation import set_missing_data
+from pps_mw_training.utils.augmentation import add_noise_and_missing_data
 from pps_mw_training.utils.loss_function import quantile_loss
 from pps_mw_training.utils.scaler import (
     get_scaler,
     MinMaxScaler,
     StandardScaler,
 )
+from pps_mw_training.utils.streaming import ChunkStream
 
 
 @dataclass
@@ -43,8 +47,8 @@ class MlpTrainer(MlpPredictor):
         n_neurons_per_layer: int,
         activation: str,
         quantiles: List[float],
-        training_data: Dataset,
-        validation_data: Dataset,
+        training_data: Union[Dataset, List[Dataset]],
+        validation_data: Union[Dataset, List[Dataset]],
         batch_size: int,
         epochs: int,
         initial_learning_rate: float,
@@ -55,58 +59,92 @@ class MlpTrainer(MlpPredictor):
         missing_fraction: float,
         fill_value: float,
         output_path: Path,
+        chunk_size: int = 0,
+        shuffle_buffer: int = 0,
+        noise: Optional[Dict[str, float]] = None,
+        engine: TrainingEngine = TrainingEngine.FIT,
+        steps_per_call: int = 1,
     ) -> None:
-        """Run the training pipeline for the model."""
-        model = MlpModel(
-            len(input_parameters),
-            len(output_parameters) * len(quantiles),
+        """
+        Run the training pipeline for the model, the data is streamed
+        in chunks of chunk_size samples if chunk_size is above 0, and
+        noise of the given sigma of each input parameter is added.
+        The resident engine runs steps_per_call steps per call.
+        """
+        model = cls.compile_model(
+            input_parameters,
+            output_parameters,
             n_hidden_layers,
             n_neurons_per_layer,
             activation,
-        )
-        learning_rate = tf.keras.optimizers.schedules.CosineDecayRestarts(
-            initial_learning_rate=initial_learning_rate,
-            first_decay_steps=first_decay_steps,
-            t_mul=t_mul,
-            m_mul=m_mul,
-            alpha=alpha,
-        )
-        model.compile(
-            optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
-            loss=lambda y_true, y_pred: quantile_loss(
-                len(output_parameters), quantiles, y_true, y_pred
-            ),
+            quantiles,
+            initial_learning_rate,
+            first_decay_steps,
+            t_mul,
+            m_mul,
+            alpha,
         )
         output_path.mkdir(parents=True, exist_ok=True)
         weights_file = output_path / "iwp_ici.weights.h5"
-        history = model.fit(
-            cls.prepare_data(
-                input_parameters,
-                output_parameters,
-                training_data,
-                batch_size,
-                missing_fraction,
-                fill_value,
-            ),
-            epochs=epochs,
-            validation_data=cls.prepare_data(
-                input_parameters,
-                output_parameters,
-                validation_data,
+        if engine is TrainingEngine.RESIDENT:
+            if chunk_size > 0:
+                raise ValueError(
+                    "Streamed data can not be kept resident, "
+                    "set the chunk size to 0."
+                )
+            x, y = cls.get_resident_data(
+                input_parameters, output_parameters, training_data
+            )
+            validation_x, validation_y = cls.get_resident_data(
+                input_parameters, output_parameters, validation_data
+            )
+            history = ResidentEngine(
+                model,
+                x,
+                y,
                 batch_size,
+                steps_per_call,
+                cls.get_noise_sigma(input_parameters, noise),
                 missing_fraction,
                 fill_value,
-            ),
-            callbacks=[
-                ModelCheckpoint(
-                    weights_file,
-                    save_best_only=True,
-                    save_weights_only=True,
-                )
-            ],
-        )
+                validation_x,
+                validation_y,
+            ).fit(epochs, weights_file)
+        else:
+            history = model.fit(
+                cls.prepare_data(
+                    input_parameters,
+                    output_parameters,
+                    training_data,
+                    batch_size,
+                    missing_fraction,
+                    fill_value,
+                    chunk_size,
+                    shuffle_buffer,
+                    noise,
+                ),
+                epochs=epochs,
+                validation_data=cls.prepare_data(
+                    input_parameters,
+                    output_parameters,
+                    validation_data,
+                    batch_size,
+                    missing_fraction,
+                    fill_value,
+                    chunk_size,
+                    noise=noise,
+                    shuffle=False,
+                ),
+                callbacks=[
+                    ModelCheckpoint(
+                        weights_file,
+                        save_best_only=True,
+                        save_weights_only=True,
+                    )
+                ],
+            ).history
         with open(output_path / "fit_history.json", "w") as outfile:
-            outfile.write(json.dumps(history.history, indent=4))
+            outfile.write(json.dumps(history, indent=4))
         with open(output_path / "network_config.json", "w") as outfile:
             outfile.write(
                 json.dumps(
@@ -124,33 +162,142 @@ class MlpTrainer(MlpPredictor):
                 )
             )
 
+    @classmethod
+    def compile_model(
+        cls,
+        input_parameters: List[Dict[str, Any]],
+        output_parameters: List[Dict[str, Any]],
+        n_hidden_layers: int,
+        n_neurons_per_layer: int,
+        activation: str,
+        quantiles: List[float],
+        initial_learning_rate: float,
+        first_decay_steps: int,
+        t_mul: float,
+        m_mul: float,
+        alpha: float,
+    ) -> MlpModel:
+        """Get model compiled with optimizer and quantile loss."""
+        model = MlpModel(
+            len(input_parameters),
+            len(output_parameters) * len(quantiles),
+            n_hidden_layers,
+            n_neurons_per_layer,
+            activation,
+        )
+        learning_rate = tf.keras.optimizers.schedules.CosineDecayRestarts(
+            initial_learning_rate=initial_learning_rate,
+            first_decay_steps=first_decay_steps,
+            t_mul=t_mul,
+            m_mul=m_mul,
+            alpha=alpha,
+        )
+        model.compile(
+            optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+            loss=lambda y_true, y_pred: quantile_loss(
+                len(output_parameters), quantiles, y_true, y_pred
+            ),
+        )
+        return model
+
+    @staticmethod
+    def get_noise_sigma(
+        input_parameters: List[Dict[str, Any]],
+        noise: Optional[Dict[str, float]],
+    ) -> np.ndarray:
+        """Get sigma of noise of each scaled input parameter."""
+        return get_scaler(input_parameters).scale_sigma(
+            np.array(
+                [
+                    (noise or {}).get(cast(str, p["name"]), 0.0)
+                    for p in input_parameters
+                ]
+            )
+        ).astype(np.float32)
+
+    @classmethod
+    def get_resident_data(
+        cls,
+        input_parameters: List[Dict[str, Any]],
+        output_parameters: List[Dict[str, Any]],
+        data: Union[Dataset, List[Dataset]],
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Get scaled input and output data, to be held in memory."""
+        if isinstance(data, list):
+            raise ValueError(
+                "Several datasets can only be streamed, "
+                "set a chunk size above 0."
+            )
+        return (
+            cls.prescale(
+                data,
+                get_scaler(input_parameters),
+                [cast(str, p["name"]) for p in input_parameters],
+            ).astype(np.float32),
+            cls.prescale(
+                data,
+                get_scaler(output_parameters),
+                [cast(str, p["name"]) for p in output_parameters],
+            ).astype(np.float32),
+        )
+
     @classmethod
     def prepare_data(
         cls,
         input_parameters: list[dict[str, Any]],
         output_parameters: List[Dict[str, Any]],
-        training_data: Dataset,
+        training_data: Union[Dataset, List[Dataset]],
         batch_size: int,
         missing_fraction: float,
         fill_value: float,
+        chunk_size: int = 0,
+        shuffle_buffer: int = 0,
+        noise: Optional[Dict[str, float]] = None,
+        shuffle: bool = True,
     ) -> tf.data.Dataset:
-        """Prepare data for training."""
+        """
+        Prepare data for training, the data is streamed in chunks of
+        chunk_size samples if chunk_size is above 0 and else held in
+        memory. Noise of the given sigma of each input parameter, and
+        missing data, is drawn for each batch.
+        """
         input_scaler = get_scaler(input_parameters)
         output_scaler = get_scaler(output_parameters)
         input_params = [cast(str, p["name"]) for p in input_parameters]
         output_params = [cast(str, p["name"]) for p in output_parameters]
-        return (
-            tf.data.Dataset.from_tensor_slices(
+        sigma = cls.get_noise_sigma(input_parameters, noise)
+        if chunk_size > 0:
+            dataset = ChunkStream(
                 (
-                    cls.prescale(training_data, input_scaler, input_params),
-                    cls.prescale(training_data, output_scaler, output_params),
+                    training_data if isinstance(training_data, list)
+                    else [training_data]
+                ),
+                input_params,
+                output_params,
+                input_scaler,
+                output_scaler,
+                batch_size,
+                chunk_size,
+                shuffle_buffer,
+                shuffle,
+            ).get_dataset()
+        else:
+            dataset = tf.data.Dataset.from_tensor_slices(
+                cls.get_resident_data(
+                    input_parameters, output_parameters, training_data
                 )
             )
-            .batch(batch_size=batch_size)
-            .map(
-                lambda x, y: (
-                    set_missing_data(x, missing_fraction, fill_value),
-                    y,
+            if shuffle and shuffle_buffer > 0:
+                dataset = dataset.shuffle(
+                    shuffle_buffer, reshuffle_each_iteration=True
                 )
-            )
-        )
+            dataset = dataset.batch(batch_size=batch_size)
+        return dataset.map(
+            lambda x, y: (
+                add_noise_and_missing_data(
+                    x, sigma, missing_fraction, fill_value
+                ),
+                y,
+            ),
+            num_parallel_calls=tf.data.AUTOTUNE,
+        ).prefetch(tf.data.AUTOTUNE)
@@ -0,0 +1,159 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+import logging
+
+import numpy as np  # type: ignore
+import tensorflow as tf  # type: ignore
+from keras import Model  # type: ignore
+
+from pps_mw_training.utils.augmentation import add_noise_and_missing_data
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# compared by identity, as compiled methods are bound to hashable objects
+@dataclass(eq=False)
+class ResidentEngine:
+    """
+    Engine training a compiled model on scaled data kept resident as
+    tensors. Each epoch the samples are shuffled in the graph, and a
+    compiled function runs steps_per_call training steps per call, of
+    batches gathered by the shuffled indices with noise and missing data
+    drawn per batch. Samples not filling a batch are left out of an
+    epoch, but are different samples each epoch.
+    """
+
+    model: Model
+    x: np.ndarray
+    y: np.ndarray
+    batch_size: int
+    steps_per_call: int
+    sigma: np.ndarray
+    missing_fraction: float
+    fill_value: float
+    validation_x: Optional[np.ndarray] = None
+    validation_y: Optional[np.ndarray] = None
+    _data: dict[str, tf.Tensor] = field(
+        default_factory=dict, init=False, repr=False
+    )
+
+    def __post_init__(self) -> None:
+        self._data = {
+            "x": tf.constant(self.x, dtype=tf.float32),
+            "y": tf.constant(self.y, dtype=tf.float32),
+            "sigma": tf.constant(self.sigma, dtype=tf.float32),
+        }
+        if self.validation_x is not None and self.validation_y is not None:
+            self._data["validation_x"] = tf.constant(
+                self.validation_x, dtype=tf.float32
+            )
+            self._data["validation_y"] = tf.constant(
+                self.validation_y, dtype=tf.float32
+            )
+        self._order = tf.Variable(
+            tf.range(self.x.shape[0], dtype=tf.int32), trainable=False
+        )
+        self.model.optimizer.build(self.model.trainable_variables)
+
+    @property
+    def n_steps(self) -> int:
+        """Get number of training steps of an epoch."""
+        return self.x.shape[0] // self.batch_size
+
+    def _augment(
+        self,
+        x: tf.Tensor,
+    ) -> tf.Tensor:
+        return add_noise_and_missing_data(
+            x, self._data["sigma"], self.missing_fraction, self.fill_value
+        )
+
+    @tf.function
+    def _shuffle(self) -> None:
+        self._order.assign(tf.random.shuffle(self._order))
+
+    @tf.function
+    def _train_steps(
+        self,
+        first_step: tf.Tensor,
+        n_steps: tf.Tensor,
+    ) -> tf.Tensor:
+        """Run n_steps training steps, and get the sum of the losses."""
+        total = tf.constant(0.0)
+        variables = self.model.trainable_variables
+        for step in tf.range(first_step, first_step + n_steps):
+            indices = self._order[
+                step * self.batch_size: (step + 1) * self.batch_size
+            ]
+            x = self._augment(tf.gather(self._data["x"], indices))
+            y = tf.gather(self._data["y"], indices)
+            with tf.GradientTape() as tape:
+                loss = self.model.loss(y, self.model(x, training=True))
+            self.model.optimizer.apply_gradients(
+                zip(tape.gradient(loss, variables), variables)
+            )
+            total += loss
+        return total
+
+    @tf.function
+    def _evaluate(self) -> tf.Tensor:
+        """Get mean loss of the batches of the validation data."""
+        x_all = self._data["validation_x"]
+        y_all = self._data["validation_y"]
+        n_samples = tf.shape(x_all)[0]
+        n_batches = (n_samples + self.batch_size - 1) // self.batch_size
+        total = tf.constant(0.0)
+        for batch in tf.range(n_batches):
+            start = batch * self.batch_size
+            x = self._augment(x_all[start: start + self.batch_size])
+            y = y_all[start: start + self.batch_size]
+            total += self.model.loss(y, self.model(x, training=False))
+        return total / tf.cast(tf.maximum(n_batches, 1), tf.float32)
+
+    def train_epoch(self) -> float:
+        """Train an epoch, and get the mean loss of the steps."""
+        self._shuffle()
+        total = 0.0
+        for first_step in range(0, self.n_steps, self.steps_per_call):
+            n_steps = min(self.steps_per_call, self.n_steps - first_step)
+            total += float(
+                self._train_steps(
+                    tf.constant(first_step), tf.constant(n_steps)
+                )
+            )
+        return total / max(self.n_steps, 1)
+
+    def evaluate(self) -> float:
+        """Get the mean loss of the validation data."""
+        return float(self._evaluate())
+
+    def fit(
+        self,
+        epochs: int,
+        weights_file: Optional[Path] = None,
+    ) -> dict[str, list[float]]:
+        """
+        Train the given number of epochs and get the history of the loss,
+        weights of the lowest validation loss are saved if a file is given.
+        """
+        history: dict[str, list[float]] = {"loss": []}
+        if "validation_x" in self._data:
+            history["val_loss"] = []
+        for epoch in range(epochs):
+            history["loss"].append(self.train_epoch())
+            message = f"Epoch {epoch + 1}/{epochs}: loss={history['loss'][-1]}"
+            if "val_loss" in history:
+                val_loss = self.evaluate()
+                if weights_file is not None and val_loss < min(
+                    history["val_loss"], default=np.inf
+                ):
+                    self.model.save_weights(weights_file)
+                history["val_loss"].append(val_loss)
+                message += f", val_loss={val_loss}"
+            elif weights_file is not None:
+                self.model.save_weights(weights_file)
+            logging.info(message)
+        return history
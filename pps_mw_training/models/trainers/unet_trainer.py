@@ -1,7 +1,8 @@
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Union
+from typing import Any, Callable, Optional, Union
 import json
+import math
 
 
 import tensorflow as tf  # type: ignore
@@ -17,11 +18,39 @@ from pps_mw_training.utils.augmentation import (
     random_crop_and_flip,
     random_flip,
     random_crop_and_flip_swath_centered,
+    random_valid_crop_and_flip,
+    repeat_augmentation,
 )
+from pps_mw_training.utils.label_encoding import LabelEncoding
 from pps_mw_training.utils.loss_function import quantile_loss
 from pps_mw_training.utils.scaler import MinMaxScaler, StandardScaler
 
 
+def get_augmentation(
+    augmentation_type: AugmentationType,
+    image_size: int,
+) -> Optional[Callable[..., tuple[tf.Tensor, tf.Tensor]]]:
+    """
+    Get augmentation function of the given type, the valid crop takes the
+    valid offsets of the scenes as a third argument, see ValidCrop.
+    """
+    if augmentation_type is AugmentationType.FLIP:
+        return lambda x, y: random_flip(x, y)
+    if augmentation_type is AugmentationType.CROP_AND_FLIP:
+        return lambda x, y: random_crop_and_flip(
+            x, y, tf.constant(image_size)
+        )
+    if augmentation_type is AugmentationType.CROP_AND_FLIP_CENTERED:
+        return lambda x, y: random_crop_and_flip_swath_centered(
+            x, y, tf.constant(image_size)
+        )
+    if augmentation_type is AugmentationType.VALID_CROP_AND_FLIP:
+        return lambda x, y, valid: random_valid_crop_and_flip(
+            x, y, valid, tf.constant(image_size)
+        )
+    return None
+
+
 @dataclass
 class UnetTrainer(UnetPredictor):
     """
@@ -55,8 +84,26 @@ class UnetTrainer(UnetPredictor):
         decay_steps_factor: float,
         alpha: float,
         output_path: Path,
+        label_encoding: Optional[LabelEncoding] = None,
+        crops_per_scene: int = 1,
+        scene_batch_size: int = 1,
+        patch_batch_size: int = 0,
+        shuffle_buffer: int = 0,
     ) -> None:
-        """Train the model."""
+        """
+        Train the model, labels are passed through the input pipeline in
+        the given label encoding and decoded by the loss function.
+
+        If crops_per_scene > 1, each loaded scene gives crops_per_scene
+        independent crops, shuffled and batched by patch_batch_size, of
+        training data batched by scene_batch_size scenes, and
+        patch_batch_size and shuffle_buffer must be given.
+        """
+        if crops_per_scene > 1 and min(patch_batch_size, shuffle_buffer) < 1:
+            raise ValueError(
+                "Several crops per scene are shuffled and batched, "
+                "set a patch batch size and a shuffle buffer above 0."
+            )
         model_config_file = output_path / "network_config.json"
         if model_config_file.is_file():
             # load and continue the training of an existing model
@@ -74,9 +121,17 @@ class UnetTrainer(UnetPredictor):
                 super_resolution,
             )
             model.build_graph(image_size, n_inputs)
+        n_steps = len(training_data)
+        if crops_per_scene > 1:
+            # the number of patches of an epoch is not known after the
+            # unbatching, and is estimated from the scene batch size
+            n_steps = math.ceil(
+                n_steps * scene_batch_size * crops_per_scene
+                / patch_batch_size
+            )
         learning_rate = tf.keras.optimizers.schedules.CosineDecay(
             initial_learning_rate=initial_learning_rate,
-            decay_steps=int(decay_steps_factor * len(training_data) * n_epochs),
+            decay_steps=int(decay_steps_factor * n_steps * n_epochs),
             alpha=alpha,
         )
         model.compile(
@@ -86,37 +141,47 @@ class UnetTrainer(UnetPredictor):
             loss=lambda y_true, y_pred: quantile_loss(
                 1,
                 quantiles,
-                y_true,
+                (
+                    label_encoding.decode(y_true, fill_value_labels)
+                    if label_encoding is not None
+                    else y_true
+                ),
                 y_pred,
                 fill_value=fill_value_labels,
             ),
         )
         output_path.mkdir(parents=True, exist_ok=True)
         weights_file = output_path / "unet.weights.h5"
-
-        if augmentation_type is AugmentationType.FLIP:
-            training_data = training_data.map(lambda x, y: random_flip(x, y))
-            validation_data = validation_data.map(
-                lambda x, y: random_flip(x, y)
-            )
-        if augmentation_type is AugmentationType.CROP_AND_FLIP:
-            training_data = training_data.map(
-                lambda x, y: random_crop_and_flip(x, y, tf.constant(image_size))
-            )
-            validation_data = validation_data.map(
-                lambda x, y: random_crop_and_flip(x, y, tf.constant(image_size))
-            )
-        if augmentation_type is AugmentationType.CROP_AND_FLIP_CENTERED:
+        if label_encoding is not None:
+            # valid offsets of the scenes, if any, are passed on
             training_data = training_data.map(
-                lambda x, y: random_crop_and_flip_swath_centered(
-                    x, y, tf.constant(image_size)
+                lambda x, y, *valid: (
+                    x, label_encoding.encode(y, fill_value_labels), *valid
                 )
             )
             validation_data = validation_data.map(
-                lambda x, y: random_crop_and_flip_swath_centered(
-                    x, y, tf.constant(image_size)
+                lambda x, y, *valid: (
+                    x, label_encoding.encode(y, fill_value_labels), *valid
                 )
             )
+
+        augment = get_augmentation(augmentation_type, image_size)
+        if augment is not None:
+            validation_data = validation_data.map(augment)
+            if crops_per_scene > 1:
+                training_data = (
+                    training_data.map(
+                        lambda *data: repeat_augmentation(
+                            data, augment, crops_per_scene
+                        )
+                    )
+                    .unbatch()
+                    .shuffle(shuffle_buffer)
+                    .batch(patch_batch_size)
+                    .prefetch(tf.data.AUTOTUNE)
+                )
+            else:
+                training_data = training_data.map(augment)
         validation_data = validation_data.cache()
         history = model.fit(
             training_data,
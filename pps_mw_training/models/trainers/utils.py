@@ -13,6 +13,14 @@ class AugmentationType(Enum):
     FLIP = "flip"
     CROP_AND_FLIP = "crop_and_flip"
     CROP_AND_FLIP_CENTERED = "crop_and_flip_swath_centered"
+    VALID_CROP_AND_FLIP = "valid_crop_and_flip"
+
+
+class TrainingEngine(Enum):
+    """Training engine."""
+
+    FIT = "fit"
+    RESIDENT = "resident"
 
 
 class MemoryUsageCallback(Callback):
@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Optional
 import os
 
 from pps_mw_training.models.trainers.utils import AugmentationType
@@ -77,6 +78,25 @@ BATCH_SIZE = 128
 TRAIN_FRACTION = 0.8
 VALIDATION_FRACTION = 0.15
 TEST_FRACTION = 0.05
+# data loader parameters, data is loaded in the tf.data pipeline if 0 workers
+LOADER_WORKERS = 0
+LOADER_PREFETCH = 4  # number of batches in flight
+# number of crops extracted from each loaded scene, the crops are shuffled
+# and batched by the patch batch size, a single crop per scene if 1
+CROPS_PER_SCENE = 1
+PATCH_BATCH_SIZE = 128
+SHUFFLE_BUFFER = 10000  # number of crops
+# cache of loaded batches of the training data, disabled if 0 bytes, least
+# recently used batches are spilled to the spill path if set. The batches
+# are of the same scenes every epoch if enabled, see utils.batch_cache. The
+# budget and spill path can be set by environment variables
+BATCH_CACHE_BYTES = int(os.environ.get("BATCH_CACHE_BYTES_CLOUD_BASE", 0))
+BATCH_CACHE_SPILL_PATH: Optional[Path] = (
+    Path(os.environ["BATCH_CACHE_PATH_CLOUD_BASE"])
+    if "BATCH_CACHE_PATH_CLOUD_BASE" in os.environ
+    else None
+)
+BATCH_CACHE_SPILL_BYTES = 64 * 1024**3
 FILL_VALUE_IMAGES = -999.9
 FILL_VALUE_LABELS = -999.9
 IMAGE_SIZE = 16
@@ -87,6 +107,13 @@ ALPHA = 0.1
 
 # two parameters below are not intended to be tunable
 AUGMENTATION_TYPE = AugmentationType.CROP_AND_FLIP_CENTERED
+# min fraction of valid input and label data of crops sampled by
+# AugmentationType.VALID_CROP_AND_FLIP
+MIN_VALID_INPUT = 0.5
+MIN_VALID_LABEL = 0.1
+# quantized encoding of the labels in the input pipeline, a key of
+# utils.label_encoding.LABEL_ENCODINGS, e.g. "scaled_int16", or None for float32
+LABEL_ENCODING: Optional[str] = None
 SUPER_RESOLUTION = False
 
 
@@ -0,0 +1,133 @@
+from pathlib import Path
+from typing import Any, Optional
+import logging
+
+import h5py  # type: ignore
+import numpy as np  # type: ignore
+import xarray as xr  # type: ignore
+
+
+STORE_FILE = "cnn_data.h5"
+# datasets describing the scenes of each converted file
+FILES = "files"
+OFFSETS = "offsets"
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def get_converted_files(
+    store_file: Path,
+) -> list[str]:
+    """Get name of files already converted to the store."""
+    if not store_file.is_file():
+        return []
+    with h5py.File(store_file, "r") as store:
+        return [f.decode("utf-8") for f in store[FILES][:]]
+
+
+def get_offsets(
+    store_file: Path,
+) -> np.ndarray:
+    """Get offset of the first scene of each file, and the scene count."""
+    with h5py.File(store_file, "r") as store:
+        return store[OFFSETS][:]
+
+
+def get_store_variables(
+    store: h5py.File,
+) -> Optional[list[str]]:
+    """Get variables of the store, or None if no file is converted."""
+    if FILES not in store:
+        return None
+    return [str(v) for v in store if v not in (FILES, OFFSETS)]
+
+
+def append(
+    store: h5py.File,
+    data: xr.Dataset,
+    data_file: Path,
+    variables: list[str],
+) -> None:
+    """Append scenes of a file to the store, one dataset per variable."""
+    if FILES not in store:
+        store.create_dataset(
+            FILES,
+            shape=(0,),
+            maxshape=(None,),
+            dtype=h5py.string_dtype(),
+        )
+        store.create_dataset(OFFSETS, data=[0], maxshape=(None,))
+    n_scenes = data.nscene.size
+    start = store[OFFSETS][-1]
+    for variable in variables:
+        values = data[variable].values
+        if variable not in store:
+            store.create_dataset(
+                variable,
+                shape=(0,) + values.shape[1:],
+                maxshape=(None,) + values.shape[1:],
+                chunks=(1,) + values.shape[1:],
+                dtype=values.dtype,
+                compression="gzip",
+            )
+        dataset = store[variable]
+        dataset.resize(start + n_scenes, axis=0)
+        dataset[start: start + n_scenes] = values
+    store[FILES].resize(store[FILES].size + 1, axis=0)
+    store[FILES][-1] = data_file.name
+    store[OFFSETS].resize(store[OFFSETS].size + 1, axis=0)
+    store[OFFSETS][-1] = start + n_scenes
+
+
+def convert(
+    data_files: list[Path],
+    store_file: Path,
+    variables: list[str],
+) -> int:
+    """
+    Convert cnn data files to a columnar store, files already in the
+    store, or missing a variable of the store, are skipped.
+    """
+    converted = set(get_converted_files(store_file))
+    n_converted = 0
+    with h5py.File(store_file, "a") as store:
+        # the variables of the first converted file are kept for all files,
+        # so that the datasets of the variables stay row-aligned
+        store_variables = get_store_variables(store)
+        for data_file in data_files:
+            if data_file.name in converted:
+                continue
+            with xr.open_dataset(data_file) as data:
+                if store_variables is None:
+                    store_variables = [v for v in variables if v in data]
+                missing = [v for v in store_variables if v not in data]
+                if missing:
+                    logging.warning(
+                        f"Skipped {data_file}, missing {', '.join(missing)}."
+                    )
+                    continue
+                append(store, data, data_file, store_variables)
+            n_converted += 1
+            logging.info(f"Converted {data_file}.")
+    return n_converted
+
+
+def read_scenes(
+    store_file: str,
+    start: int,
+    stop: int,
+    params: list[dict[str, Any]],
+) -> xr.Dataset:
+    """Read a range of scenes of only the given parameters."""
+    with h5py.File(store_file, "r") as store:
+        return xr.Dataset(
+            {
+                p["name"]: (
+                    ("nscene", "y", "x"),
+                    store[p["name"]][start:stop],
+                )
+                for p in params
+            }
+        )
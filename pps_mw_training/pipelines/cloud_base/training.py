@@ -1,9 +1,14 @@
 from pathlib import Path
 from typing import Optional
 from pps_mw_training.models.trainers.unet_trainer import UnetTrainer
+from pps_mw_training.models.trainers.utils import AugmentationType
 from pps_mw_training.pipelines.cloud_base import evaluation
 from pps_mw_training.pipelines.cloud_base import settings
 from pps_mw_training.pipelines.cloud_base import training_data
+from pps_mw_training.utils.augmentation import ValidCrop
+from pps_mw_training.utils.label_encoding import LABEL_ENCODINGS
+from pps_mw_training.utils.loader import ProcessLoader
+from pps_mw_training.utils.batch_cache import BatchCache
 
 
 def train(
@@ -20,6 +25,29 @@ def train(
     file_limit: Optional[int],
 ):
     "Run the cloud base training pipeline."
+    batch_cache = (
+        BatchCache(
+            settings.BATCH_CACHE_BYTES,
+            settings.BATCH_CACHE_SPILL_PATH,
+            settings.BATCH_CACHE_SPILL_BYTES,
+        )
+        if settings.BATCH_CACHE_BYTES > 0
+        else None
+    )
+    # process loaders of the datasets, shut down when done
+    loaders: list[ProcessLoader] = []
+    # valid crop offsets are found once per loaded scene
+    valid_crop = (
+        ValidCrop(
+            settings.IMAGE_SIZE,
+            settings.FILL_VALUE_IMAGES,
+            settings.FILL_VALUE_LABELS,
+            settings.MIN_VALID_INPUT,
+            settings.MIN_VALID_LABEL,
+        )
+        if settings.AUGMENTATION_TYPE is AugmentationType.VALID_CROP_AND_FLIP
+        else None
+    )
     train_ds, val_ds, test_ds = training_data.get_training_dataset(
         training_data_path,
         train_fraction,
@@ -31,27 +59,51 @@ def train(
         settings.FILL_VALUE_IMAGES,
         settings.FILL_VALUE_LABELS,
         file_limit,
+        settings.LOADER_WORKERS,
+        settings.LOADER_PREFETCH,
+        batch_cache,
+        valid_crop,
+        loaders,
     )
-    if not only_evaluate:
-        UnetTrainer.train(
-            settings.INPUT_PARAMS,
-            settings.N_UNET_BASE,
-            settings.N_UNET_BLOCKS,
-            n_features,
-            n_layers,
-            settings.SUPER_RESOLUTION,
-            settings.QUANTILES,
-            train_ds,
-            val_ds,
-            n_epochs,
-            settings.FILL_VALUE_IMAGES,
-            settings.FILL_VALUE_LABELS,
-            settings.IMAGE_SIZE,
-            settings.AUGMENTATION_TYPE,
-            settings.INITIAL_LEARNING_RATE,
-            settings.DECAY_STEPS_FACTOR,
-            settings.ALPHA,
-            model_config_path,
-        )
-    model = UnetTrainer.load(model_config_path / "network_config.json")
-    evaluation.evaluate_model(model, test_ds, model_config_path)
+    try:
+        if not only_evaluate:
+            UnetTrainer.train(
+                settings.INPUT_PARAMS,
+                settings.N_UNET_BASE,
+                settings.N_UNET_BLOCKS,
+                n_features,
+                n_layers,
+                settings.SUPER_RESOLUTION,
+                settings.QUANTILES,
+                train_ds,
+                val_ds,
+                n_epochs,
+                settings.FILL_VALUE_IMAGES,
+                settings.FILL_VALUE_LABELS,
+                settings.IMAGE_SIZE,
+                settings.AUGMENTATION_TYPE,
+                settings.INITIAL_LEARNING_RATE,
+                settings.DECAY_STEPS_FACTOR,
+                settings.ALPHA,
+                model_config_path,
+                (
+                    LABEL_ENCODINGS[settings.LABEL_ENCODING]
+                    if settings.LABEL_ENCODING is not None
+                    else None
+                ),
+                settings.CROPS_PER_SCENE,
+                settings.BATCH_SIZE,
+                settings.PATCH_BATCH_SIZE,
+                settings.SHUFFLE_BUFFER,
+            )
+            if batch_cache is not None:
+                batch_cache.log_stats()
+            # workers of the training and validation data are not needed
+            # by the evaluation, which starts the workers of the test data
+            for loader in loaders:
+                loader.close()
+        model = UnetTrainer.load(model_config_path / "network_config.json")
+        evaluation.evaluate_model(model, test_ds, model_config_path)
+    finally:
+        for loader in loaders:
+            loader.close()
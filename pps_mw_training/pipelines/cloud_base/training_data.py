@@ -4,9 +4,19 @@ from typing import Optional
 import numpy as np  # type: ignore
 import tensorflow as tf  # type: ignore
 import xarray as xr  # type: ignore
+from pps_mw_training.pipelines.cloud_base import store
+from pps_mw_training.utils import catalog
+from pps_mw_training.utils.augmentation import ValidCrop
+from pps_mw_training.utils.loader import ProcessLoader
+from pps_mw_training.utils.batch_cache import BatchCache
 from pps_mw_training.utils.scaler import get_scaler
 
 
+DATA_FILES = "cnn_data*.nc"
+# kind of files in the catalog
+CNN_DATA = "cnn_data"
+
+
 def _load_data(
     data_files: np.ndarray,
     input_parameters: str,
@@ -26,6 +36,28 @@ def _load_data(
         ]
 
 
+def _load_store_data(
+    store_file: bytes,
+    start: int,
+    stop: int,
+    input_parameters: str,
+    label_parameters: str,
+    fill_value_input: float,
+    fill_value_label: float,
+) -> list[np.ndarray]:
+    """Load, scale, and filter a range of scenes from the store."""
+    all_data = store.read_scenes(
+        store_file.decode("utf-8"),
+        start,
+        stop,
+        json.loads(input_parameters) + json.loads(label_parameters),
+    )
+    return [
+        scale_data(all_data, input_parameters, fill_value_input),
+        scale_data(all_data, label_parameters, fill_value_label)
+    ]
+
+
 def scale_data(
     data: xr.Dataset, parameters: str, fill_value: float
 ) -> np.ndarray:
@@ -81,6 +113,159 @@ def load_data(
     )
 
 
+@tf.function(
+    input_signature=(
+        tf.TensorSpec(shape=(), dtype=tf.string),
+        tf.TensorSpec(shape=(), dtype=tf.int64),
+        tf.TensorSpec(shape=(), dtype=tf.int64),
+        tf.TensorSpec(shape=(), dtype=tf.string),
+        tf.TensorSpec(shape=(), dtype=tf.string),
+        tf.TensorSpec(shape=(), dtype=tf.float32),
+        tf.TensorSpec(shape=(), dtype=tf.float32),
+    )
+)
+def load_store_data(
+    store_file,
+    start,
+    stop,
+    input_params,
+    label_params,
+    fill_value_input,
+    fill_value_label,
+):
+    """Load scenes from the store."""
+    return tf.numpy_function(
+        func=_load_store_data,
+        inp=[
+            store_file,
+            start,
+            stop,
+            input_params,
+            label_params,
+            fill_value_input,
+            fill_value_label,
+        ],
+        Tout=[tf.float32, tf.float32],
+    )
+
+
+def get_output_signature(
+    input_parameters: list[dict[str, str | float]],
+    label_parameters: list[dict[str, str | float]],
+    valid_crop: Optional[ValidCrop] = None,
+) -> tuple[tf.TensorSpec, ...]:
+    """Get signature of the loaded data."""
+    signature: tuple[tf.TensorSpec, ...] = (
+        tf.TensorSpec(
+            shape=(None, None, None, len(input_parameters)),
+            dtype=tf.float32,
+        ),
+        tf.TensorSpec(
+            shape=(None, None, None, len(label_parameters)),
+            dtype=tf.float32,
+        ),
+    )
+    if valid_crop is not None:
+        signature += (tf.TensorSpec(shape=(None, None, None), dtype=tf.bool),)
+    return signature
+
+
+def _get_store_dataset(
+    store_file: Path,
+    offsets: np.ndarray,
+    batch_size: int,
+    input_parameters: list[dict[str, str | float]],
+    label_parameters: list[dict[str, str | float]],
+    fill_value_input: float,
+    fill_value_label: float,
+    workers: int = 0,
+    prefetch: int = 2,
+    batch_cache: Optional[BatchCache] = None,
+    valid_crop: Optional[ValidCrop] = None,
+    loaders: Optional[list[ProcessLoader]] = None,
+) -> tf.data.Dataset:
+    """
+    Get training dataset from the store, a batch holds the scenes of
+    batch size files as when loading the files. Loaded batches are kept
+    in the batch cache if given, and the valid crop offsets of each
+    loaded scene are added to the data if a valid crop is given.
+    """
+    starts = offsets[0:-1:batch_size]
+    stops = np.append(starts[1:], offsets[-1])[:starts.size]
+    input_params = json.dumps(input_parameters)
+    label_params = json.dumps(label_parameters)
+    output_signature = get_output_signature(
+        input_parameters, label_parameters, valid_crop
+    )
+    load = (
+        _load_store_data
+        if valid_crop is None
+        else valid_crop.wrap(_load_store_data)
+    )
+    if workers > 0:
+        loader = ProcessLoader(
+            load,
+            [
+                (
+                    store_file.as_posix().encode(),
+                    start,
+                    stop,
+                    input_params,
+                    label_params,
+                    np.float32(fill_value_input),
+                    np.float32(fill_value_label),
+                )
+                for start, stop in zip(starts, stops)
+            ],
+            output_signature,
+            workers,
+            prefetch,
+            cache=batch_cache,
+            # cached batches would otherwise be evicted before reused
+            shuffle=batch_cache is not None,
+        )
+        if loaders is not None:
+            loaders.append(loader)
+        return loader.get_dataset()
+    ds = tf.data.Dataset.from_tensor_slices(
+        (starts.astype(np.int64), stops.astype(np.int64))
+    )
+    if batch_cache is not None:
+        # cached batches would otherwise be evicted before reused
+        ds = ds.shuffle(max(len(ds), 1), reshuffle_each_iteration=True)
+        return ds.map(
+            lambda start, stop: tf.numpy_function(
+                func=batch_cache.wrap(load),
+                inp=[
+                    tf.constant(store_file.as_posix()),
+                    start,
+                    stop,
+                    tf.constant(input_params),
+                    tf.constant(label_params),
+                    tf.constant(fill_value_input),
+                    tf.constant(fill_value_label),
+                ],
+                Tout=[s.dtype for s in output_signature],
+            ),
+            num_parallel_calls=1,
+        )
+    ds = ds.map(
+        lambda start, stop: load_store_data(
+            tf.constant(store_file.as_posix()),
+            start,
+            stop,
+            tf.constant(input_params),
+            tf.constant(label_params),
+            tf.constant(fill_value_input),
+            tf.constant(fill_value_label),
+        ),
+        num_parallel_calls=1,
+    )
+    if valid_crop is not None:
+        ds = ds.map(valid_crop.add_offsets, num_parallel_calls=1)
+    return ds
+
+
 def _get_training_dataset(
     files: list[Path],
     batch_size: int,
@@ -88,13 +273,69 @@ def _get_training_dataset(
     label_parameters: list[dict[str, str | float]],
     fill_value_input: float,
     fill_value_label: float,
+    workers: int = 0,
+    prefetch: int = 2,
+    batch_cache: Optional[BatchCache] = None,
+    valid_crop: Optional[ValidCrop] = None,
+    loaders: Optional[list[ProcessLoader]] = None,
 ) -> tf.data.Dataset:
-    """Get training dataset."""
-
-    ds = tf.data.Dataset.from_tensor_slices([f.as_posix() for f in files])
-    ds = ds.batch(batch_size)
+    """
+    Get training dataset, data is loaded in a pool of worker processes
+    if workers is above 0, and loaded batches are kept in the batch cache
+    if given. The valid crop offsets of each loaded scene are added to
+    the data if a valid crop is given.
+    """
     input_params = json.dumps(input_parameters)
     label_params = json.dumps(label_parameters)
+    output_signature = get_output_signature(
+        input_parameters, label_parameters, valid_crop
+    )
+    load = _load_data if valid_crop is None else valid_crop.wrap(_load_data)
+    if workers > 0:
+        loader = ProcessLoader(
+            load,
+            [
+                (
+                    np.array([f.as_posix().encode() for f in batch]),
+                    input_params,
+                    label_params,
+                    np.float32(fill_value_input),
+                    np.float32(fill_value_label),
+                )
+                for batch in [
+                    files[idx: idx + batch_size]
+                    for idx in range(0, len(files), batch_size)
+                ]
+            ],
+            output_signature,
+            workers,
+            prefetch,
+            cache=batch_cache,
+            # cached batches would otherwise be evicted before reused
+            shuffle=batch_cache is not None,
+        )
+        if loaders is not None:
+            loaders.append(loader)
+        return loader.get_dataset()
+    ds = tf.data.Dataset.from_tensor_slices([f.as_posix() for f in files])
+    ds = ds.batch(batch_size)
+    if batch_cache is not None:
+        # cached batches would otherwise be evicted before reused
+        ds = ds.shuffle(max(len(ds), 1), reshuffle_each_iteration=True)
+        return ds.map(
+            lambda x: tf.numpy_function(
+                func=batch_cache.wrap(load),
+                inp=[
+                    x,
+                    tf.constant(input_params),
+                    tf.constant(label_params),
+                    tf.constant(fill_value_input),
+                    tf.constant(fill_value_label),
+                ],
+                Tout=[s.dtype for s in output_signature],
+            ),
+            num_parallel_calls=1,
+        )
     ds = ds.map(
         lambda x: load_data(
             x,
@@ -105,6 +346,8 @@ def _get_training_dataset(
         ),
         num_parallel_calls=1,
     )
+    if valid_crop is not None:
+        ds = ds.map(valid_crop.add_offsets, num_parallel_calls=1)
     return ds
 
 
@@ -119,18 +362,77 @@ def get_training_dataset(
     fill_value_input: float,
     fill_value_label: float,
     file_limit: Optional[int] = None,
+    workers: int = 0,
+    prefetch: int = 2,
+    batch_cache: Optional[BatchCache] = None,
+    valid_crop: Optional[ValidCrop] = None,
+    loaders: Optional[list[ProcessLoader]] = None,
 ) -> list[tf.data.Dataset]:
-    """Get training dataset."""
+    """
+    Get training dataset, batches of the training dataset are kept in the
+    batch cache if given. The valid crop offsets are added to the training
+    and validation dataset if a valid crop is given. Process loaders of
+    the datasets are added to loaders if given, to be closed by the caller.
+    """
 
     assert train_fraction + validation_fraction + test_fraction == 1
-    input_files = list((training_data_path).glob("cnn_data*.nc"))
-    if file_limit:
-        input_files = input_files[:file_limit]
-
-    s = len(input_files)
-    train_size = int(s * train_fraction)
-    validation_size = int(s * validation_fraction)
-
+    store_file = training_data_path / store.STORE_FILE
+    if store_file.is_file():
+        # only the selected variables are read from the store
+        offsets = store.get_offsets(store_file)
+        if file_limit:
+            offsets = offsets[:file_limit + 1]
+        s = offsets.size - 1
+        train_size = int(s * train_fraction)
+        validation_size = int(s * validation_fraction)
+        return [
+            _get_store_dataset(
+                store_file,
+                o,
+                batch_size,
+                input_parameters,
+                label_parameters,
+                fill_value_input,
+                fill_value_label,
+                workers,
+                prefetch,
+                batch_cache if idx == 0 else None,
+                valid_crop if idx < 2 else None,
+                loaders,
+            )
+            for idx, o in enumerate(
+                [
+                    offsets[0: train_size + 1],
+                    offsets[train_size: train_size + validation_size + 1],
+                    offsets[train_size + validation_size:],
+                ]
+            )
+        ]
+    catalog_file = training_data_path / catalog.CATALOG_FILE
+    if catalog_file.is_file():
+        # the split is set when the files are added to the catalog
+        files = catalog.get_files(catalog_file, CNN_DATA)
+        limited = {f for f, _ in files[:file_limit or None]}
+        splits = [
+            [
+                f
+                for f, _ in catalog.get_files(catalog_file, CNN_DATA, split)
+                if f in limited
+            ]
+            for split in catalog.SPLITS
+        ]
+    else:
+        input_files = sorted(training_data_path.glob(DATA_FILES))
+        if file_limit:
+            input_files = input_files[:file_limit]
+        s = len(input_files)
+        train_size = int(s * train_fraction)
+        validation_size = int(s * validation_fraction)
+        splits = [
+            input_files[0:train_size],
+            input_files[train_size: train_size + validation_size],
+            input_files[train_size + validation_size:],
+        ]
     return [
         _get_training_dataset(
             f,
@@ -139,10 +441,53 @@ def get_training_dataset(
             label_parameters,
             fill_value_input,
             fill_value_label,
+            workers,
+            prefetch,
+            batch_cache if idx == 0 else None,
+            valid_crop if idx < 2 else None,
+            loaders,
         )
-        for f in [
-            input_files[0:train_size],
-            input_files[train_size: train_size + validation_size],
-            input_files[train_size + validation_size:],
-        ]
+        for idx, f in enumerate(splits)
     ]
+
+
+def update_catalog(
+    training_data_path: Path,
+    train_fraction: float,
+    validation_fraction: float,
+    test_fraction: float,
+    label_parameters: list[dict[str, str | float]],
+    fill_value_label: float,
+    valid_fraction: bool = False,
+) -> None:
+    """
+    Update catalog of the training data path, new files are split by
+    the given fractions and valid fractions of the labels are optionally
+    computed.
+    """
+    catalog_file = training_data_path / catalog.CATALOG_FILE
+    catalog.update(
+        catalog_file,
+        CNN_DATA,
+        sorted(training_data_path.glob(DATA_FILES)),
+        # the time of a scene is not given by the file name
+        lambda f: None,
+        (
+            (
+                lambda f: catalog.get_valid_fraction(
+                    f,
+                    [str(p["name"]) for p in label_parameters],
+                    fill_value_label,
+                )
+            )
+            if valid_fraction
+            else None
+        ),
+    )
+    catalog.assign_splits(
+        catalog_file,
+        CNN_DATA,
+        train_fraction,
+        validation_fraction,
+        test_fraction,
+    )
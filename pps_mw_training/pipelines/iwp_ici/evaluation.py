@@ -20,7 +20,10 @@ def evaluate_model(
     for param in model.input_params:
         if dataset[param].dtype == np.float32:
             filt = np.random.rand(dataset[param].size) < missing_fraction
-            dataset[param].values[filt] = np.nan
+            # the values may be read-only, if memory-mapped
+            values = dataset[param].values.copy()
+            values[filt] = np.nan
+            dataset[param].values = values
     predicted = model.predict(dataset)
     evaluate_quantile_performance(dataset, predicted, output_path)
     evaluate_distribution_performance(dataset, predicted, output_path)
@@ -25,6 +25,14 @@ TEST_FRACTION = 0.15
 NOISE = 1.0
 FILL_VALUE = -2.
 MISSING_FRACTION = 0.1
+# the databases are streamed in chunks of this many samples if above 0,
+# the training samples are shuffled through a buffer of this many samples
+CHUNK_SIZE = 0
+SHUFFLE_BUFFER = 2 ** 20
+# "fit" or "resident", the resident engine keeps the training data as
+# tensors and runs STEPS_PER_CALL training steps per compiled call
+TRAINING_ENGINE = "fit"
+STEPS_PER_CALL = 64
 # learning rate parameters
 INITIAL_LEARNING_RATE = 0.0001
 FIRST_DECAY_STEPS = 1000
@@ -0,0 +1,110 @@
+from pathlib import Path
+from typing import Callable, Optional
+import json
+import logging
+
+import numpy as np  # type: ignore
+import xarray as xr  # type: ignore
+
+
+STORE_SUFFIX = ".columns"
+MANIFEST_FILE = "manifest.json"
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def get_store_path(
+    db_file: Path,
+) -> Path:
+    """Get path of the column store of the retrieval database."""
+    return db_file.with_suffix(STORE_SUFFIX)
+
+
+def is_converted(
+    db_file: Path,
+    store_path: Path,
+) -> bool:
+    """
+    Check if the database is converted to the store, the store is assumed
+    to be up to date if the database file is missing.
+    """
+    manifest_file = store_path / MANIFEST_FILE
+    if not manifest_file.is_file():
+        return False
+    if not db_file.is_file():
+        return True
+    with open(manifest_file) as infile:
+        manifest = json.load(infile)
+    stat = db_file.stat()
+    return (manifest["size"], manifest["mtime"]) == (
+        stat.st_size, stat.st_mtime
+    )
+
+
+def convert(
+    db_file: Path,
+    store_path: Path,
+    dimension: str,
+    adjust: Optional[dict[str, Callable[[np.ndarray], np.ndarray]]] = None,
+) -> None:
+    """
+    Convert the database to a column store, one .npy file per variable
+    with the sample dimension first. Floating point variables are stored
+    as float32, and the given variables are adjusted before stored.
+    """
+    adjust = adjust or {}
+    store_path.mkdir(parents=True, exist_ok=True)
+    (store_path / MANIFEST_FILE).unlink(missing_ok=True)
+    variables = {}
+    with xr.open_dataset(db_file) as data:
+        for variable in data.data_vars:
+            if dimension not in data[variable].dims:
+                continue
+            data_array = data[variable].transpose(dimension, ...)
+            values = data_array.values
+            if variable in adjust:
+                values = adjust[str(variable)](values)
+            if np.issubdtype(values.dtype, np.floating):
+                values = values.astype(np.float32, copy=False)
+            np.save(store_path / f"{variable}.npy", values)
+            variables[str(variable)] = [str(d) for d in data_array.dims]
+            logging.info(f"Converted {variable} of {db_file}.")
+    stat = db_file.stat()
+    # the manifest is written last and marks the store as complete
+    tmp_file = store_path / f"{MANIFEST_FILE}.tmp"
+    with open(tmp_file, "w") as outfile:
+        outfile.write(
+            json.dumps(
+                {
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime,
+                    "variables": variables,
+                },
+                indent=4,
+            )
+        )
+    tmp_file.replace(store_path / MANIFEST_FILE)
+
+
+def load(
+    store_path: Path,
+    variables: Optional[list[str]] = None,
+) -> xr.Dataset:
+    """
+    Open variables of the store as read-only memory-mapped arrays, only
+    the pages read are loaded and the pages are shared by all processes
+    opening the store.
+    """
+    with open(store_path / MANIFEST_FILE) as infile:
+        dims = json.load(infile)["variables"]
+    return xr.Dataset(
+        {
+            variable: (
+                dims[variable],
+                np.load(store_path / f"{variable}.npy", mmap_mode="r"),
+            )
+            for variable in (variables or list(dims))
+        }
+    )
@@ -1,6 +1,10 @@
 from pathlib import Path
+from typing import Union
+
+from xarray import Dataset  # type: ignore
 
 from pps_mw_training.models.trainers.mlp_trainer import MlpTrainer
+from pps_mw_training.models.trainers.utils import TrainingEngine
 from pps_mw_training.pipelines.iwp_ici import evaluation
 from pps_mw_training.pipelines.iwp_ici import settings
 from pps_mw_training.pipelines.iwp_ici import training_data
@@ -10,7 +14,7 @@ def train(
     n_hidden_layers: int,
     n_neurons_per_hidden_layer: int,
     activation: str,
-    ici_db_file: Path,
+    ici_db_files: list[Path],
     train_fraction: float,
     validation_fraction: float,
     test_fraction: float,
@@ -19,16 +23,43 @@ def train(
     missing_fraction: float,
     model_config_path: Path,
     only_evaluate: bool,
+    chunk_size: int = 0,
+    shuffle_buffer: int = 0,
+    engine: TrainingEngine = TrainingEngine.FIT,
 ) -> None:
-    """Run the IWP ICI training pipeline"""
-    train_data, test_data, val_data = training_data.get_training_data(
-        ici_db_file,
-        train_fraction,
-        validation_fraction,
-        test_fraction,
-        settings.INPUT_PARAMS,
-        settings.NOISE,
-    )
+    """
+    Run the IWP ICI training pipeline, the databases are streamed in
+    chunks of chunk_size samples if chunk_size is above 0.
+    """
+    train_data: Union[Dataset, list[Dataset]]
+    val_data: Union[Dataset, list[Dataset]]
+    if chunk_size > 0:
+        train_data, val_data, test_data = (
+            training_data.get_streaming_training_data(
+                ici_db_files,
+                train_fraction,
+                validation_fraction,
+                test_fraction,
+                settings.INPUT_PARAMS,
+                settings.OUTPUT_PARAMS,
+                settings.NOISE,
+            )
+        )
+    elif len(ici_db_files) == 1:
+        train_data, val_data, test_data = training_data.get_training_data(
+            ici_db_files[0],
+            train_fraction,
+            validation_fraction,
+            test_fraction,
+            settings.INPUT_PARAMS,
+            settings.NOISE,
+            settings.OUTPUT_PARAMS,
+        )
+    else:
+        raise ValueError(
+            "Several databases can only be streamed, "
+            "set a chunk size above 0."
+        )
     if not only_evaluate:
         MlpTrainer.train(
             settings.INPUT_PARAMS,
@@ -49,6 +80,16 @@ def train(
             missing_fraction,
             settings.FILL_VALUE,
             model_config_path,
+            chunk_size,
+            shuffle_buffer,
+            {
+                param: settings.NOISE
+                for param in training_data.get_noise_params(
+                    settings.INPUT_PARAMS
+                )
+            },
+            engine,
+            settings.STEPS_PER_CALL,
         )
     model = MlpTrainer.load(model_config_path / "network_config.json")
     evaluation.evaluate_model(
@@ -1,9 +1,12 @@
 from pathlib import Path
-from typing import cast, Dict, List, Tuple, Union
+from typing import cast, Dict, List, Optional, Tuple, Union
+import logging
 
 import numpy as np  # type: ignore
 import xarray as xr  # type: ignore
 
+from pps_mw_training.pipelines.iwp_ici import store
+
 
 DB_SURFACE_TYPES = {
     0: 1,
@@ -14,27 +17,67 @@ DB_SURFACE_TYPES = {
 }
 
 
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
 def load_retrieval_database(
     db_file: Path,
     every_other: bool = False,
     dimension: str = "number_structures_db",
+    variables: Optional[List[str]] = None,
 ) -> xr.Dataset:
-    """Load the retrieval database."""
-    db = xr.load_dataset(db_file)
+    """
+    Load the retrieval database, or only the given variables of it.
+    The memory-mapped column store of the database is used if converted.
+    """
+    store_path = store.get_store_path(db_file)
+    if store.is_converted(db_file, store_path):
+        db = store.load(store_path, variables)
+    else:
+        logging.info(
+            f"No column store of {db_file}, loading the full database."
+        )
+        db = xr.load_dataset(db_file)
+        if variables is not None:
+            db = db[variables]
+        db["SurfType"].values = adjust_surface_type(
+            db["SurfType"].values
+        )
     if every_other:
-        db = db.sel({dimension: db[dimension].values[0::2]})
-    db["SurfType"].values = adjust_surface_type(
-        db["SurfType"].values
-    )
+        db = db.isel({dimension: slice(0, None, 2)})
     return db
 
 
+def convert_retrieval_database(
+    db_file: Path,
+    dimension: str = "number_structures_db",
+) -> Path:
+    """Convert the retrieval database to a memory-mapped column store."""
+    store_path = store.get_store_path(db_file)
+    store.convert(
+        db_file,
+        store_path,
+        dimension,
+        adjust={"SurfType": adjust_surface_type},
+    )
+    return store_path
+
+
 def adjust_surface_type(surface_type: np.ndarray) -> np.ndarray:
-    """Adjust surface type."""
-    adjusted = np.zeros_like(surface_type)
+    """Adjust surface type, by a lookup table of the surface types."""
+    # unknown surface types are mapped to 0 by the last entry of the table
+    table = np.zeros(max(DB_SURFACE_TYPES) + 2, dtype=surface_type.dtype)
     for old_value, new_value in DB_SURFACE_TYPES.items():
-        adjusted[surface_type == old_value] = new_value
-    return adjusted
+        table[old_value] = new_value
+    index = np.full(surface_type.shape, table.size - 1, dtype=np.intp)
+    known = (
+        (surface_type >= 0)
+        & (surface_type < table.size - 1)
+        & (surface_type % 1 == 0)
+    )
+    index[known] = surface_type[known]
+    return table[index]
 
 
 def add_noise(
@@ -42,12 +85,31 @@ def add_noise(
     params: List[str],
     sigma: float,
 ) -> xr.Dataset:
-    """Add normal distributed noise to given params."""
+    """
+    Add normal distributed noise to given params, the noisy values
+    replace the values of the dataset as these may be read-only.
+    """
+    rng = np.random.default_rng()
     for param in params:
-        dataset[param].values += sigma * np.random.randn(dataset[param].size)
+        values = dataset[param].values
+        noise = rng.standard_normal(values.shape, dtype=np.float32)
+        dataset[param] = (
+            dataset[param].dims,
+            values + (sigma * noise).astype(values.dtype, copy=False),
+        )
     return dataset
 
 
+def get_noise_params(
+    input_params: List[Dict[str, Union[str, float]]],
+) -> List[str]:
+    """Get name of the input params to add noise to."""
+    return [
+        cast(str, p["name"]) for p in input_params
+        if cast(str, p["name"]).startswith("DTB")
+    ]
+
+
 def split_dataset(
     dataset: xr.Dataset,
     train_fraction: float,
@@ -56,19 +118,13 @@ def split_dataset(
     dimension: str = "number_structures_db",
 ) -> Tuple[xr.Dataset, xr.Dataset, xr.Dataset]:
     """Split dataset into three parts."""
-    n_samples = dataset[dimension].size
+    n_samples = dataset.sizes[dimension]
     fractions = [train_fraction, validation_fraction, test_fraction]
     limits = np.cumsum([int(f * n_samples) for f in fractions])
     return (
-        dataset.sel(
-            {dimension: dataset[dimension].values[0: limits[0]]}
-        ),
-        dataset.sel(
-            {dimension: dataset[dimension].values[limits[0]: limits[1]]}
-        ),
-        dataset.sel(
-            {dimension: dataset[dimension].values[limits[1]: limits[2]]}
-        ),
+        dataset.isel({dimension: slice(0, limits[0])}),
+        dataset.isel({dimension: slice(limits[0], limits[1])}),
+        dataset.isel({dimension: slice(limits[1], limits[2])}),
     )
 
 
@@ -79,18 +135,79 @@ def get_training_data(
     test_fraction: float,
     input_params: List[Dict[str, Union[str, float]]],
     noise: float,
+    output_params: Optional[List[Dict[str, Union[str, float]]]] = None,
 ) -> Tuple[xr.Dataset, xr.Dataset, xr.Dataset]:
-    """Get training data."""
-    full_dataset = load_retrieval_database(ici_db_file)
+    """
+    Get training data, only the input and output params are loaded if
+    output params are given. Noise is added to the test data only, as
+    it is drawn per batch of the training and validation data.
+    """
     params = [cast(str, p["name"]) for p in input_params]
-    full_dataset = add_noise(
-        full_dataset,
-        params=[p for p in params if p.startswith("DTB")],
-        sigma=noise,
+    full_dataset = load_retrieval_database(
+        ici_db_file,
+        variables=(
+            params + [cast(str, p["name"]) for p in output_params]
+            if output_params is not None
+            else None
+        ),
     )
-    return split_dataset(
+    train_data, validation_data, test_data = split_dataset(
         full_dataset,
         train_fraction,
         validation_fraction,
         test_fraction,
     )
+    return (
+        train_data,
+        validation_data,
+        add_noise(
+            test_data,
+            params=get_noise_params(input_params),
+            sigma=noise,
+        ),
+    )
+
+
+def get_streaming_training_data(
+    ici_db_files: List[Path],
+    train_fraction: float,
+    validation_fraction: float,
+    test_fraction: float,
+    input_params: List[Dict[str, Union[str, float]]],
+    output_params: List[Dict[str, Union[str, float]]],
+    noise: float,
+    dimension: str = "number_structures_db",
+) -> Tuple[List[xr.Dataset], List[xr.Dataset], xr.Dataset]:
+    """
+    Get training and validation data of each database, memory-mapped
+    to be streamed, and the test data of all databases with noise added.
+    Databases not converted to a column store are converted first.
+    """
+    variables = [cast(str, p["name"]) for p in input_params + output_params]
+    train_data, validation_data, test_data = [], [], []
+    for ici_db_file in ici_db_files:
+        if not store.is_converted(
+            ici_db_file, store.get_store_path(ici_db_file)
+        ):
+            convert_retrieval_database(ici_db_file, dimension)
+        train, validation, test = split_dataset(
+            load_retrieval_database(
+                ici_db_file, dimension=dimension, variables=variables
+            ),
+            train_fraction,
+            validation_fraction,
+            test_fraction,
+            dimension,
+        )
+        train_data.append(train)
+        validation_data.append(validation)
+        test_data.append(test)
+    return (
+        train_data,
+        validation_data,
+        add_noise(
+            xr.concat(test_data, dimension),
+            params=get_noise_params(input_params),
+            sigma=noise,
+        ),
+    )
@@ -1,8 +1,9 @@
 from dataclasses import dataclass
 from functools import cached_property
 from pathlib import Path
-from typing import Dict, Union
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
 
+import numpy as np  # type: ignore
 import xarray as xr  # type: ignore
 
 from pps_mw_training.pipelines.pr_nordic.data.data_model import (
@@ -10,6 +11,15 @@ from pps_mw_training.pipelines.pr_nordic.data.data_model import (
 )
 
 
+# name of the geolocation variables in the level1b file
+GEOLOCATION_VARIABLES = {
+    "sun_zenith": "sol_zen",
+    "sun_azimuth": "sol_azi",
+    "sat_zenith": "sat_zen",
+    "sat_azimuth": "sat_azi",
+}
+
+
 @dataclass
 class AtmsL1bReader:
     """Class for reading atms l1b file.
@@ -17,9 +27,14 @@ class AtmsL1bReader:
     This class handles the reading of ATMS data available for
     both JPSS1 (NOAA-20) and Suomi-NPP at:
     https://sounder.gesdisc.eosdis.nasa.gov/data/
+
+    Only the given channels and geolocation variables are read, and
+    data are read lazily on access.
     """
 
     l1b_file: Path
+    channels: Sequence[ChannelAtms] = tuple(ChannelAtms)
+    variables: Sequence[str] = tuple(GEOLOCATION_VARIABLES)
 
     @cached_property
     def _data(self) -> xr.Dataset:
@@ -31,27 +46,42 @@ class AtmsL1bReader:
         platform = Platform.from_string(self._data.attrs["platform"])
         return self._data.attrs | {"platform": platform.name, "sensor": "ATMS"}
 
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self._data.lat.shape
+
+    def get_ta(self) -> np.ndarray:
+        """Get antenna temperature of the selected channels."""
+        idxs, inverse = np.unique(
+            [channel.value for channel in self.channels],
+            return_inverse=True,
+        )
+        return self._data.antenna_temp[:, :, idxs].values[:, :, inverse]
+
+    def get_arrays(self) -> Dict[str, np.ndarray]:
+        """Get time, geolocation and selected geolocation variables."""
+        return {
+            "time": self._data.obs_time_tai93[:, 0].values,
+            "lat": self._data.lat.values,
+            "lon": self._data.lon.values,
+        } | {
+            variable: self._data[GEOLOCATION_VARIABLES[variable]].values
+            for variable in self.variables
+        }
+
     def get_ta_dataset(self) -> xr.Dataset:
         """Get antenna temperature dataset."""
+        ta = self.get_ta()
         return xr.Dataset(
             data_vars={
-                channel: (
-                    ("y", "x"),
-                    self._data.antenna_temp.values[:, :, channel.value],
-                )
-                for channel in ChannelAtms
+                channel: (("y", "x"), ta[:, :, idx])
+                for idx, channel in enumerate(self.channels)
             }
         )
 
-    def get_geolocation_dataset(self) -> xr.Dataset:
-        """Get geolocation dataset."""
+    def get_metadata_dataset(self) -> xr.Dataset:
+        """Get dataset of only scanline time and geolocation."""
         return xr.Dataset(
-            data_vars={
-                "sun_zenith": (("y", "x"), self._data.sol_zen.values),
-                "sun_azimuth": (("y", "x"), self._data.sol_azi.values),
-                "sat_zenith": (("y", "x"), self._data.sat_zen.values),
-                "sat_azimuth": (("y", "x"), self._data.sat_azi.values),
-            },
             coords={
                 "time": ("y", self._data.obs_time_tai93.values[:, 0]),
                 "lat": (("y", "x"), self._data.lat.values),
@@ -60,16 +90,65 @@ class AtmsL1bReader:
             attrs=self.attrs,
         )
 
+    def get_geolocation_dataset(self) -> xr.Dataset:
+        """Get geolocation dataset."""
+        return self._get_dataset(self.get_arrays())
+
     def _get_data(self) -> xr.Dataset:
         """Get level1b dataset."""
-        return xr.merge(
-            [self.get_geolocation_dataset(), self.get_ta_dataset()]
+        return self._get_dataset(self.get_arrays(), self.get_ta())
+
+    def _get_dataset(
+        self,
+        arrays: Dict[str, np.ndarray],
+        ta: Optional[np.ndarray] = None,
+    ) -> xr.Dataset:
+        """Get level1b dataset from arrays."""
+        data_vars: Dict[Union[str, ChannelAtms], Any] = {
+            variable: (("y", "x"), arrays[variable])
+            for variable in self.variables
+        }
+        if ta is not None:
+            data_vars |= {
+                channel: (("y", "x"), ta[:, :, idx])
+                for idx, channel in enumerate(self.channels)
+            }
+        return xr.Dataset(
+            data_vars=data_vars,
+            coords={
+                "time": ("y", arrays["time"]),
+                "lat": (("y", "x"), arrays["lat"]),
+                "lon": (("y", "x"), arrays["lon"]),
+            },
+            attrs=self.attrs,
         )
 
     @classmethod
     def get_data(
         cls,
         l1b_files: list[Path],
+        channels: Sequence[ChannelAtms] = tuple(ChannelAtms),
+        variables: Sequence[str] = tuple(GEOLOCATION_VARIABLES),
     ) -> xr.Dataset:
-        """Get ATMS level1b data from a list of level1b files."""
-        return xr.concat([cls(f)._get_data() for f in l1b_files], dim="y")
+        """
+        Get ATMS level1b data from a list of level1b files, the data of
+        all files are assembled in preallocated buffers.
+        """
+        readers = [cls(f, channels, variables) for f in l1b_files]
+        offsets = np.cumsum([0] + [reader.shape[0] for reader in readers])
+        arrays = readers[0].get_arrays()
+        ta = readers[0].get_ta()
+        buffers = {
+            key: np.empty((offsets[-1],) + array.shape[1:], array.dtype)
+            for key, array in arrays.items()
+        }
+        ta_buffer = np.empty((offsets[-1],) + ta.shape[1:], ta.dtype)
+        for idx, reader in enumerate(readers):
+            if idx > 0:
+                arrays = reader.get_arrays()
+                ta = reader.get_ta()
+            rows = slice(offsets[idx], offsets[idx + 1])
+            for key, array in arrays.items():
+                buffers[key][rows] = array
+            ta_buffer[rows] = ta
+        return readers[0]._get_dataset(buffers, ta_buffer)
@@ -1,27 +1,189 @@
-from dataclasses import dataclass
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from functools import cached_property
+from enum import Enum
+from functools import cached_property, lru_cache, partial
 from pathlib import Path
-from typing import Tuple
+from typing import Any, Iterable, Optional, Tuple
+import hashlib
+import json
+import logging
 
-from pyproj import CRS, Transformer  # type: ignore
+from pyproj import CRS  # type: ignore
 import h5py  # type: ignore
 import numpy as np  # type: ignore
 import xarray as xr  # type: ignore
 
 
-from pps_mw_training.pipelines.pr_nordic.data.regridder import WGS84
+from pps_mw_training.pipelines.pr_nordic.data.regridder import (
+    get_transformer,
+    WGS84,
+)
 
 
 BALTRAD_FILE = "comp_pcappi_blt2km_pn150_{datestr}_0x40000000001.h5"
+REFORMAT_FILE = "radar_%Y%m%d_%H_%M.nc"
+MANIFEST_FILE = "manifest.json"
+MANIFEST_UPDATE_INTERVAL = 100
+GRID_FILE = "grid_{fingerprint}.nc"
+DBZ_PATH = "dataset1/data3"
+QUALITY_INDEX_PATH = "dataset1/data3/quality4"
+DISTANCE_RADAR_PATH = "dataset1/data3/quality3"
+# compact encodings of quality filtered dBZ, the fill value is reserved
+# for filtered and missing data
+LABEL_ENCODINGS: dict[str, dict[str, Any]] = {
+    "int8": {
+        "dtype": "int8",
+        "scale_factor": 0.5,
+        "add_offset": 31.5,
+        "_FillValue": -128,
+        "zlib": True,
+    },
+    "int16": {
+        "dtype": "int16",
+        "scale_factor": 0.01,
+        "_FillValue": -32768,
+        "zlib": True,
+    },
+}
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ReformatStatus(Enum):
+    """Reformat status of a Baltrad file."""
+
+    DONE = "done"
+    MISSING = "missing"
+    FAILED = "failed"
+
+
+@lru_cache
+def get_crs(
+    projdef: str,
+) -> CRS:
+    """Get a cached coordinate reference system."""
+    return CRS(projdef)
+
+
+@lru_cache
+def get_axes(
+    projdef: str,
+    lower_left: Tuple[float, float],
+    size: Tuple[int, int],
+    scale: Tuple[float, float],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Get cached x and y axes of a grid geometry."""
+    x_size, y_size = size
+    x_scale, y_scale = scale
+    left, lower = get_transformer(WGS84, get_crs(projdef)).transform(
+        *lower_left
+    )
+    x = np.linspace(left, left + x_scale * (x_size - 1), x_size)
+    y = np.linspace(lower + y_scale * (y_size - 1), lower, y_size)
+    x.flags.writeable = False
+    y.flags.writeable = False
+    return x, y
+
+
+@lru_cache(maxsize=8)
+def get_cached_grid(
+    projdef: str,
+    lower_left: Tuple[float, float],
+    size: Tuple[int, int],
+    scale: Tuple[float, float],
+    step: int,
+    cache_path: Optional[Path],
+) -> xr.Dataset:
+    """
+    Get grid of a grid geometry, the grid is persisted in the cache
+    path if given.
+    """
+    fingerprint = hashlib.sha1(
+        repr((projdef, lower_left, size, scale, step)).encode()
+    ).hexdigest()
+    if cache_path is not None:
+        grid_file = cache_path / GRID_FILE.format(fingerprint=fingerprint)
+        if grid_file.is_file():
+            grid = xr.load_dataset(grid_file)
+            grid.attrs["crs"] = get_crs(grid.attrs["crs"])
+            return grid
+    x, y = get_axes(projdef, lower_left, size, scale)
+    x = x[0::step]
+    y = y[0::step]
+    xs, ys = np.meshgrid(x, y)
+    lats, lons = get_transformer(get_crs(projdef), WGS84).transform(xs, ys)
+    grid = xr.Dataset(
+        data_vars={
+            "lon": (("y", "x"), lons),
+            "lat": (("y", "x"), lats),
+            "xs": (("y", "x"), xs),
+            "ys": (("y", "x"), ys),
+        },
+        coords={
+            "x": ("x", x),
+            "y": ("y", y),
+        },
+        attrs={
+            "crs": get_crs(projdef),
+            "LL_x": xs[0, 0],
+            "LL_y": ys[0, 0],
+            "UR_x": xs[-1, -1],
+            "UR_y": ys[-1, -1],
+            "LR_x": xs[0, -1],
+            "LR_y": ys[0, -1],
+            "UL_x": xs[-1, 0],
+            "UL_y": ys[-1, 0],
+            "LL_lon": lons[0, 0],
+            "LL_lat": lats[0, 0],
+            "UR_lon": lons[-1, -1],
+            "UR_lat": lats[-1, -1],
+            "LR_lon": lons[0, -1],
+            "LR_lat": lats[0, -1],
+            "UL_lon": lons[-1, 0],
+            "UL_lat": lats[-1, 0],
+            "xsize": x.size,
+            "ysize": y.size,
+            "xscale": x[1] - x[0],
+            "yscale": y[1] - y[0],
+        },
+    )
+    if cache_path is not None:
+        cache_path.mkdir(parents=True, exist_ok=True)
+        grid_file = cache_path / GRID_FILE.format(fingerprint=fingerprint)
+        tmp_file = grid_file.with_suffix(f".{id(grid)}.tmp")
+        grid.assign_attrs(crs=projdef).to_netcdf(tmp_file)
+        tmp_file.replace(grid_file)
+        logging.info(f"Wrote {grid_file} to disc.")
+    return grid
 
 
 @dataclass
 class BaltradReader:
-    """Class for reading baltrad file."""
+    """
+    Class for reading baltrad file.
+
+    The file is opened on first access, and closed by close() or by
+    using the reader as a context manager.
+    """
 
     product_file: Path
 
+    def __enter__(self) -> "BaltradReader":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close file if opened."""
+        data = self.__dict__.pop("_data", None)
+        if data is not None:
+            data.close()
+
     @classmethod
     def from_datetime(
         cls,
@@ -38,10 +200,13 @@ class BaltradReader:
     def _data(self):
         return h5py.File(self.product_file, "r")
 
+    @cached_property
+    def projdef(self) -> str:
+        return self._data['where'].attrs.get("projdef").decode('ascii')
+
     @property
     def crs(self) -> CRS:
-        projdef = self._data['where'].attrs.get("projdef").decode('ascii')
-        return CRS(projdef)
+        return get_crs(self.projdef)
 
     @property
     def lower_left(self) -> Tuple[float, float]:
@@ -80,25 +245,27 @@ class BaltradReader:
     def y_scale(self) -> int:
         return self._data['where'].attrs.get("yscale")
 
+    @cached_property
+    def geometry(
+        self,
+    ) -> Tuple[str, Tuple[float, float], Tuple[int, int], Tuple[float, float]]:
+        """Get grid geometry, used as key for cached grid data."""
+        return (
+            self.projdef,
+            (float(self.lower_left[0]), float(self.lower_left[1])),
+            (int(self.x_size), int(self.y_size)),
+            (float(self.x_scale), float(self.y_scale)),
+        )
+
     @property
     def x(self) -> np.ndarray:
-        transformer = Transformer.from_crs(WGS84, self.crs)
-        left, _ = transformer.transform(*self.lower_left)
-        return np.linspace(
-            left,
-            left + self.x_scale * (self.x_size - 1),
-            self.x_size,
-        )
+        x, _ = get_axes(*self.geometry)
+        return x
 
     @property
     def y(self) -> np.ndarray:
-        transformer = Transformer.from_crs(WGS84, self.crs)
-        _, lower = transformer.transform(*self.lower_left)
-        return np.linspace(
-            lower + self.y_scale * (self.y_size - 1),
-            lower,
-            self.y_size,
-        )
+        _, y = get_axes(*self.geometry)
+        return y
 
     @property
     def dbz(self) -> xr.DataArray:
@@ -142,8 +309,80 @@ class BaltradReader:
             },
         )
 
+    def read(
+        self,
+        path: str,
+        rows: slice = slice(None),
+        cols: slice = slice(None),
+        mask_nodata: bool = False,
+    ) -> np.ndarray:
+        """
+        Read a hyperslab of the given data group decoded by its gain
+        and offset, nodata is optionally set to NaN.
+        """
+        group = self._data[path]
+        what = group["what"].attrs
+        raw = group["data"][rows, cols]
+        values = what.get("gain") * raw.astype(np.float32) + what.get("offset")
+        if mask_nodata:
+            values[raw == what.get("nodata")] = np.nan
+        return values
+
+    def read_masked_dbz(
+        self,
+        qi_min: float,
+        distance_max: float,
+        rows: slice = slice(None),
+        cols: slice = slice(None),
+    ) -> np.ndarray:
+        """
+        Read a hyperslab of decoded dBZ where data of low quality or far
+        from a radar is set to NaN.
+        """
+        dbz = self.read(DBZ_PATH, rows, cols, mask_nodata=True)
+        dbz[
+            ~(
+                (self.read(QUALITY_INDEX_PATH, rows, cols) >= qi_min)
+                & (self.read(DISTANCE_RADAR_PATH, rows, cols) <= distance_max)
+            )
+        ] = np.nan
+        return dbz
+
+    def get_masked_dbz(
+        self,
+        qi_min: float,
+        distance_max: float,
+    ) -> xr.DataArray:
+        """
+        Get decoded dBZ where data of low quality or far from a radar
+        is set to NaN.
+        """
+        return xr.DataArray(
+            data=self.read_masked_dbz(qi_min, distance_max),
+            dims=("y", "x"),
+            attrs={
+                "quantity": self._data[DBZ_PATH]["what"].attrs.get(
+                    "quantity"
+                ).decode(),
+            },
+        )
+
+    def get_compact_data(
+        self,
+        qi_min: float,
+        distance_max: float,
+    ) -> xr.Dataset:
+        """Get dataset of only quality filtered dBZ."""
+        return xr.Dataset(
+            data_vars={"dbz": self.get_masked_dbz(qi_min, distance_max)},
+            attrs={
+                "crs": self.crs,
+                "qi_min": qi_min,
+                "distance_max": distance_max,
+            },
+        )
+
     def get_data(self) -> xr.Dataset:
-        x, y = np.meshgrid(self.x, self.y)
         return xr.Dataset(
             data_vars={
                 "dbz": self.dbz,
@@ -153,66 +392,200 @@ class BaltradReader:
             attrs={"crs": self.crs},
         )
 
-    def get_grid(self, step: int) -> xr.Dataset:
-        """Get grid."""
-        x = self.x[0::step]
-        y = self.y[0::step]
-        xs, ys = np.meshgrid(x, y)
-        transformer = Transformer.from_crs(self.crs, WGS84)
-        lats, lons = transformer.transform(xs, ys)
-        return xr.Dataset(
-            data_vars={
-                "lon": (("y", "x"), lons),
-                "lat": (("y", "x"), lats),
-                "xs": (("y", "x"), xs),
-                "ys": (("y", "x"), ys),
-            },
-            coords={
-                "x": ("x", x),
-                "y": ("y", y),
-            },
-            attrs={
-                "crs": self.crs,
-                "LL_x": xs[0, 0],
-                "LL_y": ys[0, 0],
-                "UR_x": xs[-1, -1],
-                "UR_y": ys[-1, -1],
-                "LR_x": xs[0, -1],
-                "LR_y": ys[0, -1],
-                "UL_x": xs[-1, 0],
-                "UL_y": ys[-1, 0],
-                "LL_lon": lons[0, 0],
-                "LL_lat": lats[0, 0],
-                "UR_lon": lons[-1, -1],
-                "UR_lat": lats[-1, -1],
-                "LR_lon": lons[0, -1],
-                "LR_lat": lats[0, -1],
-                "UL_lon": lons[-1, 0],
-                "UL_lat": lats[-1, 0],
-                "xsize": x.size,
-                "ysize": y.size,
-                "xscale": x[1] - x[0],
-                "yscale": y[1] - y[0],
-            },
+    def get_grid(
+        self,
+        step: int,
+        cache_path: Optional[Path] = None,
+    ) -> xr.Dataset:
+        """
+        Get grid, cached in memory and persisted in the cache path
+        if given.
+        """
+        return get_cached_grid(*self.geometry, step, cache_path).copy()
+
+
+@dataclass
+class Manifest:
+    """
+    Manifest of processed timestamps, and of the settings they are
+    reformatted by, None if not known.
+    """
+
+    manifest_file: Path
+    status: dict[str, ReformatStatus] = field(default_factory=dict)
+    settings: Optional[dict[str, Any]] = None
+
+    @classmethod
+    def load(
+        cls,
+        manifest_file: Path,
+    ) -> "Manifest":
+        """Load manifest, or get an empty manifest if not available."""
+        if not manifest_file.is_file():
+            return cls(manifest_file)
+        with open(manifest_file) as infile:
+            content = json.load(infile)
+        # manifests of earlier runs hold only the status of each timestamp
+        status = content.get("status", content)
+        return cls(
+            manifest_file,
+            {t: ReformatStatus(s) for t, s in status.items()},
+            content.get("settings"),
         )
 
+    def write(self) -> None:
+        """Write manifest to file."""
+        tmp_file = self.manifest_file.with_suffix(".tmp")
+        with open(tmp_file, "w") as outfile:
+            outfile.write(
+                json.dumps(
+                    {
+                        "settings": self.settings,
+                        "status": {
+                            t: self.status[t].value
+                            for t in sorted(self.status)
+                        },
+                    },
+                    indent=4,
+                )
+            )
+        tmp_file.replace(self.manifest_file)
+
+    def update(
+        self,
+        results: Iterable[tuple[datetime, ReformatStatus]],
+    ) -> Counter[ReformatStatus]:
+        """Update manifest with results, written to file regularly."""
+        summary: Counter[ReformatStatus] = Counter()
+        for idx, (t0, status) in enumerate(results):
+            self.status[t0.isoformat()] = status
+            summary[status] += 1
+            if (idx + 1) % MANIFEST_UPDATE_INTERVAL == 0:
+                self.write()
+        self.write()
+        return summary
+
+    def check_settings(
+        self,
+        settings: dict[str, Any],
+    ) -> None:
+        """
+        Check that the settings are the settings of the manifest, as
+        files of other settings would be mixed in the output path.
+        """
+        if self.settings is None:
+            if self.status:
+                logging.warning(
+                    f"Settings of {self.manifest_file} are not known, "
+                    f"assuming {settings}."
+                )
+            self.settings = settings
+        elif self.settings != settings:
+            raise ValueError(
+                f"Settings {settings} differ from settings "
+                f"{self.settings} of {self.manifest_file}, use another "
+                "output path or remove the manifest to reformat all files."
+            )
+
+    def is_done(
+        self,
+        t0: datetime,
+        outpath: Path,
+    ) -> bool:
+        """Check if timestamp already is reformatted."""
+        return (
+            self.status.get(t0.isoformat()) is ReformatStatus.DONE
+            and (outpath / t0.strftime(REFORMAT_FILE)).is_file()
+        )
+
+
+def reformat_file(
+    t0: datetime,
+    basepath: Path,
+    outpath: Path,
+    label_encoding: Optional[str] = None,
+    qi_min: float = 0.,
+    distance_max: float = np.inf,
+) -> tuple[datetime, ReformatStatus]:
+    """
+    Reformat a single baltrad data file, if a label encoding is given
+    only quality filtered dBZ is written in the given encoding.
+    """
+    reader = BaltradReader.from_datetime(t0, basepath)
+    if not reader.product_file.is_file():
+        logging.warning(f"Missing {reader.product_file}.")
+        return t0, ReformatStatus.MISSING
+    try:
+        with reader:
+            if label_encoding is None:
+                data = reader.get_data()
+                encoding = {var: {"zlib": True} for var in data.variables}
+            else:
+                data = reader.get_compact_data(qi_min, distance_max)
+                encoding = {"dbz": LABEL_ENCODINGS[label_encoding]}
+        data.attrs["crs"] = str(data.attrs["crs"])
+        data.to_netcdf(
+            outpath / t0.strftime(REFORMAT_FILE),
+            encoding=encoding,
+        )
+    except Exception:
+        logging.exception(f"Failed reformatting {reader.product_file}.")
+        return t0, ReformatStatus.FAILED
+    return t0, ReformatStatus.DONE
+
 
 def reformat(
     t0: datetime,
     t1: datetime,
     basepath: Path,
     outpath: Path,
-) -> None:
-    """Reformat baltrad data files."""
+    workers: int = 1,
+    label_encoding: Optional[str] = None,
+    qi_min: float = 0.,
+    distance_max: float = np.inf,
+) -> Manifest:
+    """
+    Reformat baltrad data files, already reformatted timestamps of
+    the manifest are skipped. The settings must be the settings of
+    earlier runs of the manifest.
+    """
     outpath = outpath / "radar"
     outpath.mkdir(parents=True, exist_ok=True)
+    manifest = Manifest.load(outpath / MANIFEST_FILE)
+    manifest.check_settings(
+        {
+            "label_encoding": label_encoding,
+            "qi_min": qi_min,
+            "distance_max": distance_max,
+        }
+    )
+    timestamps = []
     ti = t0
     while ti <= t1:
-        reader = BaltradReader.from_datetime(ti, basepath)
-        data = reader.get_data()
-        data.attrs["crs"] = str(data.attrs["crs"])
-        data.to_netcdf(
-            outpath / ti.strftime("radar_%Y%m%d_%H_%M.nc"),
-            encoding={var: {"zlib": True} for var in data.variables},
-        )
+        if not manifest.is_done(ti, outpath):
+            timestamps.append(ti)
         ti += timedelta(minutes=15)
+    logging.info(f"Reformatting {len(timestamps)} timestamps.")
+    func = partial(
+        reformat_file,
+        basepath=basepath,
+        outpath=outpath,
+        label_encoding=label_encoding,
+        qi_min=qi_min,
+        distance_max=distance_max,
+    )
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            summary = manifest.update(executor.map(func, timestamps))
+    else:
+        summary = manifest.update(map(func, timestamps))
+    logging.info(
+        "Reformatted {} timestamps: {}.".format(
+            len(timestamps),
+            ", ".join(
+                f"{summary[status]} {status.value}"
+                for status in ReformatStatus
+            ),
+        )
+    )
+    return manifest
@@ -0,0 +1,218 @@
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import cast, Optional
+import json
+import logging
+
+import numpy as np  # type: ignore
+import xarray as xr  # type: ignore
+
+from pps_mw_training.pipelines.pr_nordic.data.atms import AtmsL1bReader
+from pps_mw_training.pipelines.pr_nordic.data.regridder import (
+    GridTree,
+    Regridder,
+)
+from pps_mw_training.pipelines.pr_nordic.data.utils import Writer
+
+
+INDEX_FILE = "granule_index_{fingerprint}.json"
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def to_datetime(
+    time: np.datetime64,
+) -> datetime:
+    """Convert numpy datetime64 to datetime."""
+    return time.astype("datetime64[us]").item()
+
+
+@dataclass
+class GranuleInfo:
+    """Time coverage and footprint of a level1b granule."""
+
+    l1b_file: str
+    size: int
+    mtime: float
+    platform: str
+    start: Optional[str]
+    end: Optional[str]
+    lat_min: float
+    lat_max: float
+    lon_min: float
+    lon_max: float
+    # time coverage of the scanlines with data within the grid
+    grid_start: Optional[str]
+    grid_end: Optional[str]
+
+    @property
+    def intersects(self) -> bool:
+        return self.grid_start is not None and self.grid_end is not None
+
+    @property
+    def slots(self) -> tuple[datetime, datetime]:
+        """Get first and last radar slot of the data within the grid."""
+        return (
+            Writer.round_time(
+                datetime.fromisoformat(cast(str, self.grid_start))
+            ),
+            Writer.round_time(
+                datetime.fromisoformat(cast(str, self.grid_end))
+            ),
+        )
+
+    def is_current(self) -> bool:
+        """Check that the granule file is unchanged since indexed."""
+        stat = Path(self.l1b_file).stat()
+        return stat.st_size == self.size and stat.st_mtime == self.mtime
+
+    @classmethod
+    def from_file(
+        cls,
+        l1b_file: Path,
+        grid: xr.Dataset,
+    ) -> "GranuleInfo":
+        """Get granule info from time and geolocation data only."""
+        data = AtmsL1bReader(l1b_file).get_metadata_dataset()
+        stat = l1b_file.stat()
+        time = data.time.values.astype("datetime64[ns]")
+        valid_time = ~np.isnat(time)
+        within_grid = (
+            Regridder(data, grid).get_geo_filter().any(axis=1) & valid_time
+        )
+        start, end = cls._get_time_range(time[valid_time])
+        grid_start, grid_end = cls._get_time_range(time[within_grid])
+        return cls(
+            l1b_file=l1b_file.as_posix(),
+            size=stat.st_size,
+            mtime=stat.st_mtime,
+            platform=data.attrs["platform"],
+            start=start,
+            end=end,
+            lat_min=float(np.nanmin(data.lat.values)),
+            lat_max=float(np.nanmax(data.lat.values)),
+            lon_min=float(np.nanmin(data.lon.values)),
+            lon_max=float(np.nanmax(data.lon.values)),
+            grid_start=grid_start,
+            grid_end=grid_end,
+        )
+
+    @staticmethod
+    def _get_time_range(
+        time: np.ndarray,
+    ) -> tuple[Optional[str], Optional[str]]:
+        """Get first and last time as iso formatted strings."""
+        if time.size == 0:
+            return None, None
+        return (
+            to_datetime(time.min()).isoformat(),
+            to_datetime(time.max()).isoformat(),
+        )
+
+
+@dataclass
+class GranuleIndex:
+    """Persisted index of level1b granules for a given grid."""
+
+    index_file: Path
+    granules: dict[str, GranuleInfo]
+
+    @classmethod
+    def load(
+        cls,
+        grid: xr.Dataset,
+        cache_path: Path,
+    ) -> "GranuleIndex":
+        """Load index from cache path, or get an empty index."""
+        index_file = cache_path / INDEX_FILE.format(
+            fingerprint=GridTree.get_fingerprint(grid)
+        )
+        granules: dict[str, GranuleInfo] = {}
+        if index_file.is_file():
+            with open(index_file) as infile:
+                granules = {
+                    f: GranuleInfo(**info)
+                    for f, info in json.load(infile).items()
+                }
+        return cls(index_file, granules)
+
+    def write(self) -> None:
+        """Write index to file."""
+        self.index_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.index_file, "w") as outfile:
+            outfile.write(
+                json.dumps(
+                    {f: asdict(info) for f, info in self.granules.items()},
+                    indent=4,
+                )
+            )
+
+    def update(
+        self,
+        l1b_files: list[Path],
+        grid: xr.Dataset,
+    ) -> list[GranuleInfo]:
+        """Get info of given files, index new or modified files."""
+        infos = []
+        updated = False
+        for l1b_file in l1b_files:
+            info = self.granules.get(l1b_file.as_posix())
+            if info is None or not info.is_current():
+                try:
+                    info = GranuleInfo.from_file(l1b_file, grid)
+                except Exception:
+                    logging.exception(f"Failed indexing {l1b_file}.")
+                    continue
+                self.granules[info.l1b_file] = info
+                updated = True
+            infos.append(info)
+        if updated:
+            self.write()
+        return infos
+
+
+def group_granules(
+    infos: list[GranuleInfo],
+) -> list[list[Path]]:
+    """
+    Group granules intersecting the grid by the radar slots they
+    overlap, granules sharing a slot end up in the same group.
+    """
+    groups: list[list[Path]] = []
+    for platform in sorted({info.platform for info in infos}):
+        granules = sorted(
+            (
+                info for info in infos
+                if info.intersects and info.platform == platform
+            ),
+            key=lambda info: cast(str, info.grid_start),
+        )
+        last_slot: Optional[datetime] = None
+        for info in granules:
+            first, last = info.slots
+            if last_slot is None or first > last_slot:
+                groups.append([])
+                last_slot = last
+            groups[-1].append(Path(info.l1b_file))
+            last_slot = max(last_slot, last)
+    return groups
+
+
+def plan(
+    l1b_files: list[Path],
+    grid: xr.Dataset,
+    cache_path: Path,
+) -> list[list[Path]]:
+    """Plan chunks of level1b files to regrid onto the given grid."""
+    index = GranuleIndex.load(grid, cache_path)
+    infos = index.update(l1b_files, grid)
+    chunks = group_granules(infos)
+    n_intersecting = sum(len(chunk) for chunk in chunks)
+    logging.info(
+        f"Found {n_intersecting} of {len(l1b_files)} granules "
+        f"intersecting the grid, grouped into {len(chunks)} chunks."
+    )
+    return chunks
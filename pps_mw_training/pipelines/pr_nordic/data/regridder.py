@@ -1,12 +1,17 @@
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
+from functools import cached_property, lru_cache
+from pathlib import Path
 from typing import Optional, Sequence, Union
+import hashlib
 import logging
+import pickle
 
 
-from pyproj import Transformer  # type: ignore
-from scipy.interpolate import griddata  # type: ignore
+from pyproj import CRS, Transformer  # type: ignore
+from scipy.sparse import csr_matrix, diags  # type: ignore
+from scipy.spatial import cKDTree, Delaunay  # type: ignore
 import numpy as np  # type: ignore
 import xarray as xr  # type: ignore
 
@@ -14,18 +19,232 @@ import xarray as xr  # type: ignore
 WGS84 = "EPSG:4326"
 DELTA_GEO = 100e3  # [m]
 DELTA_TIME = 1200 * 1e9  # [ns]
+RADIUS_OF_INFLUENCE = 30e3  # [m]
+MIN_DISTANCE = 1.0  # [m]
+IDW_POWER = 2.0
+KDTREE_METHODS = ["kdtree_nearest", "kdtree_idw", "kdtree_gaussian"]
+GRID_TREE_FILE = "grid_tree_{fingerprint}.pickle"
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+class NoDataWithinGridError(ValueError):
+    """Raised when no swath data is found within the grid."""
+
+
+@lru_cache
+def get_transformer(
+    crs_from: Union[str, CRS],
+    crs_to: Union[str, CRS],
+) -> Transformer:
+    """Get a cached transformer between two coordinate systems."""
+    return Transformer.from_crs(crs_from, crs_to)
+
+
+@dataclass
+class InterpolationWeights:
+    """
+    Sparse (grid x swath) interpolation operator.
+
+    The weights only depend on the positions of the swath and grid
+    points, and can hence be computed once and applied to all channels.
+    """
+
+    weights: csr_matrix
+    valid: np.ndarray
+
+    @classmethod
+    def linear(
+        cls,
+        points: np.ndarray,
+        grid_points: np.ndarray,
+    ) -> "InterpolationWeights":
+        """Get barycentric weights of a Delaunay triangulation."""
+        triangulation = Delaunay(points)
+        simplices = triangulation.find_simplex(grid_points)
+        valid = simplices >= 0
+        transform = triangulation.transform[simplices[valid]]
+        barycentric = np.einsum(
+            "ijk,ik->ij",
+            transform[:, :2],
+            grid_points[valid] - transform[:, 2],
+        )
+        weights = np.column_stack(
+            [barycentric, 1 - barycentric.sum(axis=1)]
+        )
+        return cls(
+            weights=csr_matrix(
+                (
+                    weights.ravel(),
+                    (
+                        np.repeat(np.flatnonzero(valid), 3),
+                        triangulation.simplices[simplices[valid]].ravel(),
+                    ),
+                ),
+                shape=(grid_points.shape[0], points.shape[0]),
+            ),
+            valid=valid,
+        )
+
+    @classmethod
+    def nearest(
+        cls,
+        points: np.ndarray,
+        grid_points: np.ndarray,
+    ) -> "InterpolationWeights":
+        """Get nearest neighbour weights."""
+        _, idxs = cKDTree(points).query(grid_points)
+        return cls(
+            weights=csr_matrix(
+                (
+                    np.ones(grid_points.shape[0]),
+                    (np.arange(grid_points.shape[0]), idxs),
+                ),
+                shape=(grid_points.shape[0], points.shape[0]),
+            ),
+            valid=np.ones(grid_points.shape[0], dtype=bool),
+        )
+
+    @classmethod
+    def from_method(
+        cls,
+        method: str,
+        points: np.ndarray,
+        grid_points: np.ndarray,
+    ) -> "InterpolationWeights":
+        """Get interpolation weights for the given method."""
+        if method == "linear":
+            return cls.linear(points, grid_points)
+        if method == "nearest":
+            return cls.nearest(points, grid_points)
+        raise ValueError(f"Unknown interpolation method: {method}")
+
+    def apply(
+        self,
+        values: np.ndarray,
+    ) -> np.ndarray:
+        """Apply weights to (swath x channel) values."""
+        data = self.weights @ values
+        data[~self.valid] = np.nan
+        return data
+
+
+@dataclass
+class GridTree:
+    """
+    Class holding a k-d tree built over the projected positions of a
+    fixed grid.
+
+    The tree is independent of the swath data, and can hence be built
+    once and persisted for a given grid definition.
+    """
+
+    tree: cKDTree
+    fingerprint: str
+
+    @staticmethod
+    def get_fingerprint(
+        grid: xr.Dataset,
+    ) -> str:
+        """Get a fingerprint identifying the grid definition."""
+        keys = ["LL_x", "LL_y", "UR_x", "UR_y", "xsize", "ysize"]
+        definition = [str(grid.attrs["crs"])] + [
+            str(grid.attrs[key]) for key in keys
+        ]
+        return hashlib.sha1("|".join(definition).encode()).hexdigest()
+
+    @classmethod
+    def from_grid(
+        cls,
+        grid: xr.Dataset,
+    ) -> "GridTree":
+        """Build tree from grid."""
+        return cls(
+            tree=cKDTree(
+                np.column_stack(
+                    [grid.ys.values.ravel(), grid.xs.values.ravel()]
+                )
+            ),
+            fingerprint=cls.get_fingerprint(grid),
+        )
+
+    @classmethod
+    def load(
+        cls,
+        grid: xr.Dataset,
+        cache_path: Path,
+    ) -> "GridTree":
+        """Load tree from cache, build and persist it if not available."""
+        cache_file = cache_path / GRID_TREE_FILE.format(
+            fingerprint=cls.get_fingerprint(grid)
+        )
+        if cache_file.is_file():
+            with open(cache_file, "rb") as infile:
+                return pickle.load(infile)
+        grid_tree = cls.from_grid(grid)
+        cache_path.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_suffix(f".{id(grid_tree)}.tmp")
+        with open(tmp_file, "wb") as outfile:
+            pickle.dump(grid_tree, outfile)
+        tmp_file.replace(cache_file)
+        logging.info(f"Wrote {cache_file} to disc.")
+        return grid_tree
+
+    def get_weights(
+        self,
+        points: np.ndarray,
+        method: str,
+        radius: float = RADIUS_OF_INFLUENCE,
+    ) -> InterpolationWeights:
+        """
+        Get interpolation weights for all grid points from the swath
+        points within the radius of influence.
+        """
+        pairs = cKDTree(points).sparse_distance_matrix(
+            self.tree, radius, output_type="ndarray"
+        )
+        swath_idxs = pairs["i"]
+        grid_idxs = pairs["j"]
+        distances = pairs["v"]
+        if method == "kdtree_nearest":
+            order = np.lexsort((distances, grid_idxs))
+            _, first = np.unique(grid_idxs[order], return_index=True)
+            swath_idxs = swath_idxs[order[first]]
+            grid_idxs = grid_idxs[order[first]]
+            weights = np.ones(grid_idxs.size)
+        elif method == "kdtree_idw":
+            weights = 1. / np.maximum(distances, MIN_DISTANCE) ** IDW_POWER
+        elif method == "kdtree_gaussian":
+            # footprint modelled with a standard deviation of half
+            # the radius of influence
+            weights = np.exp(-0.5 * (2 * distances / radius) ** 2)
+        else:
+            raise ValueError(f"Unknown interpolation method: {method}")
+        n_grid = self.tree.n
+        matrix = csr_matrix(
+            (weights, (grid_idxs, swath_idxs)),
+            shape=(n_grid, points.shape[0]),
+        )
+        total = np.asarray(matrix.sum(axis=1)).ravel()
+        valid = total > 0
+        norm = np.zeros(n_grid)
+        norm[valid] = 1. / total[valid]
+        return InterpolationWeights(
+            weights=diags(norm) @ matrix,
+            valid=valid,
+        )
+
+
 @dataclass
 class Regridder:
     """Class for regridding of data onto a new grid"""
 
     dataset: xr.Dataset
     grid: xr.Dataset
+    grid_tree: Optional[GridTree] = None
+    radius: float = RADIUS_OF_INFLUENCE
 
     def regrid(
         self,
@@ -33,19 +252,59 @@ class Regridder:
         method: str = "linear",
     ) -> Optional[xr.Dataset]:
         """Regrid data onto the given grid for all channels."""
-        datasets = [self._regrid(channel, method) for channel in channels]
+        x, y = self.transform(self.dataset)
+        filt, time = self._get_filt(x, y, self.dataset)
+        weights = self._get_weights(
+            np.column_stack([y[filt], x[filt]]),
+            method,
+        )
+        data = weights.apply(
+            np.column_stack(
+                [
+                    self.dataset[channel].values.squeeze()[filt]
+                    for channel in channels
+                ]
+            )
+        ).reshape(self.grid.ys.shape + (len(channels),))
+        datasets = [
+            self._get_dataset(channel, data[:, :, idx], time)
+            for idx, channel in enumerate(channels)
+        ]
         if not any([d.attrs["valid_data"] for d in datasets]):
             logging.warning("Found no valid data within grid.")
             return None
         return xr.merge(datasets)
 
+    def get_geo_filter(self) -> np.ndarray:
+        """Get filter of data within the grid limits."""
+        x, y = self.transform(self.dataset)
+        return self._within_grid_limits(x, y)
+
+    def _get_weights(
+        self,
+        points: np.ndarray,
+        method: str,
+    ) -> InterpolationWeights:
+        """Get interpolation weights from swath points to grid."""
+        if method in KDTREE_METHODS:
+            if self.grid_tree is None:
+                self.grid_tree = GridTree.from_grid(self.grid)
+            return self.grid_tree.get_weights(points, method, self.radius)
+        return InterpolationWeights.from_method(
+            method,
+            points,
+            np.column_stack(
+                [self.grid.ys.values.ravel(), self.grid.xs.values.ravel()]
+            ),
+        )
+
     def transform(
         self,
-        data: xr.DataArray,
+        data: Union[xr.Dataset, xr.DataArray],
     ) -> tuple[np.ndarray, np.ndarray]:
         """Transform data coordinates to grid coordinates."""
-        transformer = Transformer.from_crs(WGS84, self.grid.attrs["crs"])
-        return transformer.transform(data.lat, data.lon)
+        transformer = get_transformer(WGS84, self.grid.attrs["crs"])
+        return transformer.transform(data.lat.values, data.lon.values)
 
     def _get_attrs(
         self,
@@ -61,6 +320,16 @@ class Regridder:
         }
         return self.grid.attrs | attrs
 
+    @cached_property
+    def _grid_limits(self) -> tuple[float, float, float, float]:
+        """Get grid limits."""
+        return (
+            self.grid.xs.values.min(),
+            self.grid.xs.values.max(),
+            self.grid.ys.values.min(),
+            self.grid.ys.values.max(),
+        )
+
     def _within_grid_limits(
         self,
         x: np.ndarray,
@@ -68,11 +337,12 @@ class Regridder:
         delta: float = DELTA_GEO,
     ) -> np.ndarray:
         """Filter data on geolocation."""
+        x_min, x_max, y_min, y_max = self._grid_limits
         return (
-            (y >= self.grid.ys.values.min() - delta)
-            & (y <= self.grid.ys.values.max() + delta)
-            & (x >= self.grid.xs.values.min() - delta)
-            & (x <= self.grid.xs.values.max() + delta)
+            (y >= y_min - delta)
+            & (y <= y_max + delta)
+            & (x >= x_min - delta)
+            & (x <= x_max + delta)
         )
 
     @staticmethod
@@ -86,25 +356,21 @@ class Regridder:
 
     @staticmethod
     def _get_timestamps(
-        data: xr.DataArray,
+        data: Union[xr.Dataset, xr.DataArray],
     ) -> np.ndarray:
-        """Get timestamps."""
-        timestamps = np.array([t.astype(datetime) for t in data.time])
-        timestamps[timestamps == None] = 0.  # noqa: E711
+        """Get timestamps as nanoseconds since epoch, zero if missing."""
+        time = data.time.values.astype("datetime64[ns]")
+        timestamps = time.astype(np.int64)
+        timestamps[np.isnat(time)] = 0
         return timestamps
 
     @staticmethod
     def _get_median_timestamp(
-        data: xr.DataArray,
         timestamps: np.ndarray,
         filt_geo: np.ndarray
     ) -> float:
         """Get median timestamp of the geo filtered data."""
-        idxs = np.array([
-            idx for idx in np.arange(data.time.values.size)
-            if np.any(filt_geo[idx])
-        ])
-        return np.median(timestamps[idxs])
+        return np.median(timestamps[filt_geo.any(axis=1)])
 
     @staticmethod
     def _merge_filt(
@@ -112,44 +378,33 @@ class Regridder:
         filt_time: np.ndarray,
     ) -> np.ndarray:
         """Merge geo and time filters."""
-        for idx in np.arange(filt_time.size):
-            if not filt_time[idx]:
-                filt_geo[idx] = False
-        return filt_geo
+        return filt_geo & filt_time[:, np.newaxis]
 
     def _get_filt(
         self,
         x: np.ndarray,
         y: np.ndarray,
-        data: xr.DataArray,
+        data: Union[xr.Dataset, xr.DataArray],
     ) -> tuple[np.ndarray, datetime]:
         """Get a gelocation and time filter."""
         within_grid = self._within_grid_limits(x, y)
         if not within_grid.any():
-            raise ValueError("No data within grid")
+            raise NoDataWithinGridError("No data within grid")
         # Filter data on time such that data from both ends of an
         # orbit is not included
         timestamps = self._get_timestamps(data)
-        timestamp = self._get_median_timestamp(data, timestamps, within_grid)
+        timestamp = self._get_median_timestamp(timestamps, within_grid)
         within_time = self._within_time_limits(timestamps, timestamp)
         filt = self._merge_filt(within_grid, within_time)
         return filt, datetime.utcfromtimestamp(timestamp / 1e9)
 
-    def _regrid(
+    def _get_dataset(
         self,
         channel: Enum,
-        method: str,
+        data: np.ndarray,
+        time: datetime,
     ) -> xr.Dataset:
-        """Regrid data onto the given grid for a single channel."""
-        dataset = self.dataset[channel]
-        x, y = self.transform(dataset)
-        filt, time = self._get_filt(x, y, dataset)
-        data = griddata(
-            np.array([y[filt], x[filt]]).transpose(),
-            dataset.values.squeeze()[filt],
-            (self.grid.ys.values, self.grid.xs.values),
-            method=method,
-        )
+        """Get regridded dataset for a single channel."""
         s1, s2 = data.shape
         valid_data = 1
         if not np.isfinite(data).any():
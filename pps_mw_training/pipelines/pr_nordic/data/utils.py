@@ -5,6 +5,7 @@ from math import ceil
 from pathlib import Path
 from typing import Any, Sequence
 
+import h5py  # type: ignore
 import numpy as np  # type: ignore
 import xarray as xr  # type: ignore
 
@@ -15,12 +16,28 @@ from pps_mw_training.pipelines.pr_nordic.data.data_model import (
 
 FILENAME_FMT = "mw_%Y%m%d_%H_%M.nc"
 MINUTE = 15
-COMPRESSION = {
+COMPRESSION: dict[str, Any] = {
     "dtype": "int16",
     "scale_factor": 0.01,
     "zlib": True,
     "_FillValue": -99,
 }
+STORE_FILE = "mw_scenes.h5"
+# position of each band in a flat array holding the channels of all bands
+BAND_SLICES = {
+    band: slice(start, start + len(BANDS[band]))
+    for band, start in zip(
+        BANDS, np.cumsum([0] + [len(BANDS[band]) for band in BANDS])
+    )
+}
+N_BAND_CHANNELS = sum(len(BANDS[band]) for band in BANDS)
+# position of each channel in the flat array
+CHANNEL_INDEX = {
+    name: BAND_SLICES[band].start + idx
+    for band in BANDS
+    for idx, names in BANDS[band].items()
+    for name in names
+}
 
 
 @dataclass
@@ -29,24 +46,6 @@ class Reshaper:
 
     dataset: xr.Dataset
 
-    def _get_empty_band_dataset(self) -> xr.Dataset:
-        """Get empty band dataset."""
-        return xr.Dataset(
-            {
-                band: (
-                    ("y", "x", f"channel_{band}"),
-                    np.full(
-                        (
-                            self.dataset.y.size,
-                            self.dataset.x.size,
-                            len(BANDS[band]),
-                        ),
-                        np.nan,
-                    ),
-                ) for band in BANDS
-            },
-        )
-
     @property
     def attrs(self) -> dict[str, Any]:
         """Fix attributess."""
@@ -59,14 +58,25 @@ class Reshaper:
 
     def reshape(self) -> xr.Dataset:
         """Get dataset as a band dataset."""
-        data = self._get_empty_band_dataset()
-        for c in self.dataset:
-            for b in BANDS:
-                for idx, names in BANDS[b].items():
-                    if c.name in names:
-                        data[b].values[:, :, idx] = self.dataset[c].values
-        data.attrs = self.attrs
-        return data
+        channels: list[Any] = [
+            c for c in self.dataset if c.name in CHANNEL_INDEX
+        ]
+        data = np.full(
+            (self.dataset.y.size, self.dataset.x.size, N_BAND_CHANNELS),
+            np.nan,
+        )
+        # bands of a dataset without known channels are left empty
+        if channels:
+            data[:, :, [CHANNEL_INDEX[c.name] for c in channels]] = np.stack(
+                [self.dataset[c].values for c in channels], axis=-1,
+            )
+        return xr.Dataset(
+            {
+                band: (("y", "x", f"channel_{band}"), data[:, :, slc])
+                for band, slc in BAND_SLICES.items()
+            },
+            attrs=self.attrs,
+        )
 
 
 @dataclass
@@ -110,6 +120,119 @@ class Writer(Reshaper):
         return output_filepath
 
 
+@dataclass
+class StoreWriter(Reshaper):
+    """
+    Writer class appending scenes to a single time indexed HDF5 store,
+    holding one scene per chunk of each band.
+    """
+
+    dataset: xr.Dataset
+    store_file: Path
+
+    def write(
+        self,
+    ) -> Path:
+        """Write data to store, a scene of the same time is replaced."""
+        t0 = Writer.round_time(self.dataset.attrs["time"])
+        timestamp = int((t0 - datetime(1970, 1, 1)).total_seconds())
+        dataset = self.reshape()
+        self.store_file.parent.mkdir(parents=True, exist_ok=True)
+        with h5py.File(self.store_file, "a") as store:
+            if "time" not in store:
+                self._create(store, dataset)
+            times = store["time"][:]
+            match = np.flatnonzero(times == timestamp)
+            if match.size > 0:
+                idx = match[0]
+            else:
+                idx = times.size
+                for name in ["time", "platform"] + list(BANDS):
+                    store[name].resize(idx + 1, axis=0)
+            store["time"][idx] = timestamp
+            store["platform"][idx] = dataset.attrs["platform"]
+            for band in BANDS:
+                values = dataset[band].values
+                store[band][idx] = np.where(
+                    np.isfinite(values),
+                    np.round(values / COMPRESSION["scale_factor"]),
+                    COMPRESSION["_FillValue"],
+                )
+        return self.store_file
+
+    @staticmethod
+    def _create(
+        store: h5py.File,
+        dataset: xr.Dataset,
+    ) -> None:
+        """Create empty store datasets."""
+        store.create_dataset(
+            "time", shape=(0,), maxshape=(None,), dtype="int64",
+        )
+        store["time"].attrs["units"] = "seconds since 1970-01-01"
+        store.create_dataset(
+            "platform",
+            shape=(0,),
+            maxshape=(None,),
+            dtype=h5py.string_dtype(),
+        )
+        for band in BANDS:
+            shape = (dataset.y.size, dataset.x.size, len(BANDS[band]))
+            store.create_dataset(
+                band,
+                shape=(0,) + shape,
+                maxshape=(None,) + shape,
+                chunks=(1,) + shape,
+                dtype=COMPRESSION["dtype"],
+                compression="gzip",
+            )
+            store[band].attrs["scale_factor"] = COMPRESSION["scale_factor"]
+            store[band].attrs["_FillValue"] = COMPRESSION["_FillValue"]
+        for key, value in dataset.attrs.items():
+            if key not in ["time", "platform", "valid_data"]:
+                store.attrs[key] = value
+
+
+def get_store_times(
+    store_file: Path,
+) -> list[datetime]:
+    """Get time of all scenes in store."""
+    with h5py.File(store_file, "r") as store:
+        return [
+            datetime(1970, 1, 1) + timedelta(seconds=int(t))
+            for t in store["time"][:]
+        ]
+
+
+def read_scene(
+    store_file: Path,
+    idx: int,
+) -> xr.Dataset:
+    """Read a single scene from store."""
+    with h5py.File(store_file, "r") as store:
+        time = datetime(1970, 1, 1) + timedelta(
+            seconds=int(store["time"][idx])
+        )
+        data = {}
+        for band in BANDS:
+            values = store[band][idx]
+            data[band] = (
+                ("y", "x", f"channel_{band}"),
+                np.where(
+                    values == store[band].attrs["_FillValue"],
+                    np.nan,
+                    values * store[band].attrs["scale_factor"],
+                ),
+            )
+        return xr.Dataset(
+            data,
+            attrs=dict(store.attrs) | {
+                "time": time.isoformat(),
+                "platform": store["platform"].asstr()[idx],
+            },
+        )
+
+
 def reshape_filelist(
     files: list[Path],
     chunk_size: int,
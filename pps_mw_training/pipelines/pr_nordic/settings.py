@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Union
 import os
 from pps_mw_training.models.trainers.utils import AugmentationType
 
@@ -8,6 +8,8 @@ MODEL_CONFIG_PATH = Path(os.environ.get("MODEL_CONFIG_PR_NORDIC", "/tmp"))
 TRAINING_DATA_PATH = Path(
     os.environ.get("TRAINING_DATA_PATH_PR_NORDIC", "/tmp")
 )
+GRID_CACHE_PATH = Path(os.environ.get("GRID_CACHE_PATH_PR_NORDIC", "/tmp"))
+SHARD_PATH = Path(os.environ.get("SHARD_PATH_PR_NORDIC", "/tmp"))
 # model parameters
 INPUT_PARAMS: List[Dict[str, Union[str, float, int]]] = [
     {
@@ -123,6 +125,28 @@ BATCH_SIZE = 20
 TRAIN_FRACTION = 0.8
 VALIDATION_FRACTION = 0.15
 TEST_FRACTION = 0.05
+# data loader parameters, data is loaded in the tf.data pipeline if 0 workers
+LOADER_WORKERS = 0
+LOADER_PREFETCH = 4  # number of batches in flight
+# number of crops extracted from each loaded scene, the crops are shuffled
+# and batched by the patch batch size, a single crop per scene if 1
+CROPS_PER_SCENE = 1
+PATCH_BATCH_SIZE = 20
+SHUFFLE_BUFFER = 500  # number of crops
+# cache of loaded batches of the training data, disabled if 0 bytes, least
+# recently used batches are spilled to the spill path if set. The batches
+# are of the same scenes every epoch if enabled, see utils.batch_cache. The
+# budget and spill path can be set by environment variables
+BATCH_CACHE_BYTES = int(os.environ.get("BATCH_CACHE_BYTES_PR_NORDIC", 0))
+BATCH_CACHE_SPILL_PATH: Optional[Path] = (
+    Path(os.environ["BATCH_CACHE_PATH_PR_NORDIC"])
+    if "BATCH_CACHE_PATH_PR_NORDIC" in os.environ
+    else None
+)
+BATCH_CACHE_SPILL_BYTES = 64 * 1024**3
+SHARD_SIZE = 200  # number of matched files per shard
+# max time difference [s] of satellite and radar files matched by the catalog
+MATCH_TOLERANCE = 0.0
 FILL_VALUE_IMAGES = -1.5
 FILL_VALUE_LABELS = -100.0
 IMAGE_SIZE = 64
@@ -131,4 +155,13 @@ INITIAL_LEARNING_RATE = 0.0005
 DECAY_STEPS_FACTOR = 0.7
 ALPHA = 0.1
 AUGMENTATION_TYPE = AugmentationType.CROP_AND_FLIP
+# read only a random crop of each scene, instead of cropping loaded scenes
+CROP_AT_READ = False
+# min fraction of valid input and label data of crops sampled by
+# AugmentationType.VALID_CROP_AND_FLIP
+MIN_VALID_INPUT = 0.5
+MIN_VALID_LABEL = 0.1
+# quantized encoding of the labels in the input pipeline, a key of
+# utils.label_encoding.LABEL_ENCODINGS, e.g. "dbz_uint8", or None for float32
+LABEL_ENCODING: Optional[str] = None
 SUPER_RESOLUTION = True
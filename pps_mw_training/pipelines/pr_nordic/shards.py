@@ -0,0 +1,293 @@
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+import json
+import logging
+import math
+
+import numpy as np  # type: ignore
+import tensorflow as tf  # type: ignore
+
+from pps_mw_training.pipelines.pr_nordic import training_data
+from pps_mw_training.utils import catalog
+from pps_mw_training.utils.augmentation import ValidCrop
+from pps_mw_training.utils import data_service
+
+
+MANIFEST_FILE = "manifest.json"
+SHARD_FILE = "shard_{split}_{idx:05d}.tfrecord.gz"
+COMPRESSION = "GZIP"
+SPLITS = ["train", "validation", "test"]
+FEATURES = {
+    "image": tf.io.FixedLenFeature([], tf.string),
+    "image_shape": tf.io.FixedLenFeature([3], tf.int64),
+    "label": tf.io.FixedLenFeature([], tf.string),
+    "label_shape": tf.io.FixedLenFeature([3], tf.int64),
+}
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Shard:
+    """A shard of serialized scenes."""
+
+    shard_file: str
+    n_scenes: int
+    satellite_files: list[str]
+
+
+@dataclass
+class ShardManifest:
+    """Manifest of the shards built for each split."""
+
+    manifest_file: Path
+    shards: dict[str, list[Shard]] = field(
+        default_factory=lambda: {split: [] for split in SPLITS}
+    )
+
+    @classmethod
+    def load(
+        cls,
+        shard_path: Path,
+    ) -> "ShardManifest":
+        """Load manifest from shard path, or get an empty manifest."""
+        manifest_file = shard_path / MANIFEST_FILE
+        manifest = cls(manifest_file)
+        if manifest_file.is_file():
+            with open(manifest_file) as infile:
+                for split, shards in json.load(infile).items():
+                    manifest.shards[split] = [Shard(**s) for s in shards]
+        return manifest
+
+    def write(self) -> None:
+        """Write manifest to file, the file is replaced atomically."""
+        self.manifest_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.manifest_file.with_suffix(".tmp")
+        with open(tmp_file, "w") as outfile:
+            outfile.write(
+                json.dumps(
+                    {
+                        split: [asdict(s) for s in shards]
+                        for split, shards in self.shards.items()
+                    },
+                    indent=4,
+                )
+            )
+        tmp_file.replace(self.manifest_file)
+
+    @property
+    def satellite_files(self) -> set[str]:
+        """Get satellite files already in a shard."""
+        return {
+            f
+            for shards in self.shards.values()
+            for shard in shards
+            for f in shard.satellite_files
+        }
+
+    def get_shard_files(
+        self,
+        split: str,
+    ) -> list[str]:
+        """Get absolute path of shard files of the given split."""
+        return [
+            (self.manifest_file.parent.absolute() / shard.shard_file)
+            .as_posix()
+            for shard in self.shards[split]
+        ]
+
+
+def serialize(
+    image: np.ndarray,
+    label: np.ndarray,
+) -> bytes:
+    """Serialize a scaled image and label pair."""
+    return tf.train.Example(
+        features=tf.train.Features(
+            feature={
+                "image": tf.train.Feature(
+                    bytes_list=tf.train.BytesList(value=[image.tobytes()])
+                ),
+                "image_shape": tf.train.Feature(
+                    int64_list=tf.train.Int64List(value=image.shape)
+                ),
+                "label": tf.train.Feature(
+                    bytes_list=tf.train.BytesList(value=[label.tobytes()])
+                ),
+                "label_shape": tf.train.Feature(
+                    int64_list=tf.train.Int64List(value=label.shape)
+                ),
+            }
+        )
+    ).SerializeToString()
+
+
+def parse(
+    record: tf.Tensor,
+) -> tuple[tf.Tensor, tf.Tensor]:
+    """Parse a serialized image and label pair."""
+    example = tf.io.parse_single_example(record, FEATURES)
+    return (
+        tf.reshape(
+            tf.io.decode_raw(example["image"], tf.float32),
+            example["image_shape"],
+        ),
+        tf.reshape(
+            tf.io.decode_raw(example["label"], tf.float32),
+            example["label_shape"],
+        ),
+    )
+
+
+def write_shard(
+    shard_file: Path,
+    files: list[tuple[Path, Path]],
+    batch_size: int,
+    qi_min: float,
+    distance_max: float,
+    input_params: list[dict[str, Any]],
+    fill_value_mw: float,
+    fill_value_radar: float,
+) -> int:
+    """Load, scale, and filter data of matched files and write a shard."""
+    n_scenes = 0
+    shard_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = shard_file.with_suffix(".tmp")
+    options = tf.io.TFRecordOptions(compression_type=COMPRESSION)
+    with tf.io.TFRecordWriter(tmp_file.as_posix(), options) as writer:
+        for idx in range(0, len(files), batch_size):
+            batch = files[idx: idx + batch_size]
+            images, labels = training_data._load_data(
+                np.array([f.as_posix().encode() for f, _ in batch]),
+                np.array([f.as_posix().encode() for _, f in batch]),
+                json.dumps(input_params),
+                # same precision as when loaded by the training dataset
+                float(np.float32(qi_min)),
+                float(np.float32(distance_max)),
+                float(np.float32(fill_value_mw)),
+                float(np.float32(fill_value_radar)),
+            )
+            for image, label in zip(images, labels):
+                writer.write(serialize(image, label))
+                n_scenes += 1
+    tmp_file.replace(shard_file)
+    return n_scenes
+
+
+def build_shards(
+    training_data_path: Path,
+    shard_path: Path,
+    train_fraction: float,
+    validation_fraction: float,
+    test_fraction: float,
+    shard_size: int,
+    batch_size: int,
+    qi_min: float,
+    distance_max: float,
+    input_params: list[dict[str, Any]],
+    fill_value_mw: float,
+    fill_value_radar: float,
+    match_tolerance: float = 0.0,
+) -> ShardManifest:
+    """
+    Build shards of scaled training data, matched files not already in
+    a shard are split by the given fractions, or by the split of the
+    catalog if present, and appended as new shards.
+    """
+    manifest = ShardManifest.load(shard_path)
+    done = manifest.satellite_files
+    if (training_data_path / catalog.CATALOG_FILE).is_file():
+        splits = [
+            [
+                (s, r)
+                for s, r in training_data.get_matched_files(
+                    training_data_path, split, match_tolerance
+                )
+                if s.as_posix() not in done
+            ]
+            for split in SPLITS
+        ]
+    else:
+        splits = training_data.split_files(
+            [
+                (s, r)
+                for s, r in training_data.get_matched_files(
+                    training_data_path
+                )
+                if s.as_posix() not in done
+            ],
+            train_fraction,
+            validation_fraction,
+            test_fraction,
+        )
+    logging.info(
+        f"Found {sum(len(f) for f in splits)} matched files not in a shard."
+    )
+    for split, split_files in zip(SPLITS, splits):
+        for idx in range(0, len(split_files), shard_size):
+            chunk = split_files[idx: idx + shard_size]
+            shard_file = shard_path / SHARD_FILE.format(
+                split=split, idx=len(manifest.shards[split])
+            )
+            n_scenes = write_shard(
+                shard_file,
+                chunk,
+                batch_size,
+                qi_min,
+                distance_max,
+                input_params,
+                fill_value_mw,
+                fill_value_radar,
+            )
+            manifest.shards[split].append(
+                Shard(
+                    shard_file=shard_file.name,
+                    n_scenes=n_scenes,
+                    satellite_files=[s.as_posix() for s, _ in chunk],
+                )
+            )
+            manifest.write()
+            logging.info(f"Wrote {shard_file} to disc.")
+    return manifest
+
+
+def get_shard_dataset(
+    shard_path: Path,
+    batch_size: int,
+    dispatcher: Optional[str] = None,
+    valid_crop: Optional[ValidCrop] = None,
+) -> list[tf.data.Dataset]:
+    """
+    Get training, validation, and test dataset from shards, the training
+    data is read by the workers of the tf.data service dispatcher if given.
+    The valid crop offsets are added to the training and validation data
+    if a valid crop is given.
+    """
+    manifest = ShardManifest.load(shard_path)
+    datasets = []
+    for split in SPLITS:
+        dataset = tf.data.TFRecordDataset(
+            manifest.get_shard_files(split),
+            compression_type=COMPRESSION,
+            num_parallel_reads=tf.data.AUTOTUNE,
+        ).map(parse, num_parallel_calls=tf.data.AUTOTUNE)
+        if split == "train" and dispatcher is not None:
+            # scenes are distributed unbatched and batched by the consumer,
+            # hence the batches are independent of the number of workers
+            dataset = data_service.distribute(dataset, dispatcher)
+        dataset = dataset.batch(batch_size)
+        if valid_crop is not None and split != "test":
+            # added by the consumer, as workers can not run python functions
+            dataset = dataset.map(valid_crop.add_offsets)
+        n_scenes = sum(shard.n_scenes for shard in manifest.shards[split])
+        datasets.append(
+            dataset.apply(
+                tf.data.experimental.assert_cardinality(
+                    math.ceil(n_scenes / batch_size)
+                )
+            ).prefetch(tf.data.AUTOTUNE)
+        )
+    return datasets
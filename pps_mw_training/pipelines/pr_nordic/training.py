@@ -1,9 +1,16 @@
 from pathlib import Path
+from typing import Optional
 
 from pps_mw_training.models.trainers.unet_trainer import UnetTrainer
+from pps_mw_training.models.trainers.utils import AugmentationType
 from pps_mw_training.pipelines.pr_nordic import evaluation
 from pps_mw_training.pipelines.pr_nordic import settings
+from pps_mw_training.pipelines.pr_nordic import shards
 from pps_mw_training.pipelines.pr_nordic import training_data
+from pps_mw_training.utils.augmentation import ValidCrop
+from pps_mw_training.utils.label_encoding import LABEL_ENCODINGS
+from pps_mw_training.utils.loader import ProcessLoader
+from pps_mw_training.utils.batch_cache import BatchCache
 
 
 def train(
@@ -17,40 +24,110 @@ def train(
     n_epochs: int,
     model_config_path: Path,
     only_evaluate: bool,
+    shard_path: Optional[Path] = None,
+    dispatcher: Optional[str] = None,
 ):
     "Run the Nordic precip training pipeline."
-    train_ds, val_ds, test_ds = training_data.get_training_dataset(
-        training_data_path,
-        train_fraction,
-        validation_fraction,
-        test_fraction,
-        settings.BATCH_SIZE,
-        settings.MIN_QUALITY,
-        settings.MAX_DISTANCE,
-        settings.INPUT_PARAMS,
-        settings.FILL_VALUE_IMAGES,
-        settings.FILL_VALUE_LABELS,
+    batch_cache = (
+        BatchCache(
+            settings.BATCH_CACHE_BYTES,
+            settings.BATCH_CACHE_SPILL_PATH,
+            settings.BATCH_CACHE_SPILL_BYTES,
+        )
+        if settings.BATCH_CACHE_BYTES > 0
+        else None
     )
-    if not only_evaluate:
-        UnetTrainer.train(
+    # process loaders of the datasets, shut down when done
+    loaders: list[ProcessLoader] = []
+    # valid crop offsets are found once per loaded scene
+    valid_crop = (
+        ValidCrop(
+            settings.IMAGE_SIZE,
+            settings.FILL_VALUE_IMAGES,
+            settings.FILL_VALUE_LABELS,
+            settings.MIN_VALID_INPUT,
+            settings.MIN_VALID_LABEL,
+        )
+        if settings.AUGMENTATION_TYPE is AugmentationType.VALID_CROP_AND_FLIP
+        else None
+    )
+    if shard_path is not None:
+        # the split of the shards is set when the shards are built
+        train_ds, val_ds, test_ds = shards.get_shard_dataset(
+            shard_path,
+            settings.BATCH_SIZE,
+            dispatcher,
+            valid_crop,
+        )
+    elif dispatcher is not None:
+        raise ValueError(
+            "Data loaded from NetCDF files can not be distributed to "
+            "tf.data service workers, use prebuilt shards instead."
+        )
+    else:
+        train_ds, val_ds, test_ds = training_data.get_training_dataset(
+            training_data_path,
+            train_fraction,
+            validation_fraction,
+            test_fraction,
+            settings.BATCH_SIZE,
+            settings.MIN_QUALITY,
+            settings.MAX_DISTANCE,
             settings.INPUT_PARAMS,
-            settings.N_UNET_BASE,
-            settings.N_UNET_BLOCKS,
-            n_features,
-            n_layers,
-            settings.SUPER_RESOLUTION,
-            settings.QUANTILES,
-            train_ds,
-            val_ds,
-            n_epochs,
             settings.FILL_VALUE_IMAGES,
             settings.FILL_VALUE_LABELS,
-            settings.IMAGE_SIZE,
-            settings.AUGMENTATION_TYPE,
-            settings.INITIAL_LEARNING_RATE,
-            settings.DECAY_STEPS_FACTOR,
-            settings.ALPHA,
-            model_config_path,
+            settings.LOADER_WORKERS,
+            settings.LOADER_PREFETCH,
+            settings.IMAGE_SIZE if settings.CROP_AT_READ else None,
+            settings.MATCH_TOLERANCE,
+            batch_cache,
+            valid_crop,
+            loaders,
         )
-    model = UnetTrainer.load(model_config_path / "network_config.json")
-    evaluation.evaluate_model(model, test_ds, model_config_path)
+    try:
+        if not only_evaluate:
+            UnetTrainer.train(
+                settings.INPUT_PARAMS,
+                settings.N_UNET_BASE,
+                settings.N_UNET_BLOCKS,
+                n_features,
+                n_layers,
+                settings.SUPER_RESOLUTION,
+                settings.QUANTILES,
+                train_ds,
+                val_ds,
+                n_epochs,
+                settings.FILL_VALUE_IMAGES,
+                settings.FILL_VALUE_LABELS,
+                settings.IMAGE_SIZE,
+                (
+                    AugmentationType.FLIP
+                    if settings.CROP_AT_READ and shard_path is None
+                    else settings.AUGMENTATION_TYPE
+                ),
+                settings.INITIAL_LEARNING_RATE,
+                settings.DECAY_STEPS_FACTOR,
+                settings.ALPHA,
+                model_config_path,
+                (
+                    LABEL_ENCODINGS[settings.LABEL_ENCODING]
+                    if settings.LABEL_ENCODING is not None
+                    else None
+                ),
+                # a scene cropped at read gives a single crop
+                1 if settings.CROP_AT_READ else settings.CROPS_PER_SCENE,
+                settings.BATCH_SIZE,
+                settings.PATCH_BATCH_SIZE,
+                settings.SHUFFLE_BUFFER,
+            )
+            if batch_cache is not None:
+                batch_cache.log_stats()
+            # workers of the training and validation data are not needed
+            # by the evaluation, which starts the workers of the test data
+            for loader in loaders:
+                loader.close()
+        model = UnetTrainer.load(model_config_path / "network_config.json")
+        evaluation.evaluate_model(model, test_ds, model_config_path)
+    finally:
+        for loader in loaders:
+            loader.close()
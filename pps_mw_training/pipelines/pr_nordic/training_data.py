@@ -4,14 +4,26 @@ import datetime as dt
 import json
 import re
 
+import h5py  # type: ignore
 import numpy as np  # type: ignore
 import tensorflow as tf  # type: ignore
 import xarray as xr  # type: ignore
 
 
+from pps_mw_training.pipelines.pr_nordic.data.baltrad import BaltradReader
+from pps_mw_training.utils import catalog
+from pps_mw_training.utils.augmentation import ValidCrop
+from pps_mw_training.utils.loader import ProcessLoader
+from pps_mw_training.utils.batch_cache import BatchCache
 from pps_mw_training.utils.scaler import get_scaler
 
 
+ODIM_FILES = "comp_pcappi_blt2km_pn150_*.h5"
+# kinds of files in the catalog
+SATELLITE = "satellite"
+RADAR = "radar"
+
+
 def get_file_info(
     data_file: Path,
 ) -> Optional[dt.datetime]:
@@ -20,6 +32,12 @@ def get_file_info(
         r"[a-z]+_(?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})_(?P<hour>\d{2})_(?P<minute>\d{2})",  # noqa: E501
         data_file.stem,
     )
+    if m is None:
+        # ODIM file name, e.g. comp_pcappi_blt2km_pn150_20210101T001500Z_...
+        m = re.search(
+            r"_(?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})T(?P<hour>\d{2})(?P<minute>\d{2})\d{2}Z",  # noqa: E501
+            data_file.stem,
+        )
     if m is not None:
         d = m.groupdict()
         return dt.datetime.fromisoformat(
@@ -33,18 +51,281 @@ def match_files(
     radar_files: list[Path],
 ) -> list[tuple[Path, Path]]:
     """Get matched files."""
-    matched_files: list[tuple[Path, Path]] = []
-    radar_file_info = [get_file_info(f) for f in radar_files]
-    for satellite_file in satellite_files:
-        satellite_file_info = get_file_info(satellite_file)
-        if satellite_file_info is None:
-            continue
-        try:
-            index = radar_file_info.index(satellite_file_info)
-        except ValueError:
+    radar_file_index: dict[dt.datetime, Path] = {}
+    for radar_file in radar_files:
+        radar_file_info = get_file_info(radar_file)
+        if radar_file_info is not None:
+            radar_file_index.setdefault(radar_file_info, radar_file)
+    return [
+        (satellite_file, radar_file_index[satellite_file_info])
+        for satellite_file, satellite_file_info in (
+            (f, get_file_info(f)) for f in satellite_files
+        )
+        if satellite_file_info in radar_file_index
+    ]
+
+
+def get_radar_valid_fraction(
+    radar_file: Path,
+    qi_min: float,
+    distance_max: float,
+) -> float:
+    """Get fraction of quality filtered dBZ of a radar file."""
+    if radar_file.suffix == ".h5":
+        with BaltradReader(radar_file) as reader:
+            dbz = reader.read_masked_dbz(qi_min, distance_max)
+    else:
+        with xr.open_dataset(radar_file) as data:
+            dbz = data.dbz.values
+            if "qi" in data:
+                dbz[
+                    ~(
+                        (data.qi.values >= qi_min)
+                        & (data.distance_radar.values <= distance_max)
+                    )
+                ] = np.nan
+    return float(np.isfinite(dbz).mean())
+
+
+def _load_netcdf_data(
+    radar_files: list[str],
+    mw_y_size: int,
+    y: int,
+    x: int,
+    res: int,
+    qi_min: float,
+    distance_max: float,
+) -> np.ndarray:
+    """Load quality filtered dBZ from reformatted radar files."""
+    radar_data = xr.open_mfdataset(
+        radar_files,
+        combine="nested",
+        concat_dim="time",
+    )
+    n = radar_data.y.size // mw_y_size
+    radar_data = radar_data.sel(
+        {
+            "y": radar_data["y"].values[0: n * y: res],
+            "x": radar_data["x"].values[0: n * x: res],
+        }
+    ).load()
+    dbz = radar_data.dbz.values
+    if "qi" in radar_data:
+        # compact encoded radar data is already quality filtered
+        dbz[
+            ~(
+                (radar_data.qi >= qi_min)
+                & (radar_data.distance_radar <= distance_max)
+            )
+        ] = np.nan
+    return dbz
+
+
+def _load_odim_data(
+    radar_files: list[str],
+    mw_y_size: int,
+    y: int,
+    x: int,
+    res: int,
+    qi_min: float,
+    distance_max: float,
+) -> np.ndarray:
+    """
+    Load quality filtered dBZ from ODIM files, only the strided
+    hyperslab used for training is read.
+    """
+    dbz = []
+    for radar_file in radar_files:
+        with BaltradReader(Path(radar_file)) as reader:
+            n = reader.y_size // mw_y_size
+            dbz.append(
+                reader.read_masked_dbz(
+                    qi_min,
+                    distance_max,
+                    rows=slice(0, n * y, res),
+                    cols=slice(0, n * x, res),
+                )
+            )
+    return np.stack(dbz)
+
+
+def _load_radar_data(
+    radar_files: list[str],
+    mw_y_size: int,
+    y: int,
+    x: int,
+    res: int,
+    qi_min: float,
+    distance_max: float,
+) -> np.ndarray:
+    """
+    Load quality filtered dBZ from ODIM and reformatted radar files,
+    each file is loaded by the loader of its format.
+    """
+    is_odim = np.array([f.endswith(".h5") for f in radar_files])
+    dbz: Optional[np.ndarray] = None
+    for load, filt in [
+        (_load_odim_data, is_odim),
+        (_load_netcdf_data, ~is_odim),
+    ]:
+        if not filt.any():
             continue
-        matched_files.append((satellite_file, radar_files[index]))
-    return matched_files
+        loaded = load(
+            [f for f, f_filt in zip(radar_files, filt) if f_filt],
+            mw_y_size,
+            y,
+            x,
+            res,
+            qi_min,
+            distance_max,
+        )
+        if dbz is None:
+            dbz = np.empty((len(radar_files),) + loaded.shape[1:])
+        dbz[filt] = loaded
+    assert dbz is not None
+    return dbz
+
+
+def read_window(
+    data_file: str,
+    variable: str,
+    rows: slice,
+    cols: slice,
+) -> np.ndarray:
+    """
+    Read a window of a NetCDF4 variable by a positional hyperslab read,
+    decoded by its CF attributes where missing data is set to NaN.
+    """
+    with h5py.File(data_file, "r") as data:
+        raw = data[variable][rows, cols]
+        attrs = dict(data[variable].attrs)
+    values = raw.astype(np.float64)
+    for key in ["_FillValue", "missing_value"]:
+        if key in attrs:
+            values[raw == attrs[key]] = np.nan
+    values *= attrs.get("scale_factor", 1.)
+    values += attrs.get("add_offset", 0.)
+    return values
+
+
+def _read_crop(
+    mw_file: str,
+    radar_file: str,
+    mw_y_size: int,
+    s1: int,
+    s2: int,
+    input_params: list[dict[str, Any]],
+    image_size: int,
+    qi_min: float,
+    distance_max: float,
+    res: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Read the window of the given offset and size from a satellite
+    file, and the matching window from a radar file.
+    """
+    scaler = get_scaler(input_params)
+    rows = slice(s1, s1 + image_size)
+    cols = slice(s2, s2 + image_size)
+    bands = {
+        band: read_window(mw_file, band, rows, cols)
+        for band in {p["band"] for p in input_params}
+    }
+    mw_data = np.stack(
+        [
+            scaler.apply(bands[p["band"]][:, :, p["index"]], idx)
+            for idx, p in enumerate(input_params)
+        ],
+        axis=2,
+    )
+    if radar_file.endswith(".h5"):
+        with BaltradReader(Path(radar_file)) as reader:
+            n = reader.y_size // mw_y_size
+            dbz = reader.read_masked_dbz(
+                qi_min,
+                distance_max,
+                rows=slice(s1 * n, (s1 + image_size) * n, res),
+                cols=slice(s2 * n, (s2 + image_size) * n, res),
+            )
+        return mw_data, dbz
+    with h5py.File(radar_file, "r") as data:
+        n = data["dbz"].shape[0] // mw_y_size
+        has_quality = "qi" in data
+    radar_rows = slice(s1 * n, (s1 + image_size) * n, res)
+    radar_cols = slice(s2 * n, (s2 + image_size) * n, res)
+    dbz = read_window(radar_file, "dbz", radar_rows, radar_cols)
+    if has_quality:
+        # compact encoded radar data is already quality filtered
+        dbz[
+            ~(
+                (
+                    read_window(radar_file, "qi", radar_rows, radar_cols)
+                    >= qi_min
+                )
+                & (
+                    read_window(
+                        radar_file, "distance_radar", radar_rows, radar_cols
+                    )
+                    <= distance_max
+                )
+            )
+        ] = np.nan
+    return mw_data, dbz
+
+
+def _load_crops(
+    mw_files: np.ndarray,
+    radar_files: np.ndarray,
+    input_parameters: str,
+    qi_min: float,
+    distance_max: float,
+    fill_value_mw: float,
+    fill_value_radar: float,
+    image_size: int,
+    n: int = 16,
+    res: int = 2,
+) -> list[np.ndarray]:
+    """
+    Load, scale, and filter a random crop of each scene, offsets are
+    drawn first and only the cropped windows are read.
+    """
+    input_params = json.loads(input_parameters)
+    rng = np.random.default_rng()
+    crops = []
+    for mw_file, radar_file in zip(mw_files, radar_files):
+        mw_file = mw_file.decode("utf-8")
+        with h5py.File(mw_file, "r") as data:
+            y_size, x_size = data[input_params[0]["band"]].shape[0:2]
+        # same extent and offsets as when cropping a loaded scene
+        y = n * (y_size // n)
+        x = n * (x_size // n)
+        if min(y, x) < image_size:
+            raise ValueError(
+                f"Scene of {mw_file} of size {y}x{x} is smaller than "
+                f"the crop size {image_size}."
+            )
+        crops.append(
+            _read_crop(
+                mw_file,
+                radar_file.decode("utf-8"),
+                y_size,
+                int(rng.integers(0, y - image_size + 1)),
+                int(rng.integers(0, x - image_size + 1)),
+                input_params,
+                image_size,
+                qi_min,
+                distance_max,
+                res,
+            )
+        )
+    mw_data = np.stack([mw for mw, _ in crops])
+    dbz = np.stack([dbz for _, dbz in crops])
+    mw_data[~np.isfinite(mw_data)] = fill_value_mw
+    dbz[~np.isfinite(dbz)] = fill_value_radar
+    return [
+        mw_data.astype(np.float32),
+        np.expand_dims(dbz, axis=3).astype(np.float32),
+    ]
 
 
 def _load_data(
@@ -64,26 +345,18 @@ def _load_data(
         combine="nested",
         concat_dim="time",
     )
-    radar_data = xr.open_mfdataset(
-        [f.decode("utf-8") for f in radar_files],
-        combine="nested",
-        concat_dim="time",
-    )
     x = n * (mw_data.x.size // n)
     y = n * (mw_data.y.size // n)
-    n = radar_data.y.size // mw_data.y.size
+    radar_paths = [f.decode("utf-8") for f in radar_files]
+    dbz = _load_radar_data(
+        radar_paths, mw_data.y.size, y, x, res, qi_min, distance_max
+    )
     mw_data = mw_data.sel(
         {
             "y": mw_data["y"].values[0:y],
             "x": mw_data["x"].values[0:x],
         }
     ).load()
-    radar_data = radar_data.sel(
-        {
-            "y": radar_data["y"].values[0: n * y: res],
-            "x": radar_data["x"].values[0: n * x: res],
-        }
-    ).load()
     input_params = json.loads(input_parameters)
     scaler = get_scaler(input_params)
     mw_data = np.stack(
@@ -97,18 +370,10 @@ def _load_data(
         axis=3,
     )
     mw_data[~np.isfinite(mw_data)] = fill_value_mw
-    radar_data.dbz.values[
-        ~(
-            (radar_data.qi >= qi_min)
-            & (radar_data.distance_radar <= distance_max)
-        )
-    ] = fill_value_radar
-    radar_data.dbz.values[~np.isfinite(radar_data.dbz.values)] = (
-        fill_value_radar
-    )
+    dbz[~np.isfinite(dbz)] = fill_value_radar
     return [
         mw_data.astype(np.float32),
-        np.expand_dims(radar_data.dbz.values, axis=3).astype(np.float32),
+        np.expand_dims(dbz, axis=3).astype(np.float32),
     ]
 
 
@@ -148,6 +413,45 @@ def load_data(
     )
 
 
+@tf.function(
+    input_signature=(
+        tf.TensorSpec(shape=(None,), dtype=tf.string),
+        tf.TensorSpec(shape=(None,), dtype=tf.string),
+        tf.TensorSpec(shape=(), dtype=tf.string),
+        tf.TensorSpec(shape=(), dtype=tf.float32),
+        tf.TensorSpec(shape=(), dtype=tf.float32),
+        tf.TensorSpec(shape=(), dtype=tf.float32),
+        tf.TensorSpec(shape=(), dtype=tf.float32),
+        tf.TensorSpec(shape=(), dtype=tf.int32),
+    )
+)
+def load_crops(
+    mw_files,
+    radar_files,
+    input_params,
+    qi_min,
+    distance_max,
+    fill_value_mw,
+    fill_value_radar,
+    image_size,
+):
+    """Load random crops of netcdf dataset."""
+    return tf.numpy_function(
+        func=_load_crops,
+        inp=[
+            mw_files,
+            radar_files,
+            input_params,
+            qi_min,
+            distance_max,
+            fill_value_mw,
+            fill_value_radar,
+            image_size,
+        ],
+        Tout=[tf.float32, tf.float32],
+    )
+
+
 def _get_training_dataset(
     files: list[tuple[Path, Path]],
     batch_size: int,
@@ -156,8 +460,66 @@ def _get_training_dataset(
     input_params: str,
     fill_value_mw: float,
     fill_value_radar: float,
+    workers: int = 0,
+    prefetch: int = 2,
+    image_size: Optional[int] = None,
+    batch_cache: Optional[BatchCache] = None,
+    valid_crop: Optional[ValidCrop] = None,
+    loaders: Optional[list[ProcessLoader]] = None,
 ) -> tf.data.Dataset:
-    """Get training dataset."""
+    """
+    Get training dataset, data is loaded in a pool of worker processes
+    if workers is above 0. If an image size is given only a random crop
+    of each scene is read, else loaded batches are kept in the batch cache
+    if given, and the valid crop offsets of each loaded scene are added
+    to the data if a valid crop is given.
+    """
+    crop_args = (np.int32(image_size),) if image_size is not None else ()
+    if image_size is not None:
+        batch_cache = None
+        valid_crop = None
+    load = _load_crops if image_size is not None else _load_data
+    output_signature: tuple[tf.TensorSpec, ...] = (
+        tf.TensorSpec(
+            shape=(None, None, None, len(json.loads(input_params))),
+            dtype=tf.float32,
+        ),
+        tf.TensorSpec(shape=(None, None, None, 1), dtype=tf.float32),
+    )
+    if valid_crop is not None:
+        load = valid_crop.wrap(load)
+        output_signature += (
+            tf.TensorSpec(shape=(None, None, None), dtype=tf.bool),
+        )
+    if workers > 0:
+        loader = ProcessLoader(
+            load,
+            [
+                (
+                    np.array([f.as_posix().encode() for f, _ in batch]),
+                    np.array([f.as_posix().encode() for _, f in batch]),
+                    input_params,
+                    np.float32(qi_min),
+                    np.float32(distance_max),
+                    np.float32(fill_value_mw),
+                    np.float32(fill_value_radar),
+                    *crop_args,
+                )
+                for batch in [
+                    files[idx: idx + batch_size]
+                    for idx in range(0, len(files), batch_size)
+                ]
+            ],
+            output_signature,
+            workers,
+            prefetch,
+            cache=batch_cache,
+            # cached batches would otherwise be evicted before reused
+            shuffle=batch_cache is not None,
+        )
+        if loaders is not None:
+            loaders.append(loader)
+        return loader.get_dataset()
     ds = tf.data.Dataset.from_tensor_slices(
         (
             [f.as_posix() for f, _ in files],
@@ -165,6 +527,39 @@ def _get_training_dataset(
         )
     )
     ds = ds.batch(batch_size)
+    if batch_cache is not None:
+        # cached batches would otherwise be evicted before reused
+        ds = ds.shuffle(max(len(ds), 1), reshuffle_each_iteration=True)
+        return ds.map(
+            lambda x, y: tf.numpy_function(
+                func=batch_cache.wrap(load),
+                inp=[
+                    x,
+                    y,
+                    tf.constant(input_params),
+                    tf.constant(qi_min),
+                    tf.constant(distance_max),
+                    tf.constant(fill_value_mw),
+                    tf.constant(fill_value_radar),
+                ],
+                Tout=[s.dtype for s in output_signature],
+            ),
+            num_parallel_calls=1,
+        )
+    if image_size is not None:
+        return ds.map(
+            lambda x, y: load_crops(
+                x,
+                y,
+                tf.constant(input_params),
+                tf.constant(qi_min),
+                tf.constant(distance_max),
+                tf.constant(fill_value_mw),
+                tf.constant(fill_value_radar),
+                tf.constant(image_size),
+            ),
+            num_parallel_calls=1,
+        )
     ds = ds.map(
         lambda x, y: load_data(
             x,
@@ -177,9 +572,110 @@ def _get_training_dataset(
         ),
         num_parallel_calls=1,
     )
+    if valid_crop is not None:
+        ds = ds.map(valid_crop.add_offsets, num_parallel_calls=1)
     return ds
 
 
+def get_satellite_files(
+    training_data_path: Path,
+) -> list[Path]:
+    """Get satellite files of the training data path."""
+    return sorted((training_data_path / "satellite").glob("*.nc*"))
+
+
+def get_radar_files(
+    training_data_path: Path,
+) -> list[Path]:
+    """Get reformatted and original ODIM radar files."""
+    radar_path = training_data_path / "radar"
+    return sorted(radar_path.glob("*.nc*")) + sorted(
+        radar_path.rglob(ODIM_FILES)
+    )
+
+
+def get_matched_files(
+    training_data_path: Path,
+    split: Optional[str] = None,
+    match_tolerance: float = 0.0,
+) -> list[tuple[Path, Path]]:
+    """
+    Get matched satellite and radar files of the training data path, of
+    the given split if any. Files are matched by the catalog if present,
+    to the radar file closest in time within the tolerance [s].
+    """
+    catalog_file = training_data_path / catalog.CATALOG_FILE
+    if catalog_file.is_file():
+        return catalog.match(
+            catalog.get_files(catalog_file, SATELLITE, split),
+            catalog.get_files(catalog_file, RADAR),
+            dt.timedelta(seconds=match_tolerance),
+        )
+    return match_files(
+        get_satellite_files(training_data_path),
+        get_radar_files(training_data_path),
+    )
+
+
+def update_catalog(
+    training_data_path: Path,
+    train_fraction: float,
+    validation_fraction: float,
+    test_fraction: float,
+    qi_min: float,
+    distance_max: float,
+    valid_fraction: bool = False,
+) -> None:
+    """
+    Update catalog of the training data path, new satellite files are
+    split by the given fractions and valid fractions are optionally
+    computed.
+    """
+    catalog_file = training_data_path / catalog.CATALOG_FILE
+    catalog.update(
+        catalog_file,
+        SATELLITE,
+        get_satellite_files(training_data_path),
+        get_file_info,
+        catalog.get_valid_fraction if valid_fraction else None,
+    )
+    catalog.update(
+        catalog_file,
+        RADAR,
+        get_radar_files(training_data_path),
+        get_file_info,
+        (
+            (lambda f: get_radar_valid_fraction(f, qi_min, distance_max))
+            if valid_fraction
+            else None
+        ),
+    )
+    catalog.assign_splits(
+        catalog_file,
+        SATELLITE,
+        train_fraction,
+        validation_fraction,
+        test_fraction,
+    )
+
+
+def split_files(
+    files: list[tuple[Path, Path]],
+    train_fraction: float,
+    validation_fraction: float,
+    test_fraction: float,
+) -> list[list[tuple[Path, Path]]]:
+    """Split files into training, validation, and test files."""
+    assert train_fraction + validation_fraction + test_fraction == 1
+    train_size = int(len(files) * train_fraction)
+    validation_size = int(len(files) * validation_fraction)
+    return [
+        files[0:train_size],
+        files[train_size: train_size + validation_size],
+        files[train_size + validation_size::],
+    ]
+
+
 def get_training_dataset(
     training_data_path: Path,
     train_fraction: float,
@@ -191,17 +687,35 @@ def get_training_dataset(
     input_params: list[dict[str, Any]],
     fill_value_mw: float,
     fill_value_radar: float,
+    workers: int = 0,
+    prefetch: int = 2,
+    image_size: Optional[int] = None,
+    match_tolerance: float = 0.0,
+    batch_cache: Optional[BatchCache] = None,
+    valid_crop: Optional[ValidCrop] = None,
+    loaders: Optional[list[ProcessLoader]] = None,
 ) -> list[tf.data.Dataset]:
-    """Get training dataset."""
-    assert train_fraction + validation_fraction + test_fraction == 1
-
-    sat_files = list((training_data_path / "satellite").glob("*.nc*"))
-    radar_files = list((training_data_path / "radar").glob("*.nc*"))
-    files = match_files(sat_files, radar_files)
-
-    train_size = int(len(files) * train_fraction)
-    validation_size = int(len(files) * validation_fraction)
-
+    """
+    Get training dataset, if an image size is given only a random crop
+    of each scene is read for the training and validation dataset.
+    The split of the catalog is used if present, and batches of the
+    training dataset are kept in the batch cache if given. The valid
+    crop offsets are added to the training and validation dataset if a
+    valid crop is given. Process loaders of the datasets are added to
+    loaders if given, to be closed by the caller.
+    """
+    if (training_data_path / catalog.CATALOG_FILE).is_file():
+        splits = [
+            get_matched_files(training_data_path, split, match_tolerance)
+            for split in catalog.SPLITS
+        ]
+    else:
+        splits = split_files(
+            get_matched_files(training_data_path),
+            train_fraction,
+            validation_fraction,
+            test_fraction,
+        )
     return [
         _get_training_dataset(
             f,
@@ -211,10 +725,12 @@ def get_training_dataset(
             input_params=json.dumps(input_params),
             fill_value_mw=fill_value_mw,
             fill_value_radar=fill_value_radar,
+            workers=workers,
+            prefetch=prefetch,
+            image_size=image_size if split != "test" else None,
+            batch_cache=batch_cache if split == "train" else None,
+            valid_crop=valid_crop if split != "test" else None,
+            loaders=loaders,
         )
-        for f in [
-            files[0:train_size],
-            files[train_size: train_size + validation_size],
-            files[train_size + validation_size::],
-        ]
+        for split, f in zip(catalog.SPLITS, splits)
     ]
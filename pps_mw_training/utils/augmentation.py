@@ -1,13 +1,16 @@
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable, Sequence
+
+import numpy as np  # type: ignore
 import tensorflow as tf  # type: ignore
 
 
-@tf.function(
-    input_signature=(
-        tf.TensorSpec(shape=[None, None, None, None], dtype=tf.float32),
-        tf.TensorSpec(shape=[None, None, None, 1], dtype=tf.float32),
-        tf.TensorSpec(shape=(), dtype=tf.int32),
-    )
-)
+# labels may be of a quantized dtype, see utils.label_encoding, and the
+# augmentation is therefore traced per dtype instead of by a signature
+
+
+@tf.function(reduce_retracing=True)
 def random_crop_and_flip(
     x,
     y,
@@ -17,19 +20,13 @@ def random_crop_and_flip(
     x, y = tf.map_fn(
         lambda elems: random_crop(elems[0], elems[1], image_size),
         elems=(x, y),
-        fn_output_signature=(tf.float32, tf.float32),
+        fn_output_signature=(x.dtype, y.dtype),
     )
     x, y = random_flip(x, y)
     return x, y
 
 
-@tf.function(
-    input_signature=(
-        tf.TensorSpec(shape=[None, None, None, None], dtype=tf.float32),
-        tf.TensorSpec(shape=[None, None, None, 1], dtype=tf.float32),
-        tf.TensorSpec(shape=(), dtype=tf.int32),
-    )
-)
+@tf.function(reduce_retracing=True)
 def random_crop_and_flip_swath_centered(
     x,
     y,
@@ -44,22 +41,55 @@ def random_crop_and_flip_swath_centered(
             elems[0], elems[1], image_size
         ),
         elems=(x, y),
-        fn_output_signature=(tf.float32, tf.float32),
+        fn_output_signature=(x.dtype, y.dtype),
     )
     x, y = tf.map_fn(
         lambda elems: random_rotate_and_flip(elems[0], elems[1]),
         elems=(x, y),
-        fn_output_signature=(tf.float32, tf.float32),
+        fn_output_signature=(x.dtype, y.dtype),
+    )
+    return x, y
+
+
+@tf.function(reduce_retracing=True)
+def random_valid_crop_and_flip(
+    x,
+    y,
+    valid,
+    image_size,
+):
+    """
+    Apply random crop and flip, crops are sampled from the valid crop
+    offsets of each scene, see ValidCrop.
+    """
+    x, y = tf.map_fn(
+        lambda elems: random_valid_crop(
+            elems[0], elems[1], elems[2], image_size
+        ),
+        elems=(x, y, valid),
+        fn_output_signature=(x.dtype, y.dtype),
     )
+    x, y = random_flip(x, y)
     return x, y
 
 
-@tf.function(
-    input_signature=(
-        tf.TensorSpec(shape=[None, None, None, None], dtype=tf.float32),
-        tf.TensorSpec(shape=[None, None, None, 1], dtype=tf.float32),
+def repeat_augmentation(
+    data,
+    augment,
+    n_crops,
+):
+    """
+    Apply augment n_crops times to a batch of scenes, and concatenate
+    the results, giving n_crops independent crops of each scene.
+    """
+    crops = [augment(*data) for _ in range(n_crops)]
+    return (
+        tf.concat([x for x, _ in crops], axis=0),
+        tf.concat([y for _, y in crops], axis=0),
     )
-)
+
+
+@tf.function(reduce_retracing=True)
 def random_flip(
     x,
     y,
@@ -80,13 +110,7 @@ def random_flip(
     return x, y
 
 
-@tf.function(
-    input_signature=(
-        tf.TensorSpec(shape=[None, None, None], dtype=tf.float32),
-        tf.TensorSpec(shape=[None, None, 1], dtype=tf.float32),
-        tf.TensorSpec(shape=(), dtype=tf.int32),
-    )
-)
+@tf.function(reduce_retracing=True)
 def random_crop(
     x,
     y,
@@ -119,13 +143,125 @@ def random_crop(
     )
 
 
-@tf.function(
-    input_signature=(
-        tf.TensorSpec(shape=[None, None, None], dtype=tf.float32),
-        tf.TensorSpec(shape=[None, None, 1], dtype=tf.float32),
-        tf.TensorSpec(shape=(), dtype=tf.int32),
+def get_window_fraction(
+    mask: np.ndarray,
+    size: int,
+    stride: int,
+) -> np.ndarray:
+    """
+    Get fraction of True values of 2D masks, of the last two axes, within
+    square windows of given size, at offsets of given stride, by a
+    summed-area table.
+    """
+    s = np.pad(
+        np.cumsum(np.cumsum(mask, axis=-2, dtype=np.int64), axis=-1),
+        [(0, 0)] * (mask.ndim - 2) + [(1, 0), (1, 0)],
     )
-)
+    return (
+        s[..., size::stride, size::stride]
+        - s[..., :-size:stride, size::stride]
+        - s[..., size::stride, :-size:stride]
+        + s[..., :-size:stride, :-size:stride]
+    ) / (size * size)
+
+
+def _add_valid_offsets(
+    valid_crop: "ValidCrop",
+    func: Callable[..., Sequence[np.ndarray]],
+    *args: Any,
+) -> list[np.ndarray]:
+    x, y = func(*args)
+    return [x, y, valid_crop.get_offsets(x, y)]
+
+
+@dataclass(frozen=True)
+class ValidCrop:
+    """
+    Crops sampled from the offsets where the fractions of valid input and
+    label data reach given minimums, or from all offsets of a scene if
+    there is no such offset. The valid offsets are found once per loaded
+    scene, and are kept with the scene as a third array of the data.
+    """
+
+    image_size: int
+    fill_value_x: float
+    fill_value_y: float
+    min_valid_x: float
+    min_valid_y: float
+
+    def get_offsets(
+        self,
+        x: np.ndarray,
+        y: np.ndarray,
+    ) -> np.ndarray:
+        """Get mask of the valid crop offsets of a batch of scenes."""
+        n = y.shape[1] // x.shape[1]
+        valid = (
+            get_window_fraction(
+                np.all(x != x.dtype.type(self.fill_value_x), axis=3),
+                self.image_size,
+                1,
+            ) >= self.min_valid_x
+        ) & (
+            get_window_fraction(
+                y[:, :, :, 0] != y.dtype.type(self.fill_value_y),
+                self.image_size * n,
+                n,
+            ) >= self.min_valid_y
+        )
+        valid[~np.any(valid, axis=(1, 2))] = True
+        return valid
+
+    def wrap(
+        self,
+        func: Callable[..., Sequence[np.ndarray]],
+    ) -> Callable[..., list[np.ndarray]]:
+        """Get func loading scenes, followed by their valid offsets."""
+        # a partial of module level functions can be sent to workers
+        return partial(_add_valid_offsets, self, func)
+
+    def add_offsets(
+        self,
+        x: tf.Tensor,
+        y: tf.Tensor,
+    ) -> tuple[tf.Tensor, tf.Tensor, tf.Tensor]:
+        """Add valid offsets to a batch of scenes of a dataset."""
+        valid = tf.numpy_function(self.get_offsets, [x, y], tf.bool)
+        valid.set_shape([None, None, None])
+        return x, y, valid
+
+
+@tf.function(reduce_retracing=True)
+def random_valid_crop(
+    x,
+    y,
+    valid,
+    image_size,
+):
+    """Random crop of data, at an offset sampled from the valid offsets."""
+    x_shape = tf.shape(x)
+    y_shape = tf.shape(y)
+    n1 = tf.cast(y_shape[0] / x_shape[0], tf.int32)
+    n2 = tf.cast(y_shape[1] / x_shape[1], tf.int32)
+    offsets = tf.cast(tf.where(tf.reshape(valid, [-1]))[:, 0], tf.int32)
+    idx = offsets[
+        tf.random.uniform(
+            (), maxval=tf.size(offsets), dtype=tf.dtypes.int32
+        )
+    ]
+    s1 = idx // tf.shape(valid)[1]
+    s2 = idx % tf.shape(valid)[1]
+    return (
+        x[s1: s1 + image_size, s2: s2 + image_size, :],
+        y[
+            s1 * n1: (s1 + image_size) * n1,
+            s2 * n2: (s2 + image_size) * n2,
+            :,
+        ],
+    )
+
+
+@tf.function(reduce_retracing=True)
 def random_crop_swath_centered(x, y, image_size):
     """Random crop of data, always centered around the x-axis."""
 
@@ -174,12 +310,27 @@ def set_missing_data(
     )
 
 
-@tf.function(
-    input_signature=(
-        tf.TensorSpec(shape=[None, None, None], dtype=tf.float32),
-        tf.TensorSpec(shape=[None, None, 1], dtype=tf.float32),
-    )
-)
+@tf.function
+def add_noise(
+    x: tf.Tensor,
+    sigma: tf.Tensor,
+) -> tf.Tensor:
+    """Add normal distributed noise, of a sigma given per column."""
+    return x + sigma * tf.random.normal(shape=tf.shape(x), dtype=x.dtype)
+
+
+@tf.function
+def add_noise_and_missing_data(
+    x: tf.Tensor,
+    sigma: tf.Tensor,
+    missing_fraction: float,
+    fill_value: float,
+) -> tf.Tensor:
+    """Add noise and set a fraction of the noisy data to a fill value."""
+    return set_missing_data(add_noise(x, sigma), missing_fraction, fill_value)
+
+
+@tf.function(reduce_retracing=True)
 def random_rotate_and_flip(
     x,
     y,
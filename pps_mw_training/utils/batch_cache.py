@@ -0,0 +1,168 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Optional, Sequence
+import hashlib
+import logging
+import pickle
+
+import numpy as np  # type: ignore
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheStats:
+    """Number of hits in memory and on disk, misses, and evictions."""
+
+    hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+@dataclass
+class BatchCache:
+    """
+    Cache of batches of decoded and scaled scenes, keyed by the arguments
+    loading a batch, hence a cached batch is only reused for the same
+    scenes. The batches of a dataset are therefore of the same scenes
+    every epoch, only the order of the batches is shuffled, and scenes
+    are never reshuffled across batches. Least recently used batches are
+    evicted when the cache exceeds max_bytes. Evicted batches are spilled
+    to files in spill_path, up to max_spill_bytes, if a path is given.
+    """
+
+    max_bytes: int
+    spill_path: Optional[Path] = None
+    max_spill_bytes: int = 0
+    stats: CacheStats = field(default_factory=CacheStats)
+    n_bytes: int = field(default=0, init=False)
+    n_spill_bytes: int = field(default=0, init=False)
+    _batches: OrderedDict[str, tuple[np.ndarray, ...]] = field(
+        default_factory=OrderedDict, init=False, repr=False
+    )
+    # number of arrays, and bytes, of each spilled key
+    _spilled: OrderedDict[str, tuple[int, int]] = field(
+        default_factory=OrderedDict, init=False, repr=False
+    )
+    _lock: Lock = field(default_factory=Lock, init=False, repr=False)
+
+    @staticmethod
+    def get_key(
+        *args: Any,
+    ) -> str:
+        """Get key of the batch loaded by the given arguments."""
+        return hashlib.sha1(pickle.dumps(args)).hexdigest()
+
+    def _get_spill_files(
+        self,
+        key: str,
+        n_arrays: int,
+    ) -> list[Path]:
+        assert self.spill_path is not None
+        return [self.spill_path / f"{key}_{idx}.npy" for idx in range(n_arrays)]
+
+    def _spill(
+        self,
+        key: str,
+        arrays: tuple[np.ndarray, ...],
+    ) -> None:
+        n_bytes = sum(a.nbytes for a in arrays)
+        if self.spill_path is None or n_bytes > self.max_spill_bytes:
+            return
+        self.spill_path.mkdir(parents=True, exist_ok=True)
+        for spill_file, array in zip(
+            self._get_spill_files(key, len(arrays)), arrays
+        ):
+            np.save(spill_file, array)
+        self._spilled[key] = (len(arrays), n_bytes)
+        self.n_spill_bytes += n_bytes
+        while self.n_spill_bytes > self.max_spill_bytes:
+            self._unspill(next(iter(self._spilled)), load=False)
+
+    def _unspill(
+        self,
+        key: str,
+        load: bool = True,
+    ) -> tuple[np.ndarray, ...]:
+        n_arrays, n_bytes = self._spilled.pop(key)
+        arrays = []
+        for spill_file in self._get_spill_files(key, n_arrays):
+            if load:
+                arrays.append(np.load(spill_file))
+            spill_file.unlink()
+        self.n_spill_bytes -= n_bytes
+        return tuple(arrays)
+
+    def get(
+        self,
+        key: str,
+    ) -> Optional[tuple[np.ndarray, ...]]:
+        """Get cached batch, or None if not cached."""
+        with self._lock:
+            if key in self._batches:
+                self._batches.move_to_end(key)
+                self.stats.hits += 1
+                return self._batches[key]
+            if key in self._spilled:
+                self.stats.disk_hits += 1
+                arrays = self._unspill(key)
+                self._put(key, arrays)
+                return arrays
+            self.stats.misses += 1
+            return None
+
+    def _put(
+        self,
+        key: str,
+        arrays: tuple[np.ndarray, ...],
+    ) -> None:
+        n_bytes = sum(a.nbytes for a in arrays)
+        if n_bytes > self.max_bytes:
+            return
+        self._batches[key] = arrays
+        self.n_bytes += n_bytes
+        while self.n_bytes > self.max_bytes:
+            evicted_key, evicted = self._batches.popitem(last=False)
+            self.n_bytes -= sum(a.nbytes for a in evicted)
+            self.stats.evictions += 1
+            self._spill(evicted_key, evicted)
+
+    def put(
+        self,
+        key: str,
+        arrays: Sequence[np.ndarray],
+    ) -> None:
+        """Cache batch, evicting the least recently used if full."""
+        with self._lock:
+            if key not in self._batches:
+                self._put(key, tuple(arrays))
+
+    def wrap(
+        self,
+        func: Callable[..., Sequence[np.ndarray]],
+    ) -> Callable[..., tuple[np.ndarray, ...]]:
+        """Get func returning the cached batch if loaded before."""
+
+        def cached_func(*args: Any) -> tuple[np.ndarray, ...]:
+            key = self.get_key(*args)
+            arrays = self.get(key)
+            if arrays is None:
+                arrays = tuple(func(*args))
+                self.put(key, arrays)
+            return arrays
+
+        return cached_func
+
+    def log_stats(self) -> None:
+        """Log hits, misses, and size of the cache."""
+        logging.info(
+            f"Batch cache hits: {self.stats.hits} in memory, "
+            f"{self.stats.disk_hits} on disk, misses: {self.stats.misses}, "
+            f"cached: {self.n_bytes / 1e9:.2f} GB in memory, "
+            f"{self.n_spill_bytes / 1e9:.2f} GB on disk."
+        )
@@ -0,0 +1,212 @@
+from contextlib import closing
+from pathlib import Path
+from typing import Callable, Optional
+import datetime as dt
+import logging
+import sqlite3
+
+import numpy as np  # type: ignore
+import xarray as xr  # type: ignore
+
+
+CATALOG_FILE = "catalog.sqlite"
+SPLITS = ["train", "validation", "test"]
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    time TEXT,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    valid_fraction REAL,
+    split TEXT
+);
+CREATE INDEX IF NOT EXISTS files_kind_time ON files (kind, time, path);
+"""
+# files are ordered by time, and by path if the time is unknown
+ORDER = "ORDER BY time IS NULL, time, path"
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def connect(
+    catalog_file: Path,
+) -> sqlite3.Connection:
+    """Connect to catalog, the catalog is created if missing."""
+    connection = sqlite3.connect(catalog_file)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def get_valid_fraction(
+    data_file: Path,
+    variables: Optional[list[str]] = None,
+    fill_value: Optional[float] = None,
+) -> float:
+    """Get fraction of finite values, not equal to the fill value."""
+    with xr.open_dataset(data_file) as data:
+        fractions = []
+        for variable in variables or [str(v) for v in data.data_vars]:
+            values = data[variable].values
+            valid = np.isfinite(values)
+            if fill_value is not None:
+                valid &= values != fill_value
+            fractions.append(valid.mean())
+    return float(np.mean(fractions))
+
+
+def update(
+    catalog_file: Path,
+    kind: str,
+    files: list[Path],
+    get_time: Callable[[Path], Optional[dt.datetime]],
+    get_valid_fraction: Optional[Callable[[Path], float]] = None,
+) -> int:
+    """
+    Update catalog of files of the given kind, new and changed files are
+    added and missing files removed. The split of a changed file is kept.
+    """
+    with closing(connect(catalog_file)) as connection, connection:
+        known = {
+            path: (size, mtime)
+            for path, size, mtime in connection.execute(
+                "SELECT path, size, mtime FROM files WHERE kind = ?",
+                (kind,),
+            )
+        }
+        n_updated = 0
+        for data_file in files:
+            path = data_file.absolute().as_posix()
+            stat = data_file.stat()
+            if known.pop(path, None) == (stat.st_size, stat.st_mtime):
+                continue
+            time = get_time(data_file)
+            connection.execute(
+                "INSERT INTO files "
+                "(path, kind, time, size, mtime, valid_fraction) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET "
+                "time = excluded.time, size = excluded.size, "
+                "mtime = excluded.mtime, "
+                "valid_fraction = excluded.valid_fraction",
+                (
+                    path,
+                    kind,
+                    time.isoformat() if time is not None else None,
+                    stat.st_size,
+                    stat.st_mtime,
+                    (
+                        get_valid_fraction(data_file)
+                        if get_valid_fraction is not None
+                        else None
+                    ),
+                ),
+            )
+            n_updated += 1
+        connection.executemany(
+            "DELETE FROM files WHERE path = ?", [(p,) for p in known]
+        )
+    logging.info(
+        f"Updated {n_updated} and removed {len(known)} {kind} files "
+        f"in {catalog_file}."
+    )
+    return n_updated
+
+
+def assign_splits(
+    catalog_file: Path,
+    kind: str,
+    train_fraction: float,
+    validation_fraction: float,
+    test_fraction: float,
+) -> None:
+    """Split files of the given kind not already assigned to a split."""
+    assert train_fraction + validation_fraction + test_fraction == 1
+    with closing(connect(catalog_file)) as connection, connection:
+        paths = [
+            path for path, in connection.execute(
+                f"SELECT path FROM files WHERE kind = ? AND split IS NULL "
+                f"{ORDER}",
+                (kind,),
+            )
+        ]
+        train_size = int(len(paths) * train_fraction)
+        validation_size = int(len(paths) * validation_fraction)
+        connection.executemany(
+            "UPDATE files SET split = ? WHERE path = ?",
+            [
+                (
+                    SPLITS[
+                        (idx >= train_size)
+                        + (idx >= train_size + validation_size)
+                    ],
+                    path,
+                )
+                for idx, path in enumerate(paths)
+            ],
+        )
+
+
+def get_files(
+    catalog_file: Path,
+    kind: str,
+    split: Optional[str] = None,
+    min_valid_fraction: Optional[float] = None,
+) -> list[tuple[Path, Optional[dt.datetime]]]:
+    """Get files and times of the given kind, ordered by time."""
+    query = "SELECT path, time FROM files WHERE kind = ?"
+    params: list = [kind]
+    if split is not None:
+        query += " AND split = ?"
+        params.append(split)
+    if min_valid_fraction is not None:
+        query += " AND valid_fraction >= ?"
+        params.append(min_valid_fraction)
+    with closing(connect(catalog_file)) as connection:
+        return [
+            (
+                Path(path),
+                dt.datetime.fromisoformat(time) if time is not None else None,
+            )
+            for path, time in connection.execute(f"{query} {ORDER}", params)
+        ]
+
+
+def match(
+    files: list[tuple[Path, Optional[dt.datetime]]],
+    other_files: list[tuple[Path, Optional[dt.datetime]]],
+    tolerance: dt.timedelta = dt.timedelta(0),
+) -> list[tuple[Path, Path]]:
+    """
+    Match files to the other file closest in time, within the tolerance,
+    by a sorted join of files ordered by time.
+    """
+    timed = [(f, t) for f, t in files if t is not None]
+    other_timed = sorted(
+        [(f, t) for f, t in other_files if t is not None],
+        key=lambda f: f[1],
+    )
+    if not timed or not other_timed:
+        return []
+    times = np.array([t for _, t in timed], dtype="datetime64[us]")
+    other_times = np.array(
+        [t for _, t in other_timed], dtype="datetime64[us]"
+    )
+    # closest of the other file at or after and the one before each time
+    after = np.clip(
+        np.searchsorted(other_times, times), 0, other_times.size - 1
+    )
+    before = np.clip(after - 1, 0, other_times.size - 1)
+    index = np.where(
+        np.abs(other_times[before] - times)
+        < np.abs(other_times[after] - times),
+        before,
+        after,
+    )
+    within = np.abs(other_times[index] - times) <= np.timedelta64(tolerance)
+    return [
+        (timed[idx][0], other_timed[index[idx]][0])
+        for idx in np.flatnonzero(within)
+    ]
@@ -0,0 +1,156 @@
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from multiprocessing import get_context
+from multiprocessing.process import BaseProcess
+from typing import Iterator, Optional
+import logging
+import socket
+
+import tensorflow as tf  # type: ignore
+
+
+# ops calling Python functions, e.g. by tf.numpy_function, these can only
+# be run in the process where the function is defined
+PYTHON_FUNCTION_OPS = {"PyFunc", "PyFuncStateless", "EagerPyFunc"}
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def start_dispatcher(
+    port: int = 0,
+) -> tf.data.experimental.service.DispatchServer:
+    """Start a dispatcher, at a free port if port is 0."""
+    dispatcher = tf.data.experimental.service.DispatchServer(
+        tf.data.experimental.service.DispatcherConfig(port=port)
+    )
+    logging.info(f"Started tf.data service dispatcher at {dispatcher.target}.")
+    return dispatcher
+
+
+def serve_dispatcher(
+    port: int,
+) -> None:
+    """Start a dispatcher and serve until killed."""
+    start_dispatcher(port).join()
+
+
+def serve_worker(
+    dispatcher: str,
+    port: int = 0,
+) -> None:
+    """Start a worker of the given dispatcher and serve until killed."""
+    worker = tf.data.experimental.service.WorkerServer(
+        tf.data.experimental.service.WorkerConfig(
+            dispatcher_address=dispatcher.split("://")[-1],
+            port=port,
+        )
+    )
+    logging.info(f"Started tf.data service worker of {dispatcher}.")
+    worker.join()
+
+
+def get_free_port() -> int:
+    """Get a port that is free on the local host."""
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+@dataclass
+class LocalCluster:
+    """
+    Dispatcher and worker processes on the local host, the dispatcher is
+    served at a free port if port is 0.
+    """
+
+    n_workers: int
+    port: int = 0
+    processes: list[BaseProcess] = field(default_factory=list)
+
+    def __enter__(self) -> "LocalCluster":
+        if self.port == 0:
+            self.port = get_free_port()
+        context = get_context("spawn")
+        self.processes.append(
+            context.Process(
+                target=serve_dispatcher,
+                args=(self.port,),
+                daemon=True,
+            )
+        )
+        # workers retry until the dispatcher is served
+        for _ in range(self.n_workers):
+            self.processes.append(
+                context.Process(
+                    target=serve_worker,
+                    args=(self.target,),
+                    daemon=True,
+                )
+            )
+        for process in self.processes:
+            process.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        for process in self.processes:
+            process.terminate()
+            process.join()
+        self.processes.clear()
+
+    @property
+    def target(self) -> str:
+        """Get address of the dispatcher."""
+        return f"grpc://localhost:{self.port}"
+
+
+@contextmanager
+def get_dispatcher(
+    dispatcher: Optional[str],
+    n_local_workers: int,
+) -> Iterator[Optional[str]]:
+    """
+    Get address of the given dispatcher, or of a local cluster of
+    n_local_workers workers if n_local_workers > 0.
+    """
+    if n_local_workers > 0:
+        with LocalCluster(n_local_workers) as cluster:
+            yield cluster.target
+    else:
+        yield dispatcher
+
+
+def uses_python_functions(
+    dataset: tf.data.Dataset,
+) -> bool:
+    """Check if the graph of the dataset calls Python functions."""
+    graph_def = tf.compat.v1.GraphDef()
+    graph_def.ParseFromString(dataset._as_serialized_graph().numpy())
+    ops = {node.op for node in graph_def.node} | {
+        node.op
+        for function in graph_def.library.function
+        for node in function.node_def
+    }
+    return not ops.isdisjoint(PYTHON_FUNCTION_OPS)
+
+
+def distribute(
+    dataset: tf.data.Dataset,
+    dispatcher: str,
+) -> tf.data.Dataset:
+    """
+    Get dataset produced by the workers of the dispatcher, each element
+    of an epoch is produced once by any of the workers.
+    """
+    if uses_python_functions(dataset):
+        raise ValueError(
+            "Dataset calls Python functions and can not be distributed "
+            "to tf.data service workers, use prebuilt shards instead."
+        )
+    return dataset.apply(
+        tf.data.experimental.service.distribute(
+            processing_mode=tf.data.experimental.service.ShardingPolicy.DYNAMIC,
+            service=dispatcher,
+        )
+    )
@@ -0,0 +1,63 @@
+from dataclasses import dataclass
+
+import tensorflow as tf  # type: ignore
+
+
+@dataclass(frozen=True)
+class LabelEncoding:
+    """
+    Quantized encoding of labels passed through the input pipeline,
+    the fill code is reserved for the fill value.
+    """
+
+    dtype: str
+    scale_factor: float
+    add_offset: float
+    fill_code: int
+
+    @property
+    def code_range(self) -> tuple[int, int]:
+        """Get range of codes not reserved for the fill value."""
+        dtype = tf.dtypes.as_dtype(self.dtype)
+        return (
+            dtype.min + int(self.fill_code == dtype.min),
+            dtype.max - int(self.fill_code == dtype.max),
+        )
+
+    def encode(
+        self,
+        y: tf.Tensor,
+        fill_value: float,
+    ) -> tf.Tensor:
+        """Encode labels, values outside the code range are clipped."""
+        code_min, code_max = self.code_range
+        code = tf.clip_by_value(
+            tf.round((y - self.add_offset) / self.scale_factor),
+            float(code_min),
+            float(code_max),
+        )
+        return tf.cast(
+            tf.where(y == fill_value, float(self.fill_code), code),
+            self.dtype,
+        )
+
+    def decode(
+        self,
+        y: tf.Tensor,
+        fill_value: float,
+    ) -> tf.Tensor:
+        """Decode labels to float32."""
+        y = tf.cast(y, tf.float32)
+        return tf.where(
+            y == self.fill_code,
+            fill_value,
+            y * self.scale_factor + self.add_offset,
+        )
+
+
+LABEL_ENCODINGS = {
+    # radar reflectivity [dBZ] by the Baltrad gain and offset
+    "dbz_uint8": LabelEncoding("uint8", 0.5, -32.0, 255),
+    # labels min max scaled to [-1, 1]
+    "scaled_int16": LabelEncoding("int16", 1 / 32000, 0.0, -32768),
+}
@@ -0,0 +1,160 @@
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import cached_property
+from multiprocessing import get_context, shared_memory
+from typing import Any, Callable, Iterator, Optional, Sequence, Union
+import logging
+import random
+
+import numpy as np  # type: ignore
+import tensorflow as tf  # type: ignore
+
+from pps_mw_training.utils.batch_cache import BatchCache
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# name, shape, and dtype of an array held in shared memory
+SharedArray = tuple[str, tuple[int, ...], str]
+
+
+def to_shared_memory(
+    func: Callable[..., Sequence[np.ndarray]],
+    args: tuple[Any, ...],
+) -> list[SharedArray]:
+    """Call func in a worker and put resulting arrays in shared memory."""
+    shared = []
+    for array in func(*args):
+        array = np.ascontiguousarray(array)
+        shm = shared_memory.SharedMemory(
+            create=True, size=max(array.nbytes, 1)
+        )
+        np.ndarray(array.shape, array.dtype, buffer=shm.buf)[...] = array
+        shared.append((shm.name, array.shape, array.dtype.str))
+        shm.close()
+    return shared
+
+
+def from_shared_memory(
+    shared: list[SharedArray],
+) -> tuple[np.ndarray, ...]:
+    """Get arrays from shared memory, and release the shared memory."""
+    arrays: list[np.ndarray] = []
+    for name, shape, dtype in shared:
+        shm = shared_memory.SharedMemory(name=name)
+        arrays.append(np.ndarray(shape, dtype, buffer=shm.buf).copy())
+        shm.close()
+        shm.unlink()
+    return tuple(arrays)
+
+
+@dataclass
+class LoaderStats:
+    """Number of steps, and of steps where no batch was ready."""
+
+    n_steps: int = 0
+    n_input_bound: int = 0
+
+
+@dataclass
+class ProcessLoader:
+    """
+    Loader running func for each batch of args in a pool of worker
+    processes, finished batches are handed over through shared memory.
+
+    func must be a module level function, as it is sent to spawned
+    workers, and return a sequence of arrays. Loaded batches are kept
+    in the cache if given, and the order of the batches is shuffled
+    each epoch if shuffle is set.
+    """
+
+    func: Callable[..., Sequence[np.ndarray]]
+    batches: list[tuple[Any, ...]]
+    output_signature: tuple[tf.TensorSpec, ...]
+    workers: int
+    prefetch: int
+    stats: LoaderStats = field(default_factory=LoaderStats)
+    cache: Optional[BatchCache] = None
+    shuffle: bool = False
+
+    @cached_property
+    def _executor(self) -> ProcessPoolExecutor:
+        # workers are kept alive between epochs
+        return ProcessPoolExecutor(
+            self.workers, mp_context=get_context("spawn")
+        )
+
+    def _submit(
+        self,
+        args: tuple[Any, ...],
+    ) -> tuple[str, Union[Future, tuple[np.ndarray, ...]]]:
+        """Get cached arrays of the batch, or submit loading of it."""
+        key = ""
+        if self.cache is not None:
+            key = self.cache.get_key(*args)
+            arrays = self.cache.get(key)
+            if arrays is not None:
+                return key, arrays
+        return key, self._executor.submit(to_shared_memory, self.func, args)
+
+    def __call__(self) -> Iterator[tuple[np.ndarray, ...]]:
+        """Generate batches, keeping prefetch batches in flight."""
+        stats = LoaderStats()
+        order = list(range(len(self.batches)))
+        if self.shuffle:
+            random.shuffle(order)
+        batches = (self.batches[idx] for idx in order)
+        pending: deque[
+            tuple[str, Union[Future, tuple[np.ndarray, ...]]]
+        ] = deque(
+            self._submit(args)
+            for _, args in zip(range(max(self.prefetch, 1)), batches)
+        )
+        try:
+            while pending:
+                key, result = pending.popleft()
+                stats.n_steps += 1
+                if isinstance(result, Future):
+                    if not result.done():
+                        stats.n_input_bound += 1
+                    arrays = from_shared_memory(result.result())
+                    if self.cache is not None:
+                        self.cache.put(key, arrays)
+                else:
+                    arrays = result
+                for args in batches:
+                    pending.append(self._submit(args))
+                    break
+                yield arrays
+        finally:
+            # release shared memory of batches not consumed
+            for _, result in pending:
+                if (
+                    isinstance(result, Future)
+                    and not result.cancel()
+                    and result.exception() is None
+                ):
+                    from_shared_memory(result.result())
+            self.stats.n_steps += stats.n_steps
+            self.stats.n_input_bound += stats.n_input_bound
+            logging.info(
+                f"{stats.n_input_bound} of {stats.n_steps} steps were "
+                "input bound."
+            )
+            if self.cache is not None:
+                self.cache.log_stats()
+
+    def close(self) -> None:
+        """Shut down workers."""
+        executor = self.__dict__.pop("_executor", None)
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    def get_dataset(self) -> tf.data.Dataset:
+        """Get dataset of the batches, of known cardinality."""
+        return tf.data.Dataset.from_generator(
+            self, output_signature=self.output_signature
+        ).apply(tf.data.experimental.assert_cardinality(len(self.batches)))
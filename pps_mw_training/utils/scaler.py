@@ -8,6 +8,38 @@ import numpy as np  # type: ignore
 MIN_VALUE = 1e-6
 
 
+def get_float_type(
+    x: np.ndarray,
+) -> np.typing.DTypeLike:
+    """Get float type of scaled data, the type of the data if float."""
+    return x.dtype if np.issubdtype(x.dtype, np.floating) else np.float64
+
+
+def check_linear_scale(
+    sigma: np.ndarray,
+    apply_log_scale: Optional[np.ndarray],
+) -> None:
+    """Check that noise is only of linearly scaled columns."""
+    if apply_log_scale is not None and np.any(
+        (np.asarray(sigma) != 0) & apply_log_scale
+    ):
+        raise ValueError("Noise can only be added to linearly scaled data")
+
+
+def log_scale_columns(
+    x: np.ndarray,
+    apply_log_scale: Optional[np.ndarray],
+) -> np.ndarray:
+    """Get log of the columns to log scale, of a copy of the data."""
+    if apply_log_scale is None or not np.any(apply_log_scale):
+        return x
+    x = np.array(x, dtype=get_float_type(x))
+    columns = x[:, apply_log_scale]
+    columns[columns <= 0.0] = MIN_VALUE
+    x[:, apply_log_scale] = np.log(columns)
+    return x
+
+
 @dataclass
 class MinMaxScaler:
     """Scaler class for Min Max Scaling"""
@@ -58,9 +90,11 @@ class MinMaxScaler:
             ymin = self.get_ymin(idx)
             gain = self.get_gain(idx)
             return ymin + gain * (x - xoffset)
-
-        return np.column_stack(
-            [self.apply(x[:, idx], idx) for idx in range(x.shape[1])]
+        # all columns at once, in the float type of the data
+        dtype = get_float_type(x)
+        x = log_scale_columns(x, self.apply_log_scale)
+        return self.ymin.astype(dtype) + self.gain.astype(dtype) * (
+            x - self.xoffset.astype(dtype)
         )
 
     def reverse(
@@ -82,6 +116,14 @@ class MinMaxScaler:
             [self.reverse(y[:, idx], idx) for idx in range(y.shape[1])]
         )
 
+    def scale_sigma(
+        self,
+        sigma: np.ndarray,
+    ) -> np.ndarray:
+        """Get sigma of noise of each column after forward scaling."""
+        check_linear_scale(sigma, self.apply_log_scale)
+        return sigma * self.gain
+
     @staticmethod
     def get_min_value(param: dict[str, str | float]) -> float:
         """Get min value from dict."""
@@ -149,10 +191,10 @@ class StandardScaler:
                 x[x <= 0.0] = MIN_VALUE
                 x = np.log(x)
             return (x - self.mean[idx]) / self.std[idx]
-
-        return np.column_stack(
-            [self.apply(x[:, idx], idx) for idx in range(x.shape[1])]
-        )
+        # all columns at once, in the float type of the data
+        dtype = get_float_type(x)
+        x = log_scale_columns(x, self.apply_log_scale)
+        return (x - self.mean.astype(dtype)) / self.std.astype(dtype)
 
     def reverse(
         self,
@@ -169,6 +211,14 @@ class StandardScaler:
             [self.reverse(y[:, idx], idx) for idx in range(y.shape[1])]
         )
 
+    def scale_sigma(
+        self,
+        sigma: np.ndarray,
+    ) -> np.ndarray:
+        """Get sigma of noise of each column after forward scaling."""
+        check_linear_scale(sigma, self.apply_log_scale)
+        return sigma / self.std
+
     @staticmethod
     def get_mean(
         x: np.ndarray,
@@ -0,0 +1,113 @@
+from dataclasses import dataclass
+from typing import Iterator, Union
+import math
+import random
+
+import numpy as np  # type: ignore
+import tensorflow as tf  # type: ignore
+import xarray as xr  # type: ignore
+
+from pps_mw_training.utils.scaler import MinMaxScaler, StandardScaler
+
+
+@dataclass
+class ChunkStream:
+    """
+    Stream of scaled input and output batches of one or many datasets,
+    read in chunks along the sample dimension. Chunks are read in random
+    order and samples shuffled through a buffer of shuffle_buffer samples,
+    if shuffle is set, hence memory use is independent of the dataset size.
+    """
+
+    datasets: list[xr.Dataset]
+    input_params: list[str]
+    output_params: list[str]
+    input_scaler: Union[MinMaxScaler, StandardScaler]
+    output_scaler: Union[MinMaxScaler, StandardScaler]
+    batch_size: int
+    chunk_size: int
+    shuffle_buffer: int = 0
+    shuffle: bool = True
+    dimension: str = "number_structures_db"
+
+    @property
+    def n_samples(self) -> int:
+        """Get number of samples of all datasets."""
+        return sum(d.sizes[self.dimension] for d in self.datasets)
+
+    def __len__(self) -> int:
+        """Get number of batches of an epoch."""
+        return math.ceil(self.n_samples / self.batch_size)
+
+    def _read_chunk(
+        self,
+        dataset: xr.Dataset,
+        start: int,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Read and scale a chunk of the dataset."""
+        chunk = dataset.isel(
+            {self.dimension: slice(start, start + self.chunk_size)}
+        )
+        x = np.column_stack(
+            [chunk[param].values for param in self.input_params]
+        ).astype(np.float32)
+        y = np.column_stack(
+            [chunk[param].values for param in self.output_params]
+        ).astype(np.float32)
+        return (
+            self.input_scaler.apply(x).astype(np.float32, copy=False),
+            self.output_scaler.apply(y).astype(np.float32, copy=False),
+        )
+
+    def __call__(self) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+        """Generate batches, of all samples of the datasets once."""
+        rng = np.random.default_rng()
+        chunks = [
+            (dataset, start)
+            for dataset in self.datasets
+            for start in range(
+                0, dataset.sizes[self.dimension], self.chunk_size
+            )
+        ]
+        if self.shuffle:
+            random.shuffle(chunks)
+        buffered: list[tuple[np.ndarray, np.ndarray]] = []
+        n_buffered = 0
+        for idx, (dataset, start) in enumerate(chunks):
+            chunk = self._read_chunk(dataset, start)
+            buffered.append(chunk)
+            n_buffered += chunk[0].shape[0]
+            last = idx == len(chunks) - 1
+            if n_buffered < max(self.shuffle_buffer, self.batch_size) and (
+                not last
+            ):
+                continue
+            x = np.concatenate([b[0] for b in buffered])
+            y = np.concatenate([b[1] for b in buffered])
+            if self.shuffle:
+                order = rng.permutation(n_buffered)
+                x, y = x[order], y[order]
+            # samples not filling a batch are kept for the next batch
+            n_batched = (
+                n_buffered if last
+                else n_buffered - n_buffered % self.batch_size
+            )
+            for batch_start in range(0, n_batched, self.batch_size):
+                batch_stop = min(batch_start + self.batch_size, n_batched)
+                yield x[batch_start:batch_stop], y[batch_start:batch_stop]
+            buffered = [(x[n_batched:], y[n_batched:])]
+            n_buffered -= n_batched
+
+    def get_dataset(self) -> tf.data.Dataset:
+        """Get dataset of the batches, of known cardinality."""
+        return tf.data.Dataset.from_generator(
+            self,
+            output_signature=(
+                tf.TensorSpec(
+                    shape=(None, len(self.input_params)), dtype=tf.float32
+                ),
+                tf.TensorSpec(
+                    shape=(None, len(self.output_params)), dtype=tf.float32
+                ),
+            ),
+        ).apply(tf.data.experimental.assert_cardinality(len(self)))
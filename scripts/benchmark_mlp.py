@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+from sys import argv
+from time import perf_counter
+from typing import Any
+import argparse
+
+import numpy as np  # type: ignore
+import xarray as xr  # type: ignore
+
+from pps_mw_training.models.trainers.mlp_trainer import MlpTrainer
+from pps_mw_training.models.trainers.resident_engine import ResidentEngine
+from pps_mw_training.pipelines.iwp_ici import settings
+
+
+N_SAMPLES = 2 ** 20
+N_EPOCHS = 3
+
+
+def get_database(
+    n_samples: int,
+) -> xr.Dataset:
+    """Get a synthetic database of values within the parameter ranges."""
+    rng = np.random.default_rng(0)
+    return xr.Dataset(
+        {
+            str(p["name"]): (
+                "number_structures_db",
+                rng.uniform(
+                    float(p["min"]), float(p["max"]), n_samples
+                ).astype(np.float32),
+            )
+            for p in settings.INPUT_PARAMS + settings.OUTPUT_PARAMS
+        }
+    )
+
+
+def compile_model() -> Any:
+    """Get a compiled model of the IWP ICI settings."""
+    return MlpTrainer.compile_model(
+        settings.INPUT_PARAMS,
+        settings.OUTPUT_PARAMS,
+        settings.N_HIDDEN_LAYERS,
+        settings.N_NEURONS_PER_HIDDEN_LAYER,
+        settings.ACTIVATION,
+        settings.QUANTILES,
+        settings.INITIAL_LEARNING_RATE,
+        settings.FIRST_DECAY_STEPS,
+        settings.T_MUL,
+        settings.M_MUL,
+        settings.ALPHA,
+    )
+
+
+def get_noise() -> dict[str, float]:
+    """Get noise of the brightness temperatures."""
+    return {
+        str(p["name"]): settings.NOISE
+        for p in settings.INPUT_PARAMS
+        if str(p["name"]).startswith("DTB")
+    }
+
+
+def benchmark_fit(
+    data: xr.Dataset,
+    batch_size: int,
+    n_epochs: int,
+) -> float:
+    """Get samples per second of training by model.fit."""
+    model = compile_model()
+    dataset = MlpTrainer.prepare_data(
+        settings.INPUT_PARAMS,
+        settings.OUTPUT_PARAMS,
+        data,
+        batch_size,
+        settings.MISSING_FRACTION,
+        settings.FILL_VALUE,
+        shuffle_buffer=settings.SHUFFLE_BUFFER,
+        noise=get_noise(),
+    )
+    # the first epoch traces the training step
+    model.fit(dataset, epochs=1, verbose=0)
+    t0 = perf_counter()
+    model.fit(dataset, epochs=n_epochs, verbose=0)
+    return n_epochs * data.sizes["number_structures_db"] / (
+        perf_counter() - t0
+    )
+
+
+def benchmark_resident(
+    data: xr.Dataset,
+    batch_size: int,
+    n_epochs: int,
+    steps_per_call: int,
+) -> float:
+    """Get samples per second of training by the resident engine."""
+    x, y = MlpTrainer.get_resident_data(
+        settings.INPUT_PARAMS, settings.OUTPUT_PARAMS, data
+    )
+    engine = ResidentEngine(
+        compile_model(),
+        x,
+        y,
+        batch_size,
+        steps_per_call,
+        MlpTrainer.get_noise_sigma(settings.INPUT_PARAMS, get_noise()),
+        settings.MISSING_FRACTION,
+        settings.FILL_VALUE,
+    )
+    # the first epoch traces the training steps
+    engine.train_epoch()
+    t0 = perf_counter()
+    for _ in range(n_epochs):
+        engine.train_epoch()
+    return n_epochs * engine.n_steps * batch_size / (perf_counter() - t0)
+
+
+def benchmark(
+    n_samples: int,
+    batch_size: int,
+    n_epochs: int,
+    steps_per_call: int,
+) -> None:
+    """Benchmark training by model.fit and by the resident engine."""
+    data = get_database(n_samples)
+    fit = benchmark_fit(data, batch_size, n_epochs)
+    resident = benchmark_resident(data, batch_size, n_epochs, steps_per_call)
+    print(
+        f"{n_samples} samples, batch size {batch_size}, "
+        f"{steps_per_call} steps per call:\n"
+        f"  model.fit:       {fit:12.0f} samples/s\n"
+        f"  resident engine: {resident:12.0f} samples/s\n"
+        f"  speedup:         {resident / fit:12.1f}x"
+    )
+
+
+def cli(args_list: list[str]) -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Benchmark training of the IWP ICI model by model.fit and by "
+            "the resident engine, on a synthetic database."
+        )
+    )
+    parser.add_argument(
+        "-b",
+        "--batchsize",
+        dest="batch_size",
+        type=int,
+        help=f"Training batch size, default is {settings.BATCH_SIZE}",
+        default=settings.BATCH_SIZE,
+    )
+    parser.add_argument(
+        "-e",
+        "--epochs",
+        dest="n_epochs",
+        type=int,
+        help=f"Number of timed epochs, default is {N_EPOCHS}",
+        default=N_EPOCHS,
+    )
+    parser.add_argument(
+        "-n",
+        "--samples",
+        dest="n_samples",
+        type=int,
+        help=f"Number of samples, default is {N_SAMPLES}",
+        default=N_SAMPLES,
+    )
+    parser.add_argument(
+        "-s",
+        "--steps-per-call",
+        dest="steps_per_call",
+        type=int,
+        help=(
+            "Number of training steps per call of the resident engine, "
+            f"default is {settings.STEPS_PER_CALL}"
+        ),
+        default=settings.STEPS_PER_CALL,
+    )
+    args = parser.parse_args(args_list)
+    benchmark(
+        args.n_samples, args.batch_size, args.n_epochs, args.steps_per_call
+    )
+
+
+if __name__ == "__main__":
+    cli(argv[1:])
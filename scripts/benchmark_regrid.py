@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+from datetime import datetime
+from sys import argv
+from time import perf_counter
+from typing import Callable
+import argparse
+
+from pyproj import CRS, Transformer  # type: ignore
+import numpy as np  # type: ignore
+import xarray as xr  # type: ignore
+
+from pps_mw_training.pipelines.pr_nordic.data.regridder import (
+    Regridder,
+    WGS84,
+)
+
+
+# projection of the Baltrad pn150 composite
+PROJDEF = (
+    "+proj=stere +ellps=bessel +lat_0=90 +lon_0=14 +lat_ts=60 "
+    "+datum=WGS84"
+)
+N_SCANLINES = 135  # per ATMS granule
+N_FOVS = 96
+SCAN_TIME = 8 / 3  # [s]
+N_GRANULES = 16
+REPEAT = 5
+
+
+def get_grid(
+    step: int,
+    x_size: int = 760,
+    y_size: int = 1200,
+    scale: float = 2000.,
+) -> xr.Dataset:
+    """Get a synthetic grid similar to the Baltrad grid."""
+    crs = CRS(PROJDEF)
+    left, lower = Transformer.from_crs(WGS84, crs).transform(52., 2.)
+    x = np.linspace(left, left + scale * (x_size - 1), x_size)[0::step]
+    y = np.linspace(lower + scale * (y_size - 1), lower, y_size)[0::step]
+    xs, ys = np.meshgrid(x, y)
+    return xr.Dataset(
+        data_vars={"xs": (("y", "x"), xs), "ys": (("y", "x"), ys)},
+        coords={"x": ("x", x), "y": ("y", y)},
+        attrs={"crs": crs},
+    )
+
+
+def get_swath(
+    n_granules: int,
+) -> xr.Dataset:
+    """Get a synthetic ATMS sized swath passing over the grid."""
+    n_scanlines = n_granules * N_SCANLINES
+    scanlines = np.arange(n_scanlines)
+    fovs = np.arange(N_FOVS) - N_FOVS / 2
+    # a polar orbit scans about 0.15 degree in latitude per scanline
+    lat = np.clip(
+        60 + 0.15 * (scanlines[:, np.newaxis] - n_scanlines / 2), -89, 89
+    ) + np.zeros((1, N_FOVS))
+    lon = 14 + 0.5 * fovs[np.newaxis] / np.cos(np.deg2rad(lat))
+    time = np.datetime64("2021-01-01T00:00:00", "ns") + (
+        1e9 * SCAN_TIME * scanlines
+    ).astype("timedelta64[ns]")
+    return xr.Dataset(
+        coords={
+            "time": ("y", time),
+            "lat": (("y", "x"), lat),
+            "lon": (("y", "x"), lon),
+        },
+    )
+
+
+def legacy_filter(
+    regridder: Regridder,
+) -> tuple[np.ndarray, datetime]:
+    """Filter stage as implemented with Python loops."""
+    data = regridder.dataset
+    transformer = Transformer.from_crs(WGS84, regridder.grid.attrs["crs"])
+    x, y = transformer.transform(data.lat, data.lon)
+    filt_geo = regridder._within_grid_limits(x, y)
+    timestamps = np.array([t.astype(datetime) for t in data.time])
+    timestamps[timestamps == None] = 0.  # noqa: E711
+    idxs = np.array([
+        idx for idx in np.arange(data.time.values.size)
+        if np.any(filt_geo[idx])
+    ])
+    timestamp = np.median(timestamps[idxs])
+    filt_time = regridder._within_time_limits(timestamps, timestamp)
+    for idx in np.arange(filt_time.size):
+        if not filt_time[idx]:
+            filt_geo[idx] = False
+    return filt_geo, datetime.utcfromtimestamp(timestamp / 1e9)
+
+
+def vectorized_filter(
+    regridder: Regridder,
+) -> tuple[np.ndarray, datetime]:
+    """Filter stage as implemented in the regridder."""
+    x, y = regridder.transform(regridder.dataset)
+    return regridder._get_filt(x, y, regridder.dataset)
+
+
+def get_timing(
+    func: Callable[[Regridder], tuple[np.ndarray, datetime]],
+    regridder: Regridder,
+    repeat: int,
+) -> float:
+    """Get best timing of repeated calls."""
+    timings = []
+    for _ in range(repeat):
+        t0 = perf_counter()
+        func(regridder)
+        timings.append(perf_counter() - t0)
+    return min(timings)
+
+
+def benchmark(
+    n_granules: int,
+    grid_step: int,
+    repeat: int,
+) -> None:
+    """Benchmark the geo and time filter stage of the regridder."""
+    regridder = Regridder(get_swath(n_granules), get_grid(grid_step))
+    filt_legacy, time_legacy = legacy_filter(regridder)
+    filt, time = vectorized_filter(regridder)
+    assert np.array_equal(filt, filt_legacy) and time == time_legacy
+    legacy = get_timing(legacy_filter, regridder, repeat)
+    vectorized = get_timing(vectorized_filter, regridder, repeat)
+    print(
+        f"{n_granules} granules, {n_granules * N_SCANLINES * N_FOVS} "
+        f"swath points, {np.count_nonzero(filt)} within grid:\n"
+        f"  legacy filter:     {1e3 * legacy:8.1f} ms\n"
+        f"  vectorized filter: {1e3 * vectorized:8.1f} ms\n"
+        f"  speedup:           {legacy / vectorized:8.1f}x"
+    )
+
+
+def cli(args_list: list[str]) -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Benchmark the geolocation and time filter stage of the "
+            "regridder on synthetic ATMS sized swaths."
+        )
+    )
+    parser.add_argument(
+        "-g",
+        "--granules",
+        dest="n_granules",
+        type=int,
+        help=f"Number of granules per chunk, default is {N_GRANULES}",
+        default=N_GRANULES,
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        dest="repeat",
+        type=int,
+        help=f"Number of repetitions, default is {REPEAT}",
+        default=REPEAT,
+    )
+    parser.add_argument(
+        "-s",
+        "--grid-step",
+        dest="grid_step",
+        type=int,
+        help="Grid step, default is 4",
+        default=4,
+    )
+    args = parser.parse_args(args_list)
+    benchmark(args.n_granules, args.grid_step, args.repeat)
+
+
+if __name__ == "__main__":
+    cli(argv[1:])
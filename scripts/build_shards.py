@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+from pathlib import Path
+from sys import argv
+import argparse
+
+from pps_mw_training.pipelines.pr_nordic import settings
+from pps_mw_training.pipelines.pr_nordic import shards
+
+
+def cli(args_list: list[str]) -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Build shards of scaled pr_nordic training data, matched "
+            "files not already in a shard are appended as new shards."
+        )
+    )
+    parser.add_argument(
+        "-i",
+        "--training-data-path",
+        dest="training_data_path",
+        type=str,
+        help=(
+            "Path to training data, "
+            f"default is {settings.TRAINING_DATA_PATH.as_posix()}"
+        ),
+        default=settings.TRAINING_DATA_PATH.as_posix(),
+    )
+    parser.add_argument(
+        "-n",
+        "--shard-size",
+        dest="shard_size",
+        type=int,
+        help=(
+            "Number of matched files per shard, "
+            f"default is {settings.SHARD_SIZE}"
+        ),
+        default=settings.SHARD_SIZE,
+    )
+    parser.add_argument(
+        "-o",
+        "--shard-path",
+        dest="shard_path",
+        type=str,
+        help=(
+            "Path to write shards and manifest to, "
+            f"default is {settings.SHARD_PATH.as_posix()}"
+        ),
+        default=settings.SHARD_PATH.as_posix(),
+    )
+    parser.add_argument(
+        "-t",
+        "--train-fraction",
+        dest="train_fraction",
+        type=float,
+        help=(
+            "Fraction of new files to use as training data, "
+            f"default is {settings.TRAIN_FRACTION}"
+        ),
+        default=settings.TRAIN_FRACTION,
+    )
+    parser.add_argument(
+        "-u",
+        "--test-fraction",
+        dest="test_fraction",
+        type=float,
+        help=(
+            "Fraction of new files to use as test data, "
+            f"default is {settings.TEST_FRACTION}"
+        ),
+        default=settings.TEST_FRACTION,
+    )
+    parser.add_argument(
+        "-v",
+        "--validation-fraction",
+        dest="validation_fraction",
+        type=float,
+        help=(
+            "Fraction of new files to use as validation data, "
+            f"default is {settings.VALIDATION_FRACTION}"
+        ),
+        default=settings.VALIDATION_FRACTION,
+    )
+    args = parser.parse_args(args_list)
+    shards.build_shards(
+        Path(args.training_data_path),
+        Path(args.shard_path),
+        args.train_fraction,
+        args.validation_fraction,
+        args.test_fraction,
+        args.shard_size,
+        settings.BATCH_SIZE,
+        settings.MIN_QUALITY,
+        settings.MAX_DISTANCE,
+        settings.INPUT_PARAMS,
+        settings.FILL_VALUE_IMAGES,
+        settings.FILL_VALUE_LABELS,
+        settings.MATCH_TOLERANCE,
+    )
+
+
+if __name__ == "__main__":
+    cli(argv[1:])
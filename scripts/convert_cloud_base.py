@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+from pathlib import Path
+from sys import argv
+import argparse
+
+from pps_mw_training.pipelines.cloud_base import store
+from pps_mw_training.pipelines.cloud_base.input_params import (
+    ALL_INPUT_PARAMS,
+    ALL_LABEL_PARAMS,
+)
+from pps_mw_training.pipelines.cloud_base.settings import TRAINING_DATA_PATH
+
+
+def cli(args_list: list[str]) -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Convert cloud base cnn data files to a columnar store, "
+            "holding one dataset per variable chunked by scene. "
+            "Files already in the store are skipped."
+        )
+    )
+    parser.add_argument(
+        "-i",
+        "--input-path",
+        dest="input_path",
+        type=str,
+        help=(
+            "Path to cnn_data*.nc files, "
+            f"default is {TRAINING_DATA_PATH.as_posix()}"
+        ),
+        default=TRAINING_DATA_PATH.as_posix(),
+    )
+    parser.add_argument(
+        "-o",
+        "--outpath",
+        dest="outpath",
+        type=str,
+        help=(
+            f"Path to write {store.STORE_FILE} to, "
+            f"default is {TRAINING_DATA_PATH.as_posix()}"
+        ),
+        default=TRAINING_DATA_PATH.as_posix(),
+    )
+    args = parser.parse_args(args_list)
+    store.convert(
+        sorted(Path(args.input_path).glob("cnn_data*.nc")),
+        Path(args.outpath) / store.STORE_FILE,
+        [str(p["name"]) for p in ALL_INPUT_PARAMS + ALL_LABEL_PARAMS],
+    )
+
+
+if __name__ == "__main__":
+    cli(argv[1:])
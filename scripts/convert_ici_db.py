@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+from pathlib import Path
+from sys import argv
+import argparse
+
+from pps_mw_training.pipelines.iwp_ici import store
+from pps_mw_training.pipelines.iwp_ici import training_data
+from pps_mw_training.pipelines.iwp_ici.settings import ICI_RETRIEVAL_DB_FILE
+
+
+def cli(args_list: list[str]) -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Convert the ICI retrieval database to a column store of "
+            "memory-mapped float32 arrays, with surface types adjusted. "
+            f"The store is written next to the database, as *"
+            f"{store.STORE_SUFFIX}, and used by the training if up to date."
+        )
+    )
+    parser.add_argument(
+        "-d",
+        "--db-file",
+        dest="db_file",
+        type=str,
+        help=(
+            "Path to ICI retrieval database file, "
+            f"default is {ICI_RETRIEVAL_DB_FILE.as_posix()}"
+        ),
+        default=ICI_RETRIEVAL_DB_FILE.as_posix(),
+    )
+    args = parser.parse_args(args_list)
+    training_data.convert_retrieval_database(Path(args.db_file))
+
+
+if __name__ == "__main__":
+    cli(argv[1:])
@@ -5,6 +5,10 @@ from sys import argv
 import argparse
 
 from pps_mw_training.pipelines.pr_nordic.data import baltrad
+from pps_mw_training.pipelines.pr_nordic.settings import (
+    MAX_DISTANCE,
+    MIN_QUALITY,
+)
 
 
 T0 = "2020-01-01T00:00:00"
@@ -23,6 +27,17 @@ def cli(args_list: list[str]) -> None:
         help="Base path to Baltrad dataset.",
         default="/tmp",
     )
+    parser.add_argument(
+        "-d",
+        "--distance-max",
+        dest="distance_max",
+        type=float,
+        help=(
+            "Max distance [m] from radar for compact label encoding, "
+            f"default is {MAX_DISTANCE}"
+        ),
+        default=MAX_DISTANCE,
+    )
     parser.add_argument(
         "-e",
         "--end",
@@ -31,6 +46,18 @@ def cli(args_list: list[str]) -> None:
         help=f"End date, default is {T1}",
         default=T1,
     )
+    parser.add_argument(
+        "-l",
+        "--label-encoding",
+        dest="label_encoding",
+        type=str,
+        choices=list(baltrad.LABEL_ENCODINGS),
+        help=(
+            "Write only quality filtered dBZ in this compact encoding, "
+            "by default dBZ, quality index and distance are written"
+        ),
+        default=None,
+    )
     parser.add_argument(
         "-o",
         "--outpath",
@@ -39,6 +66,17 @@ def cli(args_list: list[str]) -> None:
         help="Path where to write data from processed files.",
         default="/tmp",
     )
+    parser.add_argument(
+        "-q",
+        "--qi-min",
+        dest="qi_min",
+        type=float,
+        help=(
+            "Min radar quality index for compact label encoding, "
+            f"default is {MIN_QUALITY}"
+        ),
+        default=MIN_QUALITY,
+    )
     parser.add_argument(
         "-s",
         "--start",
@@ -47,12 +85,29 @@ def cli(args_list: list[str]) -> None:
         help=f"Start date, default is {T0}",
         default=T0,
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        dest="workers",
+        type=int,
+        help="Number of worker processes, default is 1",
+        default=1,
+    )
     args = parser.parse_args(args_list)
     t0 = datetime.fromisoformat(args.start)
     t1 = datetime.fromisoformat(args.end)
     basepath = Path(args.basepath)
     outpath = Path(args.outpath)
-    baltrad.reformat(t0, t1, basepath, outpath)
+    baltrad.reformat(
+        t0,
+        t1,
+        basepath,
+        outpath,
+        args.workers,
+        args.label_encoding,
+        args.qi_min,
+        args.distance_max,
+    )
 
 
 if __name__ == "__main__":
@@ -1,17 +1,30 @@
 #!/usr/bin/env python
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
 from pathlib import Path
 from sys import argv
-from typing import Sequence
+from typing import Any, Optional, Sequence, Union
 import argparse
 import logging
+import multiprocessing
 
+import xarray as xr  # type: ignore
 
-from pps_mw_training.pipelines.pr_nordic.data import utils
+from pps_mw_training.pipelines.pr_nordic.data import planner, utils
 from pps_mw_training.pipelines.pr_nordic.data.atms import AtmsL1bReader
 from pps_mw_training.pipelines.pr_nordic.data.baltrad import BaltradReader
-from pps_mw_training.pipelines.pr_nordic.data.regridder import Regridder
-from pps_mw_training.pipelines.pr_nordic.settings import INPUT_PARAMS
+from pps_mw_training.pipelines.pr_nordic.data.regridder import (
+    GridTree,
+    KDTREE_METHODS,
+    NoDataWithinGridError,
+    RADIUS_OF_INFLUENCE,
+    Regridder,
+)
+from pps_mw_training.pipelines.pr_nordic.settings import (
+    GRID_CACHE_PATH,
+    INPUT_PARAMS,
+)
 
 
 CHUNKSIZE = 16
@@ -21,6 +34,89 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+class ChunkStatus(Enum):
+    """Processing status of a chunk of level1b files."""
+
+    WRITTEN = "written"
+    SKIPPED = "skipped"
+    FAILED = "failed"
+
+
+# state shared by all chunks processed by a worker, set once per worker
+WORKER_STATE: dict[str, Any] = {}
+
+
+def init_worker(
+    grid: xr.Dataset,
+    grid_tree: Optional[GridTree],
+    method: str,
+    radius: float,
+    channels: Sequence[Enum],
+    outpath: Path,
+    store_file: Optional[Path],
+) -> None:
+    """Initialize worker state."""
+    WORKER_STATE.update(
+        grid=grid,
+        grid_tree=grid_tree,
+        method=method,
+        radius=radius,
+        channels=channels,
+        outpath=outpath,
+        store_file=store_file,
+    )
+
+
+def regrid_chunk(
+    files: list[Path],
+) -> tuple[ChunkStatus, Union[Path, xr.Dataset, None]]:
+    """Regrid a chunk of files, a failure only affects this chunk."""
+    logging.info(f"Start processing {files[0]}.")
+    try:
+        data = AtmsL1bReader.get_data(
+            files, WORKER_STATE["channels"], variables=()
+        )
+        regridded = Regridder(
+            data,
+            WORKER_STATE["grid"],
+            WORKER_STATE["grid_tree"],
+            WORKER_STATE["radius"],
+        ).regrid(WORKER_STATE["channels"], method=WORKER_STATE["method"])
+        if regridded is None:
+            logging.warning("No outfile was written.")
+            return ChunkStatus.SKIPPED, None
+        if WORKER_STATE["store_file"] is not None:
+            # scenes are appended to the store by the main process
+            logging.info(f"Done processing  {files[0]}.")
+            return ChunkStatus.WRITTEN, regridded
+        outfile = utils.Writer(regridded, WORKER_STATE["outpath"]).write()
+    except NoDataWithinGridError:
+        logging.warning(f"No data within grid for {files[0]}.")
+        return ChunkStatus.SKIPPED, None
+    except Exception:
+        logging.exception(f"Failed processing {files[0]}.")
+        return ChunkStatus.FAILED, None
+    logging.info(f"Wrote {outfile} to disc.")
+    logging.info(f"Done processing  {files[0]}.")
+    return ChunkStatus.WRITTEN, outfile
+
+
+def collect(
+    result: tuple[ChunkStatus, Union[Path, xr.Dataset, None]],
+    store_file: Optional[Path],
+) -> ChunkStatus:
+    """Collect result of a chunk, append scene to store if given."""
+    status, output = result
+    if store_file is not None and isinstance(output, xr.Dataset):
+        try:
+            utils.StoreWriter(output, store_file).write()
+        except Exception:
+            logging.exception(f"Failed writing scene to {store_file}.")
+            return ChunkStatus.FAILED
+        logging.info(f"Wrote scene to {store_file}.")
+    return status
+
+
 def regrid_files(
     level1b_files: list[Path],
     baltrad_file: Path,
@@ -29,20 +125,49 @@ def regrid_files(
     chunk_size,
     channels: Sequence[Enum],
     outpath: Path,
-) -> None:
-    """Regrid files."""
-    baltrad_reader = BaltradReader(baltrad_file)
-    grid = baltrad_reader.get_grid(grid_step)
-    for files in utils.reshape_filelist(level1b_files, chunk_size):
-        logging.info(f"Start processing {files[0]}.")
-        data = AtmsL1bReader.get_data(files)
-        data = Regridder(data, grid).regrid(channels, method=method)
-        if data is not None:
-            outfile = utils.Writer(data, outpath).write()
-            logging.info(f"Wrote {outfile} to disc.")
-        else:
-            logging.warning("No outfile was written.")
-        logging.info(f"Done processing  {files[0]}.")
+    radius: float = RADIUS_OF_INFLUENCE,
+    cache_path: Path = GRID_CACHE_PATH,
+    workers: int = 1,
+    plan: bool = False,
+    store_file: Optional[Path] = None,
+) -> Counter[ChunkStatus]:
+    """Regrid files, chunks are distributed over a pool of workers."""
+    with BaltradReader(baltrad_file) as baltrad_reader:
+        grid = baltrad_reader.get_grid(grid_step, cache_path)
+    grid_tree = (
+        GridTree.load(grid, cache_path) if method in KDTREE_METHODS
+        else None
+    )
+    chunks = (
+        planner.plan(level1b_files, grid, cache_path) if plan
+        else utils.reshape_filelist(level1b_files, chunk_size)
+    )
+    initargs = (
+        grid, grid_tree, method, radius, channels, outpath, store_file,
+    )
+    summary: Counter[ChunkStatus] = Counter()
+    if workers > 1:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=initargs,
+        ) as executor:
+            for result in executor.map(regrid_chunk, chunks):
+                summary[collect(result, store_file)] += 1
+    else:
+        init_worker(*initargs)
+        for files in chunks:
+            summary[collect(regrid_chunk(files), store_file)] += 1
+    logging.info(
+        "Processed {} chunks: {}.".format(
+            len(chunks),
+            ", ".join(
+                f"{summary[status]} {status.value}" for status in ChunkStatus
+            ),
+        )
+    )
+    return summary
 
 
 def cli(args_list: list[str]) -> None:
@@ -65,11 +190,22 @@ def cli(args_list: list[str]) -> None:
         "--method",
         dest="method",
         type=str,
-        choices=["linear", "nearest"],
+        choices=["linear", "nearest"] + KDTREE_METHODS,
         help="Interpolation method",
         default="linear",
 
     )
+    parser.add_argument(
+        "-c",
+        "--cache-path",
+        dest="cache_path",
+        type=str,
+        help=(
+            "Path where to persist the grid, grid k-d tree, and granule "
+            f"index, default is {GRID_CACHE_PATH.as_posix()}"
+        ),
+        default=GRID_CACHE_PATH.as_posix(),
+    )
     parser.add_argument(
         "-o",
         "--outpath",
@@ -78,6 +214,38 @@ def cli(args_list: list[str]) -> None:
         help="Path where to write data from processed files.",
         default="/tmp",
     )
+    parser.add_argument(
+        "--store",
+        dest="store_file",
+        type=str,
+        help=(
+            "Path to a HDF5 store to append regridded scenes to, "
+            "instead of writing one NetCDF file per scene to the outpath"
+        ),
+        default=None,
+    )
+    parser.add_argument(
+        "-p",
+        "--plan",
+        dest="plan",
+        action="store_true",
+        help=(
+            "Flag for planning chunks from an index of granule time "
+            "coverage and footprint, only granules intersecting the grid "
+            "are regridded, grouped by the radar slot they overlap"
+        ),
+    )
+    parser.add_argument(
+        "-r",
+        "--radius",
+        dest="radius",
+        type=float,
+        help=(
+            "Radius of influence [m] for the kdtree methods, "
+            f"default is {RADIUS_OF_INFLUENCE}"
+        ),
+        default=RADIUS_OF_INFLUENCE,
+    )
     parser.add_argument(
         "-s",
         "--grid-step",
@@ -86,6 +254,14 @@ def cli(args_list: list[str]) -> None:
         help="Grid step for regridding, e.g. 4 means every forth position",
         default=4,
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        dest="workers",
+        type=int,
+        help="Number of worker processes, default is 1",
+        default=1,
+    )
     args = parser.parse_args(args_list)
     regrid_files(
         level1b_files=[Path(f) for f in args.level1b_files],
@@ -95,6 +271,13 @@ def cli(args_list: list[str]) -> None:
         chunk_size=CHUNKSIZE,
         channels=utils.get_channels(INPUT_PARAMS),
         outpath=Path(args.outpath),
+        radius=args.radius,
+        cache_path=Path(args.cache_path),
+        workers=args.workers,
+        plan=args.plan,
+        store_file=(
+            None if args.store_file is None else Path(args.store_file)
+        ),
     )
 
 
@@ -4,10 +4,12 @@ from pathlib import Path
 from sys import argv
 from typing import Optional
 
+from pps_mw_training.models.trainers.utils import TrainingEngine
 from pps_mw_training.pipelines.pipeline_type import PipelineType
 from pps_mw_training.pipelines.pr_nordic import settings as pn_settings
 from pps_mw_training.pipelines.iwp_ici import settings as ii_settings
 from pps_mw_training.pipelines.cloud_base import settings as cb_settings
+from pps_mw_training.utils import data_service
 
 
 def add_parser(
@@ -27,6 +29,11 @@ def add_parser(
     activation: Optional[str] = None,
     db_file: Optional[Path] = None,
     training_data_path: Optional[Path] = None,
+    add_shard_path: bool = False,
+    add_data_service: bool = False,
+    chunk_size: Optional[int] = None,
+    shuffle_buffer: Optional[int] = None,
+    engine: Optional[str] = None,
 ):
     """Add parser and set default values."""
     parser = subparsers.add_parser(
@@ -60,11 +67,13 @@ def add_parser(
             "--db-file",
             dest="db_file",
             type=str,
+            nargs="+",
             help=(
                 "Path to ICI retrieval database file to use as training data, "
+                "or to several files if streamed, "
                 f"default is {db_file.as_posix()}"
             ),
-            default=db_file.as_posix(),
+            default=[db_file.as_posix()],
         )
 
     parser.add_argument(
@@ -171,6 +180,75 @@ def add_parser(
         ),
         default=model_config_path.as_posix(),
     )
+    if add_shard_path:
+        parser.add_argument(
+            "--shard-path",
+            dest="shard_path",
+            type=str,
+            help=(
+                "Path to prebuilt shards of training data, "
+                "if given shards are used instead of the training data path"
+            ),
+            default=None,
+        )
+    if add_data_service:
+        parser.add_argument(
+            "--dispatcher",
+            dest="dispatcher",
+            type=str,
+            help=(
+                "Address of a tf.data service dispatcher, e.g. "
+                "grpc://host:port, whose workers preprocess the training "
+                "data, requires prebuilt shards"
+            ),
+            default=None,
+        )
+        parser.add_argument(
+            "--local-workers",
+            dest="local_workers",
+            type=int,
+            help=(
+                "Number of tf.data service worker processes to start on "
+                "this host, together with a dispatcher, default is 0"
+            ),
+            default=0,
+        )
+    if chunk_size is not None:
+        parser.add_argument(
+            "--chunk-size",
+            dest="chunk_size",
+            type=int,
+            help=(
+                "Stream the training data in chunks of this many samples, "
+                "instead of holding it in memory, if above 0, "
+                f"default is {chunk_size}"
+            ),
+            default=chunk_size,
+        )
+    if shuffle_buffer is not None:
+        parser.add_argument(
+            "--shuffle-buffer",
+            dest="shuffle_buffer",
+            type=int,
+            help=(
+                "Number of samples to shuffle the training data by, "
+                f"default is {shuffle_buffer}"
+            ),
+            default=shuffle_buffer,
+        )
+    if engine is not None:
+        parser.add_argument(
+            "--engine",
+            dest="engine",
+            type=str,
+            choices=[e.value for e in TrainingEngine],
+            help=(
+                "Training engine, resident keeps the training data as "
+                "tensors and runs several steps per compiled call, "
+                f"default is {engine}"
+            ),
+            default=engine,
+        )
     if add_file_limit is not None:
         parser.add_argument(
             "-c",
@@ -188,6 +266,23 @@ def cli(args_list: list[str] = argv[1:]) -> None:
     parser = argparse.ArgumentParser(
         description="""Run the pps-mw-training app."""
     )
+    parser.add_argument(
+        "--start-dispatcher",
+        dest="dispatcher_port",
+        type=int,
+        help="Start a tf.data service dispatcher at this port and serve",
+        default=None,
+    )
+    parser.add_argument(
+        "--start-worker",
+        dest="worker_dispatcher",
+        type=str,
+        help=(
+            "Start a tf.data service worker of the dispatcher at this "
+            "address, e.g. grpc://host:port, and serve"
+        ),
+        default=None,
+    )
     subparsers = parser.add_subparsers(dest="pipeline_type")
     add_parser(
         subparsers,
@@ -207,6 +302,8 @@ def cli(args_list: list[str] = argv[1:]) -> None:
         pn_settings.TEST_FRACTION,
         pn_settings.MODEL_CONFIG_PATH,
         training_data_path=pn_settings.TRAINING_DATA_PATH,
+        add_shard_path=True,
+        add_data_service=True,
     )
     add_parser(
         subparsers,
@@ -247,24 +344,42 @@ def cli(args_list: list[str] = argv[1:]) -> None:
         activation=ii_settings.ACTIVATION,
         missing_fraction=ii_settings.MISSING_FRACTION,
         db_file=ii_settings.ICI_RETRIEVAL_DB_FILE,
+        chunk_size=ii_settings.CHUNK_SIZE,
+        shuffle_buffer=ii_settings.SHUFFLE_BUFFER,
+        engine=ii_settings.TRAINING_ENGINE,
     )
     args = parser.parse_args(args_list)
+    if args.dispatcher_port is not None:
+        data_service.serve_dispatcher(args.dispatcher_port)
+        return
+    if args.worker_dispatcher is not None:
+        data_service.serve_worker(args.worker_dispatcher)
+        return
     pipeline_type = PipelineType(args.pipeline_type)
     if pipeline_type is PipelineType.PR_NORDIC:
         from pps_mw_training.pipelines.pr_nordic import training as pnt
 
-        pnt.train(
-            args.n_hidden_layers,
-            args.n_neurons_per_hidden_layer,
-            Path(args.training_data_path),
-            args.train_fraction,
-            args.validation_fraction,
-            args.test_fraction,
-            args.batch_size,
-            args.n_epochs,
-            Path(args.model_config_path),
-            args.only_evaluate,
-        )
+        with data_service.get_dispatcher(
+            args.dispatcher, args.local_workers
+        ) as dispatcher:
+            pnt.train(
+                args.n_hidden_layers,
+                args.n_neurons_per_hidden_layer,
+                Path(args.training_data_path),
+                args.train_fraction,
+                args.validation_fraction,
+                args.test_fraction,
+                args.batch_size,
+                args.n_epochs,
+                Path(args.model_config_path),
+                args.only_evaluate,
+                (
+                    Path(args.shard_path)
+                    if args.shard_path is not None
+                    else None
+                ),
+                dispatcher,
+            )
     elif pipeline_type is PipelineType.CLOUD_BASE:
         from pps_mw_training.pipelines.cloud_base import training as clb
 
@@ -288,7 +403,7 @@ def cli(args_list: list[str] = argv[1:]) -> None:
             args.n_hidden_layers,
             args.n_neurons_per_hidden_layer,
             args.activation,
-            Path(args.db_file),
+            [Path(db_file) for db_file in args.db_file],
             args.train_fraction,
             args.validation_fraction,
             args.test_fraction,
@@ -297,6 +412,9 @@ def cli(args_list: list[str] = argv[1:]) -> None:
             args.missing_fraction,
             Path(args.model_config_path),
             args.only_evaluate,
+            args.chunk_size,
+            args.shuffle_buffer,
+            TrainingEngine(args.engine),
         )
 
 
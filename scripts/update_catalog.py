@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+from pathlib import Path
+from sys import argv
+from typing import Any
+import argparse
+
+from pps_mw_training.pipelines.pipeline_type import PipelineType
+from pps_mw_training.pipelines.pr_nordic import settings as pn_settings
+from pps_mw_training.pipelines.cloud_base import settings as cb_settings
+
+
+def add_parser(
+    subparsers: argparse._SubParsersAction,
+    pipeline_type: PipelineType,
+    settings: Any,
+) -> None:
+    """Add parser and set default values."""
+    description = (
+        f"Update catalog of {pipeline_type.value} training data, "
+        "new files are split by the given fractions."
+    )
+    parser = subparsers.add_parser(
+        pipeline_type.value,
+        description=description,
+        help=description,
+    )
+    parser.add_argument(
+        "-f",
+        "--valid-fraction",
+        dest="valid_fraction",
+        action="store_true",
+        help="Flag for computing the fraction of valid data of new files",
+    )
+    parser.add_argument(
+        "-i",
+        "--training-data-path",
+        dest="training_data_path",
+        type=str,
+        help=(
+            "Path to training data, "
+            f"default is {settings.TRAINING_DATA_PATH.as_posix()}"
+        ),
+        default=settings.TRAINING_DATA_PATH.as_posix(),
+    )
+    parser.add_argument(
+        "-t",
+        "--train-fraction",
+        dest="train_fraction",
+        type=float,
+        help=(
+            "Fraction of new files to use as training data, "
+            f"default is {settings.TRAIN_FRACTION}"
+        ),
+        default=settings.TRAIN_FRACTION,
+    )
+    parser.add_argument(
+        "-u",
+        "--test-fraction",
+        dest="test_fraction",
+        type=float,
+        help=(
+            "Fraction of new files to use as test data, "
+            f"default is {settings.TEST_FRACTION}"
+        ),
+        default=settings.TEST_FRACTION,
+    )
+    parser.add_argument(
+        "-v",
+        "--validation-fraction",
+        dest="validation_fraction",
+        type=float,
+        help=(
+            "Fraction of new files to use as validation data, "
+            f"default is {settings.VALIDATION_FRACTION}"
+        ),
+        default=settings.VALIDATION_FRACTION,
+    )
+
+
+def cli(args_list: list[str]) -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Update catalog of training data files, the catalog is used "
+            "by the training instead of listing and matching the files."
+        )
+    )
+    subparsers = parser.add_subparsers(dest="pipeline_type")
+    add_parser(subparsers, PipelineType.PR_NORDIC, pn_settings)
+    add_parser(subparsers, PipelineType.CLOUD_BASE, cb_settings)
+    args = parser.parse_args(args_list)
+    pipeline_type = PipelineType(args.pipeline_type)
+    if pipeline_type is PipelineType.PR_NORDIC:
+        from pps_mw_training.pipelines.pr_nordic import training_data as pnt
+
+        pnt.update_catalog(
+            Path(args.training_data_path),
+            args.train_fraction,
+            args.validation_fraction,
+            args.test_fraction,
+            pn_settings.MIN_QUALITY,
+            pn_settings.MAX_DISTANCE,
+            args.valid_fraction,
+        )
+    else:
+        from pps_mw_training.pipelines.cloud_base import training_data as cbt
+
+        cbt.update_catalog(
+            Path(args.training_data_path),
+            args.train_fraction,
+            args.validation_fraction,
+            args.test_fraction,
+            cb_settings.LABEL_PARAMS,
+            cb_settings.FILL_VALUE_LABELS,
+            args.valid_fraction,
+        )
+
+
+if __name__ == "__main__":
+    cli(argv[1:])